@@ -0,0 +1,144 @@
+"""
+Escritura comprimida por bloques en paralelo, dentro del proceso.
+
+El texto se corta en bloques de COMPRESS_BLOCK_BYTES que se comprimen cada
+uno por separado en un pool de hilos (zlib y zstd liberan el GIL) y se
+escriben en orden. Cada bloque es un miembro gzip / frame zstd completo:
+la concatenación es un .csv.gz / .csv.zst estándar que lee cualquier
+herramienta (gzip -d, zcat, zstd -d, pandas).
+"""
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+import io, os, threading, zlib
+from typing import Callable, Deque, Optional
+from .settings import settings
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# códec → (sufijo del archivo, nivel); nivel bajo: prima la velocidad, como `pigz -1`
+CODECS = {"gzip": (".gz", 1), "zstd": (".zst", 3)}
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def _compress_pool() -> Optional[ThreadPoolExecutor]:
+    """Pool compartido por todos los writers del proceso (None = comprimir en el mismo hilo)."""
+    global _pool
+    if not settings.ENABLE_PARALLEL_COMPRESSION or settings.WORKER_PROCESSES <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.WORKER_PROCESSES, thread_name_prefix="compress")
+        return _pool
+
+
+def _gzip_block(data: bytes, level: int) -> bytes:
+    # wbits=31: miembro gzip completo (header con mtime 0, salida reproducible)
+    c = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return c.compress(data) + c.flush()
+
+
+def _zstd_block(data: bytes, level: int) -> bytes:
+    # ZstdCompressor no se comparte entre hilos: uno por hilo
+    cctx = getattr(_local, "zstd", None)
+    if cctx is None:
+        cctx = _local.zstd = zstandard.ZstdCompressor(level=level)
+    return cctx.compress(data)
+
+
+def codec_suffix(codec: str) -> str:
+    if codec not in CODECS:
+        raise ValueError(f"Compresión no soportada: {codec} (gzip o zstd)")
+    return CODECS[codec][0]
+
+
+class BlockCompressedFile(io.BufferedIOBase):
+    """
+    Archivo binario de solo escritura que comprime por bloques en paralelo.
+    Como mucho 2 bloques por hilo quedan en vuelo (memoria acotada); los
+    errores de compresión o de disco se propagan en write() / sync() /
+    close(), no quedan en un log.
+    """
+
+    def __init__(self, path: Path, codec: str, append: bool = False):
+        codec_suffix(codec)
+        if codec == "zstd" and not ZSTD_AVAILABLE:
+            raise ValueError("Compresión zstd no disponible (falta el paquete zstandard)")
+        level = CODECS[codec][1]
+        block = _gzip_block if codec == "gzip" else _zstd_block
+        self._compress: Callable[[bytes], bytes] = lambda data: block(data, level)
+        self._block_bytes = max(64 * 1024, settings.COMPRESS_BLOCK_BYTES)
+        self._pool = _compress_pool()
+        self._max_inflight = 2 * settings.WORKER_PROCESSES if self._pool else 0
+        self._inflight: Deque[Future] = deque()
+        self._buf = bytearray()
+        self._fh = open(path, "ab" if append else "wb", buffering=settings.WRITE_BUFFER_SIZE)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write en un archivo cerrado")
+        self._buf += data
+        if len(self._buf) >= self._block_bytes:
+            view = memoryview(self._buf)
+            cut = len(self._buf) - len(self._buf) % self._block_bytes
+            for start in range(0, cut, self._block_bytes):
+                self._submit(bytes(view[start:start + self._block_bytes]))
+            view.release()
+            del self._buf[:cut]
+        return len(data)
+
+    def _submit(self, data: bytes):
+        if self._pool is None:
+            self._fh.write(self._compress(data))
+            return
+        self._inflight.append(self._pool.submit(self._compress, data))
+        # escribir en orden lo que ya terminó; esperar si hay demasiados en vuelo
+        while self._inflight and (self._inflight[0].done() or len(self._inflight) > self._max_inflight):
+            self._fh.write(self._inflight.popleft().result())
+
+    def flush(self):
+        # no corta bloques: TextIOWrapper y pyarrow llaman flush() a menudo
+        if not self.closed:
+            self._fh.flush()
+
+    def sync(self):
+        """Comprime el bloque parcial, escribe todo lo pendiente y lo deja en disco."""
+        if self._buf:
+            self._submit(bytes(self._buf))
+            self._buf.clear()
+        while self._inflight:
+            self._fh.write(self._inflight.popleft().result())
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def fileno(self) -> int:
+        return self._fh.fileno()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buf:
+                self._submit(bytes(self._buf))
+                self._buf.clear()
+            while self._inflight:
+                self._fh.write(self._inflight.popleft().result())
+        finally:
+            for f in self._inflight:
+                f.cancel()
+            self._inflight.clear()
+            try:
+                super().close()
+            finally:
+                self._fh.close()
@@ -0,0 +1,214 @@
+"""
+Conversión posterior de las partes de un run a XLSX o Parquet.
+
+Cuando CsvAggregator.close() termina, cada parte es un archivo
+independiente: convert_parts() convierte cualquier subconjunto en un pool
+de procesos, una parte por worker. Cada salida se escribe con un nombre
+temporal y se renombra al terminar (una conversión cortada no deja partes
+a medias), y register_artifacts() la agrega al manifest.json del run.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+import csv, fcntl, io, json, multiprocessing, os, sys
+
+from .csv_stream import PARQUET_AVAILABLE, parquet_options
+from .excel_stream import XLSX_MAX_ROWS, _XlsxSheetWriter
+from .models import Artifact
+from .settings import settings
+from .sources import _compression_of, _decompress
+
+if PARQUET_AVAILABLE:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+try:
+    csv.field_size_limit(10 * 1024 * 1024)
+except Exception:
+    csv.field_size_limit(min(sys.maxsize, 2_147_483_647))
+
+# formato de salida → extensión
+FORMATS = {"xlsx": ".xlsx", "parquet": ".parquet"}
+# partes que se pueden convertir (lo que escribe CsvAggregator)
+_SOURCE_SUFFIXES = (".csv.gz", ".csv.zst", ".csv", ".parquet")
+_BATCH_ROWS = 10_000
+_POLL_SECONDS = 1.0  # espera máxima por resultado antes de volver a llamar a poll()
+
+# (parte, salida o None, filas, error o None)
+PartResult = Tuple[str, Optional[str], int, Optional[str]]
+
+
+def part_stem(name: str) -> str:
+    """Nombre de la parte sin extensión: x.csv.gz, x.parquet y x.xlsx → x."""
+    low = name.lower()
+    for suffix in _SOURCE_SUFFIXES + (".xlsx",):
+        if low.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def convertible(name: str, fmt: str) -> bool:
+    low = name.lower()
+    return low.endswith(_SOURCE_SUFFIXES) and not low.endswith(FORMATS[fmt])
+
+
+def output_name(name: str, fmt: str) -> str:
+    return part_stem(name) + FORMATS[fmt]
+
+
+@contextmanager
+def _open_text(path: Path) -> Iterator[io.TextIOBase]:
+    compression = _compression_of(path.name)
+    if compression is None:
+        with path.open("r", encoding="utf-8", newline="") as f:
+            yield f
+        return
+    with _decompress(path, compression) as raw:
+        text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        try:
+            yield text
+        finally:
+            text.detach()  # el stream lo cierra _decompress (que revisa si llegó al final)
+
+
+def _read_part(path: Path) -> Iterator:
+    """Primero el header y después lotes de filas completas (todas del largo del header)."""
+    if path.name.lower().endswith(".parquet"):
+        pf = pq.ParquetFile(path)
+        yield pf.schema_arrow.names
+        for batch in pf.iter_batches(batch_size=_BATCH_ROWS):
+            columns = [c.to_pylist() for c in batch.columns]
+            yield [["" if v is None else v for v in row] for row in zip(*columns)]
+        return
+    with _open_text(path) as f:
+        rdr = csv.reader(f)
+        header = next(rdr, [])
+        yield header
+        n = len(header)
+        while True:
+            rows = list(islice(rdr, _BATCH_ROWS))
+            if not rows:
+                break
+            yield [r if len(r) == n else (r + [""] * n)[:n] for r in rows]
+
+
+def _write_parquet(path: Path, header: List[str], batches: Iterator) -> int:
+    schema = pa.schema([(c, pa.string()) for c in header])
+    group = max(1, settings.PARQUET_ROW_GROUP_ROWS)
+    pending: List[Sequence[str]] = []
+    count = 0
+
+    def write(rows):
+        columns = list(zip(*rows))
+        table = pa.Table.from_arrays([pa.array(c, type=pa.string()) for c in columns], schema=schema)
+        pw.write_table(table, row_group_size=group)
+
+    with pq.ParquetWriter(path, schema, **parquet_options(header)) as pw:
+        for rows in batches:
+            pending.extend(rows)
+            count += len(rows)
+            while len(pending) >= group:
+                write(pending[:group])
+                del pending[:group]
+        if pending:
+            write(pending)
+    return count
+
+
+def _write_xlsx(path: Path, header: List[str], batches: Iterator) -> int:
+    w = _XlsxSheetWriter(path, header)
+    try:
+        for rows in batches:
+            if w.count + len(rows) > XLSX_MAX_ROWS - 1:
+                raise ValueError(f"supera las {XLSX_MAX_ROWS - 1:,} filas de una hoja de Excel "
+                                 f"(generar partes más chicas con CSV_PART_MAX_ROWS)")
+            w.write_rows(rows)
+    finally:
+        w.close()
+    return w.count
+
+
+def convert_part(task: Tuple[str, str]) -> PartResult:
+    """Convierte una parte (corre en un worker del pool)."""
+    src, fmt = Path(task[0]), task[1]
+    dst = src.with_name(output_name(src.name, fmt))
+    tmp = src.with_name(f".{dst.name}.tmp")
+    batches = _read_part(src)
+    try:
+        header = next(batches)
+        if not header:
+            raise ValueError("parte vacía (sin header)")
+        rows = (_write_parquet if fmt == "parquet" else _write_xlsx)(tmp, header, batches)
+        os.replace(tmp, dst)
+        return src.name, dst.name, rows, None
+    except Exception as e:
+        tmp.unlink(missing_ok=True)
+        return src.name, None, 0, str(e)
+    finally:
+        batches.close()
+
+
+def convert_parts(
+    out_dir: Path,
+    parts: List[str],
+    fmt: str,
+    on_part: Callable[[PartResult], None],
+    poll: Optional[Callable[[], None]] = None
+):
+    """
+    Convierte `parts` (nombres en out_dir) a `fmt` en un pool de procesos,
+    una parte por worker. `on_part` recibe cada resultado a medida que
+    termina (en cualquier orden); `poll` se llama mientras tanto, como mucho
+    cada _POLL_SECONDS. Si alguno de los dos lanza, el pool se corta y las
+    salidas a medias se borran.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt} (xlsx o parquet)")
+    if fmt == "parquet" and not PARQUET_AVAILABLE:
+        raise ValueError("Salida Parquet no disponible (falta el paquete pyarrow)")
+    invalidas = [p for p in parts if not convertible(p, fmt)]
+    if invalidas:
+        raise ValueError(f"Partes que no se pueden convertir a {fmt}: {', '.join(invalidas)}")
+    tasks = [(str(out_dir / p), fmt) for p in parts]
+    workers = max(1, min(settings.WORKER_PROCESSES, cpu_count(), len(tasks)))
+    try:
+        with Pool(workers) as pool:  # al salir, terminate(): corta las conversiones en curso
+            results = pool.imap_unordered(convert_part, tasks)
+            for _ in tasks:
+                while True:
+                    if poll is not None:
+                        poll()
+                    try:
+                        result = results.next(timeout=_POLL_SECONDS)
+                        break
+                    except multiprocessing.TimeoutError:
+                        continue
+                on_part(result)
+    finally:
+        for p in parts:
+            (out_dir / f".{output_name(p, fmt)}.tmp").unlink(missing_ok=True)
+
+
+def register_artifacts(run_dir: Path, names: List[str]) -> Tuple[dict, List[Artifact]]:
+    """
+    Agrega (o actualiza) `names` de run_dir/output en el manifest.json del
+    run. Con lock y reemplazo atómico: dos conversiones del mismo run no se
+    pisan y un lector nunca ve el manifest a medio escribir.
+    """
+    out_dir = run_dir / "output"
+    artifacts = [Artifact(name=n, size=(out_dir / n).stat().st_size,
+                          download_url=f"/api/runs/{run_dir.name}/artifact/{n}") for n in names]
+    with open(run_dir / ".manifest.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest_path = run_dir / "manifest.json"
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        nuevos = {a.name for a in artifacts}
+        manifest["artifacts"] = [a for a in manifest.get("artifacts", []) if a["name"] not in nuevos] \
+            + [a.model_dump() for a in artifacts]
+        tmp = run_dir / ".manifest.json.tmp"
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, manifest_path)
+    return manifest, artifacts
@@ -1,13 +1,28 @@
 from __future__ import annotations
 from pathlib import Path
 from datetime import datetime
-import calendar, csv, gzip, subprocess, shutil
-from typing import List, Dict, Optional
+import calendar, csv, io, os, queue, shutil, threading
+from typing import Any, List, Dict, Optional, Sequence, Tuple, Union
 from .settings import settings
+from .block_compress import BlockCompressedFile, codec_suffix
+from .rows import ProjectionPlan, Row, column_values, compile_plan
 import logging
 
 logger = logging.getLogger(__name__)
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
 MESES_ES = {1:"enero",2:"febrero",3:"marzo",4:"abril",5:"mayo",6:"junio",7:"julio",8:"agosto",9:"septiembre",10:"octubre",11:"noviembre",12:"diciembre"}
 
 def _nombre_base(cliente: str, es_control: bool, es_ajustada: bool):
@@ -21,44 +36,51 @@ def _nombre_base(cliente: str, es_control: bool, es_ajustada: bool):
     periodo = f"{mes}/{dia}/{anio}"
     return base, scan_name, periodo
 
+def _is_arrow_batch(batch: Sequence[Any]) -> bool:
+    return PYARROW_AVAILABLE and len(batch) > 0 and isinstance(batch[0], (pa.Array, pa.ChunkedArray))
+
+def _batch_len(batch: Sequence[Any]) -> int:
+    return len(batch[0]) if _is_arrow_batch(batch) else len(batch)
+
 class _CsvWriter:
-    def __init__(self, path: Path, header_cols: List[str], scan_name: str, periodo: str):
+    def __init__(self, path: Path, header_cols: List[str], scan_name: str, periodo: str,
+                 count: int = 0, size: Optional[int] = None):
+        """
+        `count` / `size` reabren una parte desde un checkpoint: el archivo se
+        trunca a `size` bytes (lo escrito después se descarta) y se sigue
+        escribiendo a continuación, sin repetir el header.
+        """
         self.path = path
-        self.cols = header_cols[:]
+        self.cols = list(header_cols)
         self.scan_name = scan_name
         self.periodo = periodo
-        self.count = 0
+        self.count = count
         path.parent.mkdir(parents=True, exist_ok=True)
+        if size is not None:
+            with path.open("r+b") as f:
+                f.truncate(size)
         
-        # Compresión con pigz (paralelo) si está disponible
+        # Con el writer vectorizado de Arrow (que usa "\n") el header usa el mismo fin de línea
+        self.use_arrow = PYARROW_AVAILABLE and settings.CSV_ARROW_WRITER
+        self._open(append=size is not None)
+        if size is None:
+            header = self.cols + ["scan_name","periodo","os"]
+            self.w.writerow(header)
+        self._row_buffer = []
+        self._buffer_size = 1000  # Escribir cada 1000 filas
+
+    def _open(self, append: bool):
+        # self.raw = destino binario (archivo o compresor por bloques);
+        # self.fh = capa de texto para csv.writer sobre el mismo destino
+        path = self.path
         if settings.CSV_GZIP:
-            # Intentar usar pigz para compresión paralela
-            if settings.ENABLE_PARALLEL_COMPRESSION and shutil.which("pigz"):
-                logger.info(f"🚀 Usando pigz (compresión paralela) para {path.name}")
-                # Crear proceso pigz
-                self.pigz_proc = subprocess.Popen(
-                    ['pigz', '-c', '-1', '-p', str(settings.WORKER_PROCESSES)],  # -1 = rápido, -p = threads
-                    stdin=subprocess.PIPE,
-                    stdout=open(path, 'wb'),
-                    stderr=subprocess.PIPE
-                )
-                self.fh = self.pigz_proc.stdin
-                self.using_pigz = True
-            else:
-                # Fallback a gzip estándar
-                logger.info(f"ℹ️ Usando gzip estándar para {path.name}")
-                self.fh = gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=1)
-                self.using_pigz = False
+            # Bloques independientes comprimidos en paralelo (al reabrir se siguen agregando bloques)
+            self.raw = BlockCompressedFile(path, settings.CSV_COMPRESSION, append=append)
         else:
             # Sin compresión - buffer mucho más grande para escritura rápida
-            self.fh = path.open("w", encoding="utf-8", newline="", buffering=settings.WRITE_BUFFER_SIZE)
-            self.using_pigz = False
-        
-        self.w = csv.writer(self.fh, quoting=csv.QUOTE_MINIMAL)
-        header = self.cols + ["scan_name","periodo","os"]
-        self.w.writerow(header)
-        self._row_buffer = []
-        self._buffer_size = 1000  # Escribir cada 1000 filas
+            self.raw = path.open("ab" if append else "wb", buffering=settings.WRITE_BUFFER_SIZE)
+        self.fh = io.TextIOWrapper(self.raw, encoding="utf-8", newline="")
+        self.w = csv.writer(self.fh, quoting=csv.QUOTE_MINIMAL, lineterminator="\n" if self.use_arrow else "\r\n")
 
     def append(self, row: Dict[str,str], os_value: Optional[str]):
         out = [row.get(c, "") for c in self.cols]
@@ -71,6 +93,40 @@ class _CsvWriter:
         # Flush buffer cada N filas para mejor rendimiento
         if len(self._row_buffer) >= self._buffer_size:
             self._flush_buffer()
+
+    def append_rows(self, rows: Sequence[Sequence[str]], plan: Optional[ProjectionPlan], os_value: Optional[str]):
+        """
+        Escribe un lote de filas (secuencias alineadas a las columnas del lote).
+        `plan` proyecta cada fila a las columnas del writer; None si el
+        layout del lote ya coincide.
+        """
+        self._flush_buffer()
+        tail = (self.scan_name, self.periodo, os_value or "")
+        if plan is None or plan.identity:
+            self.w.writerows([(*r, *tail) for r in rows])
+        else:
+            get = plan.gather
+            self.w.writerows([(*get(r), *tail) for r in rows])
+        self.count += len(rows)
+
+    def append_arrays(self, arrays: Sequence[Any], plan: Optional[ProjectionPlan], os_value: Optional[str]):
+        """Escribe un lote columnar (arrays Arrow de igual longitud)."""
+        n = len(arrays[0])
+        if not self.use_arrow:
+            cols = [column_values(a) for a in arrays]
+            self.append_rows(list(zip(*cols)), plan, os_value)
+            return
+        if plan is None or plan.identity:
+            picked = list(arrays)
+        else:
+            fills = [pa.repeat(pa.scalar(v, pa.string()), n) for v in plan.fill]
+            picked = [(arrays[i] if i < len(arrays) else fills[i - len(arrays)]) for i in plan.index]
+        picked += [pa.repeat(pa.scalar(v, pa.string()), n) for v in (self.scan_name, self.periodo, os_value or "")]
+        table = pa.Table.from_arrays(picked, names=[f"c{i}" for i in range(len(picked))])
+        self._flush_buffer()
+        self.fh.flush()
+        pa_csv.write_csv(table, self.raw, pa_csv.WriteOptions(include_header=False))
+        self.count += n
     
     def _flush_buffer(self):
         if self._row_buffer:
@@ -82,20 +138,267 @@ class _CsvWriter:
             self._flush_buffer()  # Flush cualquier fila pendiente
             self.fh.flush()
         finally:
-            if hasattr(self, 'using_pigz') and self.using_pigz:
-                # Cerrar pigz correctamente
-                self.fh.close()
-                self.pigz_proc.wait()
-                if self.pigz_proc.returncode != 0:
-                    stderr = self.pigz_proc.stderr.read()
-                    logger.warning(f"⚠️ pigz warning: {stderr}")
-            else:
-                self.fh.close()
+            self.fh.close()
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """
+        Deja en disco todo lo escrito y devuelve el tamaño del archivo, punto
+        válido para reanudar. Comprimido, el bloque en curso se cierra antes
+        de tiempo (los bloques siguientes se agregan a continuación).
+        """
+        self._flush_buffer()
+        self.fh.flush()
+        if settings.CSV_GZIP:
+            self.raw.sync()
+        else:
+            os.fsync(self.raw.fileno())
+        return {"size": self.path.stat().st_size}
+
+def parquet_options(names: Sequence[str]) -> Dict[str, Any]:
+    """Opciones de pq.ParquetWriter para una parte con estas columnas (todas texto)."""
+    dictionary = set(settings.PARQUET_DICTIONARY_COLUMNS) | {"scan_name", "periodo", "os"}
+    return {
+        "compression": settings.PARQUET_COMPRESSION,
+        "use_dictionary": [c for c in names if c in dictionary],
+    }
+
+class _ParquetWriter:
+    """
+    Parte en Parquet (todas las columnas como texto). Las filas se juntan en
+    memoria hasta completar un row group de PARQUET_ROW_GROUP_ROWS filas;
+    las columnas de PARQUET_DICTIONARY_COLUMNS van con diccionario.
+
+    Un Parquet solo se puede leer con el footer que se escribe al cerrarlo,
+    así que la parte se escribe en segmentos ocultos (`.<parte>.segNNN`):
+    checkpoint() cierra el segmento actual y close() los une en la parte
+    final, re-armando row groups completos. Los segmentos que figuran en un
+    checkpoint no se borran al cerrar: close() los devuelve y el agregador
+    los borra cuando ya ningún checkpoint vigente los usa.
+    """
+    def __init__(self, path: Path, header_cols: List[str], scan_name: str, periodo: str,
+                 count: int = 0, segments: Optional[List[str]] = None):
+        """
+        `count` / `segments` reabren una parte desde un checkpoint: los
+        segmentos escritos después se descartan.
+        """
+        self.path = path
+        self.cols = list(header_cols)
+        self.scan_name = scan_name
+        self.periodo = periodo
+        self.count = count
+        self.segments: List[str] = list(segments or [])
+        self._checkpointed = set(self.segments)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        names = self.cols + ["scan_name", "periodo", "os"]
+        self.schema = pa.schema([(c, pa.string()) for c in names])
+        self._options = parquet_options(names)
+        self.row_group = max(1, settings.PARQUET_ROW_GROUP_ROWS)
+        self._pw = None  # pq.ParquetWriter del segmento (o de la parte final al unir)
+        self._pending: List[Any] = []  # tablas que aún no completan un row group
+        self._pending_rows = 0
+
+    def _tail(self, n: int, os_value: Optional[str]) -> List[Any]:
+        return [pa.repeat(pa.scalar(v, pa.string()), n) for v in (self.scan_name, self.periodo, os_value or "")]
+
+    def _push(self, table):
+        """Acumula filas y escribe cada row group en cuanto se completa."""
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        if self._pending_rows >= self.row_group:
+            self._flush(partial=False)
+
+    def _flush(self, partial: bool):
+        if not self._pending_rows:
+            return
+        if self._pw is None:
+            name = f".{self.path.name}.seg{len(self.segments) + 1:03d}"
+            self._pw = pq.ParquetWriter(self.path.parent / name, self.schema, **self._options)
+            self.segments.append(name)
+        table = pa.concat_tables(self._pending)
+        while table.num_rows >= self.row_group or (partial and table.num_rows):
+            take = min(self.row_group, table.num_rows)
+            self._pw.write_table(table.slice(0, take), row_group_size=take)
+            table = table.slice(take)
+        self._pending = [table] if table.num_rows else []
+        self._pending_rows = table.num_rows
+
+    def append(self, row: Dict[str,str], os_value: Optional[str]):
+        self.append_rows([[row.get(c, "") for c in self.cols]], None, os_value)
+
+    def append_rows(self, rows: Sequence[Sequence[str]], plan: Optional[ProjectionPlan], os_value: Optional[str]):
+        """Lote de filas alineadas a las columnas del lote; `plan` como en _CsvWriter."""
+        if plan is not None and not plan.identity:
+            rows = [plan.gather(r) for r in rows]
+        n = len(rows)
+        columns = list(zip(*rows)) if rows else [()] * len(self.cols)
+        arrays = [pa.array(c, type=pa.string()) for c in columns] + self._tail(n, os_value)
+        self._push(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.count += n
+
+    def append_arrays(self, arrays: Sequence[Any], plan: Optional[ProjectionPlan], os_value: Optional[str]):
+        """Lote columnar (arrays Arrow de igual longitud), sin pasar por filas."""
+        n = len(arrays[0])
+        if plan is None or plan.identity:
+            picked = list(arrays)
+        else:
+            fills = [pa.repeat(pa.scalar(v, pa.string()), n) for v in plan.fill]
+            picked = [(arrays[i] if i < len(arrays) else fills[i - len(arrays)]) for i in plan.index]
+        picked = [a if a.type == pa.string() else a.cast(pa.string()) for a in picked]
+        self._push(pa.Table.from_arrays(picked + self._tail(n, os_value), schema=self.schema))
+        self.count += n
+
+    def _close_segment(self):
+        self._flush(partial=True)
+        if self._pw is not None:
+            self._pw.close()
+            self._pw = None
+
+    def close(self) -> List[str]:
+        """Escribe la parte final; devuelve los segmentos que quedan en disco por estar en un checkpoint."""
+        self._close_segment()
+        seg_paths = [self.path.parent / s for s in self.segments]
+        if len(seg_paths) == 1 and self.segments[0] in self._checkpointed:
+            self.path.unlink(missing_ok=True)
+            try:
+                os.link(seg_paths[0], self.path)
+            except OSError:
+                shutil.copyfile(seg_paths[0], self.path)
+        elif len(seg_paths) == 1:
+            os.replace(seg_paths[0], self.path)
+        else:
+            # sin filas o con varios segmentos: se escribe la parte final desde cero
+            self._pw = pq.ParquetWriter(self.path, self.schema, **self._options)
+            try:
+                for seg in seg_paths:
+                    pf = pq.ParquetFile(seg)
+                    for i in range(pf.num_row_groups):
+                        self._push(pf.read_row_group(i))
+                self._flush(partial=True)
+            finally:
+                self._pw.close()
+                self._pw = None
+            for seg in seg_paths:
+                if seg.name not in self._checkpointed:
+                    seg.unlink()
+        retired = [s for s in self.segments if s in self._checkpointed]
+        self.segments = []
+        return retired
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """Cierra el segmento actual (Parquet válido en disco) y devuelve los segmentos de la parte."""
+        self._close_segment()
+        self._checkpointed.update(self.segments)
+        return {"segments": list(self.segments)}
+
+class _WriterStream:
+    """
+    Hilo de escritura de una de las 4 tablas: ejecuta en orden las
+    operaciones encoladas. La cola acotada (WRITER_QUEUE_BATCHES) frena al
+    parser si el disco o la compresión no dan abasto. Tras un error se
+    descarta el resto y el error se relanza en el próximo submit/drain.
+    """
+    def __init__(self, name: str):
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, settings.WRITER_QUEUE_BATCHES))
+        self._error: Optional[BaseException] = None
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._run, name=f"writer-{name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            op = self._queue.get()
+            try:
+                if op is None:
+                    return
+                if self._error is None and not self._cancelled:
+                    fn, args = op
+                    fn(*args)
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, fn, *args):
+        self._raise()
+        self._queue.put((fn, args))
+
+    def drain(self):
+        """Espera a que se escriba todo lo encolado."""
+        self._queue.join()
+        self._raise()
+
+    def stop(self, cancel: bool = False):
+        """Termina el hilo; con `cancel` descarta lo que quede en la cola."""
+        self._cancelled = cancel
+        self._queue.put(None)
+        self._thread.join()
+
+class _QueuedWriter:
+    """
+    Parte cuyas escrituras corren en el hilo de su tabla. Mismo interfaz que
+    _CsvWriter / _ParquetWriter; `count` se actualiza al encolar, así la
+    rotación de partes se decide en el hilo del parser.
+    """
+    def __init__(self, writer, stream: _WriterStream, on_close):
+        self._writer = writer
+        self._stream = stream
+        self._on_close = on_close
+        self.path = writer.path
+        self.cols = writer.cols
+        self.count = writer.count
+
+    def append(self, row: Dict[str,str], os_value: Optional[str]):
+        self._stream.submit(self._writer.append, row, os_value)
+        self.count += 1
+
+    def append_rows(self, rows: Sequence[Sequence[str]], plan: Optional[ProjectionPlan], os_value: Optional[str]):
+        self._stream.submit(self._writer.append_rows, rows, plan, os_value)
+        self.count += len(rows)
+
+    def append_arrays(self, arrays: Sequence[Any], plan: Optional[ProjectionPlan], os_value: Optional[str]):
+        self._stream.submit(self._writer.append_arrays, arrays, plan, os_value)
+        self.count += len(arrays[0])
+
+    def close(self) -> List[str]:
+        # el cierre también va por la cola; lo que devuelva el writer llega a `on_close` desde el hilo
+        self._stream.submit(lambda: self._on_close(self._writer.close()))
+        return []
+
+    def checkpoint(self) -> Dict[str, Any]:
+        self._stream.drain()
+        return self._writer.checkpoint()
+
+# clave de tabla → (atributo del writer, atributo del número de parte)
+_WRITER_ATTRS = {
+    "t1_normal": ("w_t1_n", "p_t1_n"),
+    "t1_ajustada": ("w_t1_a", "p_t1_a"),
+    "t2_normal": ("w_t2_n", "p_t2_n"),
+    "t2_ajustada": ("w_t2_a", "p_t2_a"),
+}
+
+def _table_key(table: str, ajustada: bool) -> str:
+    return f"{'t1' if table=='t1' else 't2'}_{'ajustada' if ajustada else 'normal'}"
+
+def _writer_class():
+    """Writer de las partes según OUTPUT_FORMAT ("csv" o "parquet")."""
+    if settings.OUTPUT_FORMAT.lower() == "parquet":
+        if PARQUET_AVAILABLE:
+            return _ParquetWriter
+        logger.warning("⚠️ OUTPUT_FORMAT=parquet requiere pyarrow; se escribe CSV")
+    return _CsvWriter
 
 class CsvAggregator:
     """
-    Abre hasta 4 CSV y escribe en streaming con partición por filas:
+    Abre hasta 4 CSV (o Parquet, según OUTPUT_FORMAT) y escribe en streaming
+    con partición por filas:
       t1_normal, t1_ajustada, t2_normal, t2_ajustada
+    Con WRITER_THREADS cada tabla escribe en su propio hilo; los errores de
+    escritura se relanzan en add_batch / snapshot / close.
     """
     def __init__(self, cliente: str, out_dir: Path):
         self.cliente = cliente
@@ -115,13 +418,46 @@ class CsvAggregator:
         self.p_t2_n = 1
         self.p_t2_a = 1
 
+        # contexto de nombres del run (base, scan_name, periodo), calculado una sola vez
+        self._naming = {
+            key: _nombre_base(cliente, es_control=key.startswith("t1"), es_ajustada=key.endswith("ajustada"))
+            for key in _WRITER_ATTRS
+        }
+
         self.counts = {"t1_normal":0,"t1_ajustada":0,"t2_normal":0,"t2_ajustada":0}
         self.preview = {"t1_normal":[], "t1_ajustada":[], "t2_normal":[], "t2_ajustada":[]}
         self.preview_limit = 50
         self.saved_files: List[str] = []
 
+        # planes de proyección por (tabla, layout entrante), compilados una vez
+        self._plans: Dict[Tuple[str, Tuple[str, ...]], ProjectionPlan] = {}
+        self.warnings: List[str] = []
+        self._writer_cls = _writer_class()
+        # segmentos Parquet de partes ya cerradas que el último checkpoint aún puede usar
+        self._retired: List[str] = []
+        self._retired_prev: List[str] = []
+        # hilos de escritura por tabla (WRITER_THREADS)
+        self._streams: Dict[str, _WriterStream] = {}
+
+    def _open_writer(self, key: str, cls, path: Path, cols: List[str], **resume):
+        """Writer de una parte; con WRITER_THREADS, detrás del hilo de escritura de su tabla."""
+        _, scan_name, periodo = self._naming[key]
+        writer = cls(path, cols, scan_name, periodo, **resume)
+        if not settings.WRITER_THREADS:
+            return writer
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = self._streams[key] = _WriterStream(key)
+        return _QueuedWriter(writer, stream, self._retire)
+
+    def _retire(self, segments: Optional[List[str]]):
+        self._retired += segments or []
+
     def _build_path(self, base: str, part: int) -> Path:
-        suf = ".csv.gz" if settings.CSV_GZIP else ".csv"
+        if self._writer_cls is _ParquetWriter:
+            suf = ".parquet"
+        else:
+            suf = ".csv" + codec_suffix(settings.CSV_COMPRESSION) if settings.CSV_GZIP else ".csv"
         # agrega sufijo -part-02 a partir de la parte 2
         name = f"{base}{'' if part==1 else f'-part-{part:02d}'}{suf}"
         return self.out_dir / name
@@ -129,55 +465,57 @@ class CsvAggregator:
     def _ensure_writer(self, table: str, ajustada: bool, header_cols: List[str]) -> _CsvWriter:
         is_control = (table == "t1")
         if is_control and self.t1_cols is None:
-            self.t1_cols = header_cols[:]
+            self.t1_cols = list(header_cols)
         if not is_control and self.t2_cols is None:
-            self.t2_cols = header_cols[:]
+            self.t2_cols = list(header_cols)
 
-        base, scan_name, periodo = _nombre_base(self.cliente, es_control=is_control, es_ajustada=ajustada)
+        key = _table_key(table, ajustada)
+        writer_attr, part_attr = _WRITER_ATTRS[key]
+        writer = getattr(self, writer_attr)
+        if writer is None:
+            base = self._naming[key][0]
+            cols = self.t1_cols if is_control else self.t2_cols
+            writer = self._open_writer(key, self._writer_cls, self._build_path(base, getattr(self, part_attr)), cols)
+            setattr(self, writer_attr, writer)
+        return writer
 
-        if is_control:
-            if ajustada:
-                if self.w_t1_a is None:
-                    self.w_t1_a = _CsvWriter(self._build_path(base, self.p_t1_a), self.t1_cols, scan_name, periodo)
-                return self.w_t1_a
-            else:
-                if self.w_t1_n is None:
-                    self.w_t1_n = _CsvWriter(self._build_path(base, self.p_t1_n), self.t1_cols, scan_name, periodo)
-                return self.w_t1_n
-        else:
-            if ajustada:
-                if self.w_t2_a is None:
-                    self.w_t2_a = _CsvWriter(self._build_path(base, self.p_t2_a), self.t2_cols, scan_name, periodo)
-                return self.w_t2_a
-            else:
-                if self.w_t2_n is None:
-                    self.w_t2_n = _CsvWriter(self._build_path(base, self.p_t2_n), self.t2_cols, scan_name, periodo)
-                return self.w_t2_n
-
-    def _rotate_if_needed(self, writer_attr: str, part_attr: str, base: str, cols: List[str]):
+    def _rotate_if_needed(self, key: str) -> Optional[_CsvWriter]:
         """Cierra el writer actual y abre el siguiente si se alcanzó el límite."""
+        writer_attr, part_attr = _WRITER_ATTRS[key]
         writer: _CsvWriter = getattr(self, writer_attr)
         if writer and writer.count >= settings.CSV_PART_MAX_ROWS:
             # guarda nombre del archivo recién cerrado
-            writer.close()
+            self._retire(writer.close())
             self.saved_files.append(Path(writer.path).name)
-            # incrementa parte y reabre
+            # incrementa parte y reabre con las mismas columnas
             part = getattr(self, part_attr) + 1
             setattr(self, part_attr, part)
-            # re-crear writer con las mismas columnas
-            base_scan, scan_name, periodo = _nombre_base(self.cliente,
-                                                         es_control="-control-statics" in base,
-                                                         es_ajustada="-ajustado" in base)
-            # Nota: base ya trae control/ajustada; usamos esas columas:
-            new_path = self._build_path(base, part)
-            new_writer = _CsvWriter(new_path, cols, scan_name, periodo)
-            setattr(self, writer_attr, new_writer)
-
-    def add_row(self, table: str, ajustada: bool, row: Dict[str,str], header_cols: List[str], os_value: Optional[str]):
+            writer = self._open_writer(key, self._writer_cls, self._build_path(self._naming[key][0], part), writer.cols)
+            setattr(self, writer_attr, writer)
+        return writer
+
+    def _plan_for(self, table: str, master: List[str], columns: Sequence[str]) -> ProjectionPlan:
+        """Plan cacheado para este layout; la primera vez registra sus diferencias."""
+        kind = "t1" if table == "t1" else "t2"
+        fp = (kind, tuple(columns))
+        plan = self._plans.get(fp)
+        if plan is None:
+            plan = self._plans[fp] = compile_plan(master, columns)
+            if not plan.identity:
+                msg = f"Header distinto en {kind} ({len(columns)} columnas): {plan.describe()}"
+                self.warnings.append(msg)
+                logger.warning(f"⚠️ {msg}")
+        return plan
+
+    def add_row(self, table: str, ajustada: bool, row: Union[Row, Dict[str,str]], header_cols: Sequence[str], os_value: Optional[str]):
+        if not isinstance(row, dict):
+            # fila compacta (tupla alineada al header de su sección)
+            self.add_batch(table, ajustada, header_cols, (row,), os_value)
+            return
         w = self._ensure_writer(table, ajustada, header_cols)
         w.append(row, os_value)
 
-        key = f"{'t1' if table=='t1' else 't2'}_{'ajustada' if ajustada else 'normal'}"
+        key = _table_key(table, ajustada)
         self.counts[key] += 1
         if len(self.preview[key]) < self.preview_limit:
             r2 = dict(row)
@@ -185,22 +523,130 @@ class CsvAggregator:
             self.preview[key].append(r2)
 
         # rotación si se alcanzó el límite
-        base, _, _ = _nombre_base(self.cliente, es_control=(table=="t1"), es_ajustada=ajustada)
-        if table == "t1" and not ajustada:
-            self._rotate_if_needed("w_t1_n", "p_t1_n", base, self.t1_cols)
-        elif table == "t1" and ajustada:
-            self._rotate_if_needed("w_t1_a", "p_t1_a", base, self.t1_cols)
-        elif table == "t2" and not ajustada:
-            self._rotate_if_needed("w_t2_n", "p_t2_n", base, self.t2_cols)
-        else:
-            self._rotate_if_needed("w_t2_a", "p_t2_a", base, self.t2_cols)
+        self._rotate_if_needed(key)
+
+    def add_batch(self, table: str, ajustada: bool, columns: Sequence[str], batch: Sequence[Any], os: Optional[str]) -> int:
+        """
+        Escribe un lote completo de una vez.
+        `batch` es una lista de filas (secuencias alineadas a `columns`) o una
+        lista de arrays Arrow (una por columna). El lote se corta exactamente
+        en los límites de CSV_PART_MAX_ROWS para la rotación de partes.
+        Devuelve el número de filas escritas.
+        """
+        n = _batch_len(batch)
+        if n == 0:
+            return 0
+        columnar = _is_arrow_batch(batch)
+        w = self._ensure_writer(table, ajustada, columns)
+        key = _table_key(table, ajustada)
+
+        plan = self._plan_for(table, w.cols, columns)
+
+        # preview (solo las primeras filas)
+        room = self.preview_limit - len(self.preview[key])
+        if room > 0:
+            head = batch if not columnar else [column_values(a.slice(0, room)) for a in batch]
+            rows = list(zip(*head)) if columnar else head[:room]
+            for r in rows:
+                r2 = dict(zip(columns, r))
+                r2["os"] = os or ""
+                self.preview[key].append(r2)
+
+        start = 0
+        while start < n:
+            take = min(n - start, settings.CSV_PART_MAX_ROWS - w.count)
+            if columnar:
+                w.append_arrays([a.slice(start, take) for a in batch], plan, os)
+            else:
+                w.append_rows(batch[start:start + take], plan, os)
+            start += take
+            w = self._rotate_if_needed(key)
+
+        self.counts[key] += n
+        return n
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Estado serializable (JSON) para un checkpoint: partes cerradas,
+        número de parte, filas y punto de reanudación de cada parte abierta
+        (tamaño en disco del CSV o segmentos del Parquet),
+        contadores, preview y advertencias. Deja las partes abiertas en disco.
+        """
+        for stream in self._streams.values():
+            stream.drain()  # el checkpoint refleja todo lo encolado
+        # el checkpoint anterior ya quedó guardado: lo retirado antes de él no se vuelve a usar
+        self._drop_segments(self._retired_prev)
+        self._retired_prev, self._retired = self._retired, []
+        writers = {}
+        for key, (writer_attr, _) in _WRITER_ATTRS.items():
+            w: Optional[_CsvWriter] = getattr(self, writer_attr)
+            if w:
+                writers[key] = {"file": w.path.name, "cols": w.cols, "count": w.count, **w.checkpoint()}
+        return {
+            "naming": self._naming,
+            "t1_cols": self.t1_cols,
+            "t2_cols": self.t2_cols,
+            "parts": {key: getattr(self, part_attr) for key, (_, part_attr) in _WRITER_ATTRS.items()},
+            "writers": writers,
+            "counts": dict(self.counts),
+            "preview": self.preview,
+            "saved_files": list(self.saved_files),
+            "warnings": list(self.warnings),
+            "layouts": [[kind, list(cols)] for kind, cols in self._plans],
+        }
+
+    def restore(self, state: Dict[str, Any]):
+        """Vuelve al estado de snapshot(): trunca las partes abiertas y sigue escribiendo en ellas."""
+        # nombres del run original (la fecha de hoy puede ser otra al reanudar)
+        self._naming = {key: tuple(v) for key, v in state["naming"].items()}
+        self.t1_cols = state["t1_cols"]
+        self.t2_cols = state["t2_cols"]
+        for key, (writer_attr, part_attr) in _WRITER_ATTRS.items():
+            setattr(self, part_attr, state["parts"][key])
+            ws = state["writers"].get(key)
+            if ws:
+                cls = _ParquetWriter if ws["file"].endswith(".parquet") else _CsvWriter
+                resume = {k: v for k, v in ws.items() if k not in ("file", "cols")}
+                setattr(self, writer_attr, self._open_writer(key, cls, self.out_dir / ws["file"], ws["cols"], **resume))
+        # segmentos Parquet escritos después del checkpoint o de partes ya cerradas
+        keep = {seg for ws in state["writers"].values() for seg in ws.get("segments", [])}
+        self._drop_segments([p.name for p in self.out_dir.glob(".*.parquet.seg*") if p.name not in keep])
+        self.counts = dict(state["counts"])
+        self.preview = state["preview"]
+        self.saved_files = list(state["saved_files"])
+        self.warnings = list(state["warnings"])
+        # layouts ya vistos: sus diferencias de header ya están en warnings
+        for kind, cols in state["layouts"]:
+            master = self.t1_cols if kind == "t1" else self.t2_cols
+            self._plans[(kind, tuple(cols))] = compile_plan(master, cols)
+
+    def _stop_streams(self, cancel: bool):
+        for stream in self._streams.values():
+            stream.stop(cancel)
+        self._streams.clear()
+
+    def abort(self):
+        """Procesamiento interrumpido: termina los hilos de escritura sin escribir lo pendiente."""
+        self._stop_streams(cancel=True)
+
+    def _drop_segments(self, names: List[str]):
+        for name in names:
+            (self.out_dir / name).unlink(missing_ok=True)
 
     def close(self):
         # Cierra abiertos y registra nombres
-        for attr in ["w_t1_n","w_t1_a","w_t2_n","w_t2_a"]:
-            w: Optional[_CsvWriter] = getattr(self, attr)
-            if w:
-                w.close()
-                self.saved_files.append(Path(w.path).name)
-                setattr(self, attr, None)
+        try:
+            for attr in ["w_t1_n","w_t1_a","w_t2_n","w_t2_a"]:
+                w: Optional[_CsvWriter] = getattr(self, attr)
+                if w:
+                    self._retire(w.close())
+                    self.saved_files.append(Path(w.path).name)
+                    setattr(self, attr, None)
+            # errores de los hilos de escritura: se relanzan acá
+            for stream in self._streams.values():
+                stream.drain()
+        finally:
+            self._stop_streams(cancel=False)
+        self._drop_segments(self._retired_prev + self._retired)
+        self._retired_prev, self._retired = [], []
         return self.saved_files
@@ -1,110 +1,134 @@
 from __future__ import annotations
 from pathlib import Path
-from datetime import datetime
-import calendar
-from typing import List, Dict, Optional
-from openpyxl import Workbook
+import zipfile
+from typing import List, Dict, Optional, Sequence
+from .settings import settings
 
-MESES_ES = {1:"enero",2:"febrero",3:"marzo",4:"abril",5:"mayo",6:"junio",7:"julio",8:"agosto",9:"septiembre",10:"octubre",11:"noviembre",12:"diciembre"}
+# Límite de filas de una hoja de Excel (incluye el header)
+XLSX_MAX_ROWS = 1_048_576
+# Tope de textos distintos en la tabla de shared strings de cada parte (memoria acotada)
+_MAX_SHARED_STRINGS = 200_000
+# Largo máximo del texto de una celda en Excel
+_MAX_CELL_CHARS = 32_767
 
-def _nombre_base(cliente: str, es_control: bool, es_ajustada: bool) -> tuple[str, str]:
-    hoy = datetime.today()
-    anio, mes = hoy.year, hoy.month
-    dia = calendar.monthrange(anio, mes)[1]
-    base = f"{cliente}-hardening{'-control-statics' if es_control else ''}-{anio}-{MESES_ES[mes]}-{dia:02d}"
-    if es_ajustada:
-        base += "-ajustado"
-    # scan_name y periodo (columnas adicionales)
-    scan_name = base
-    periodo = f"{mes}/{dia}/{anio}"
-    return base, f"{scan_name}|{periodo}"  # empaquetamos ambos
+_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    "xl/workbook.xml": (
+        f'<workbook xmlns="{_NS}" xmlns:r="{_NS_REL}">'
+        '<sheets><sheet name="data" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{_NS_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{_NS_REL}/sharedStrings" Target="sharedStrings.xml"/>'
+        f'<Relationship Id="rId3" Type="{_NS_REL}/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    "xl/styles.xml": (
+        f'<styleSheet xmlns="{_NS}">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'),
+}
+# escape XML + caracteres de control que XML 1.0 no admite (se descartan);
+# \r va como referencia para que el lector no lo normalice a \n
+_XML_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", "\r": "&#13;",
+                             **{c: None for c in range(32) if c not in (9, 10, 13)}})
 
-class _XlsxWriter:
-    def __init__(self, path: Path, header_cols: List[str], scan_name: str, periodo: str):
+def _xml_text(value) -> str:
+    text = "" if value is None else str(value)
+    if len(text) > _MAX_CELL_CHARS:
+        text = text[:_MAX_CELL_CHARS]
+    return text.translate(_XML_ESCAPE)
+
+class _XlsxSheetWriter:
+    """
+    XLSX en streaming: el XML de la hoja se escribe directo al zip, fila a
+    fila, sin modelo de celdas en memoria. Las columnas de
+    XLSX_SHARED_STRING_COLUMNS (más scan_name, periodo y os) van a la tabla
+    de shared strings, que se escribe al cerrar; el resto, como texto en
+    línea. Una hoja admite hasta XLSX_MAX_ROWS - 1 filas de datos.
+    """
+    def __init__(self, path: Path, header: Sequence[str]):
         self.path = path
-        self.header_cols = header_cols[:]  # columnas "originales" + Cliente
-        self.scan_name = scan_name
-        self.periodo = periodo
         self.count = 0
 
         path.parent.mkdir(parents=True, exist_ok=True)
-        self.wb = Workbook(write_only=True)
-        self.ws = self.wb.create_sheet(title="data")
-        # header: columnas + extras
-        header = self.header_cols + ["scan_name", "periodo"]
-        self.ws.append(header)
-
-    def append(self, row: Dict[str, str]):
-        data = [row.get(c, "") for c in self.header_cols]
-        data.append(self.scan_name)
-        data.append(self.periodo)
-        self.ws.append(data)
-        self.count += 1
+        shared = set(settings.XLSX_SHARED_STRING_COLUMNS) | {"scan_name", "periodo", "os"}
+        self._is_shared = [c in shared for c in header]
+        self._strings: Dict[str, int] = {}
+        self._string_refs = 0
+        self._pending: List[str] = []
 
-    def close(self):
-        self.wb.save(str(self.path))
-        self.wb.close()
-
-class ExcelAggregator:
-    """
-    Mantiene hasta 4 libros abiertos y escribe filas a medida que llegan.
-    t1 = Control Statistics, t2 = RESULTS
-    """
-    def __init__(self, cliente: str, out_dir: Path):
-        self.cliente = cliente
-        self.out_dir = out_dir
-        # columnas maestras (fijadas con el primer CSV que traiga cada tabla)
-        self.t1_cols: Optional[List[str]] = None
-        self.t2_cols: Optional[List[str]] = None
-        # writers perezosos
-        self.w_t1_norm: Optional[_XlsxWriter] = None
-        self.w_t1_aj:   Optional[_XlsxWriter] = None
-        self.w_t2_norm: Optional[_XlsxWriter] = None
-        self.w_t2_aj:   Optional[_XlsxWriter] = None
-        # conteos
-        self.counts = {"t1_normal":0, "t1_ajustada":0, "t2_normal":0, "t2_ajustada":0}
-        # previas ligeras
-        self.preview = {"t1_normal":[], "t1_ajustada":[], "t2_normal":[], "t2_ajustada":[]}
-        self.preview_limit = 50
-        # archivos guardados
-        self.saved_files: List[str] = []
+        self.zf = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+        self.sheet = self.zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self.sheet.write(f'{_XML_HEAD}<worksheet xmlns="{_NS}"><sheetData>'.encode("utf-8"))
+        # header siempre en línea
+        self._pending.append("<row>" + "".join(
+            f'<c t="inlineStr"><is><t xml:space="preserve">{_xml_text(c)}</t></is></c>' for c in header) + "</row>")
 
-    def _ensure_writer(self, table: str, ajustada: bool, header_cols: List[str]) -> _XlsxWriter:
-        # fijar columnas maestras la primera vez
-        if table == "t1" and self.t1_cols is None:
-            self.t1_cols = header_cols[:]
-        if table == "t2" and self.t2_cols is None:
-            self.t2_cols = header_cols[:]
+    def _shared(self, text: str) -> Optional[int]:
+        idx = self._strings.get(text)
+        if idx is None and len(self._strings) < _MAX_SHARED_STRINGS:
+            idx = self._strings[text] = len(self._strings)
+        return idx
 
-        is_control = (table == "t1")
-        base, sn_per = _nombre_base(self.cliente, es_control=is_control, es_ajustada=ajustada)
-        scan_name, periodo = sn_per.split("|", 1)
-        path = self.out_dir / f"{base}.xlsx"
+    def _row_xml(self, values: Sequence) -> str:
+        cells = []
+        for v, shared in zip(values, self._is_shared):
+            text = _xml_text(v)
+            idx = self._shared(text) if shared else None
+            if idx is None:
+                cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+            else:
+                self._string_refs += 1
+                cells.append(f'<c t="s"><v>{idx}</v></c>')
+        return "<row>" + "".join(cells) + "</row>"
 
-        if is_control:
-            if ajustada and self.w_t1_aj is None:
-                self.w_t1_aj = _XlsxWriter(path, self.t1_cols, scan_name, periodo)
-            if not ajustada and self.w_t1_norm is None:
-                self.w_t1_norm = _XlsxWriter(path, self.t1_cols, scan_name, periodo)
-            return self.w_t1_aj if ajustada else self.w_t1_norm
-        else:
-            if ajustada and self.w_t2_aj is None:
-                self.w_t2_aj = _XlsxWriter(path, self.t2_cols, scan_name, periodo)
-            if not ajustada and self.w_t2_norm is None:
-                self.w_t2_norm = _XlsxWriter(path, self.t2_cols, scan_name, periodo)
-            return self.w_t2_aj if ajustada else self.w_t2_norm
+    def write_rows(self, rows: Sequence[Sequence]):
+        """Filas completas, alineadas al header."""
+        self._pending.extend(self._row_xml(r) for r in rows)
+        self.count += len(rows)
+        self._flush()
 
-    def add_row(self, table: str, ajustada: bool, row: Dict[str,str], header_cols: List[str]):
-        w = self._ensure_writer(table, ajustada, header_cols)
-        w.append(row)
-        key = f"{'t1' if table=='t1' else 't2'}_{'ajustada' if ajustada else 'normal'}"
-        self.counts[key] += 1
-        if len(self.preview[key]) < self.preview_limit:
-            self.preview[key].append(row)
+    def _flush(self):
+        if self._pending:
+            self.sheet.write("".join(self._pending).encode("utf-8"))
+            self._pending.clear()
 
     def close(self):
-        for w in [self.w_t1_norm, self.w_t1_aj, self.w_t2_norm, self.w_t2_aj]:
-            if w:
-                w.close()
-                self.saved_files.append(Path(w.path).name)
-        return self.saved_files
+        try:
+            self._flush()
+            self.sheet.write(b"</sheetData></worksheet>")
+            self.sheet.close()
+            with self.zf.open("xl/sharedStrings.xml", "w", force_zip64=True) as f:
+                f.write(f'{_XML_HEAD}<sst xmlns="{_NS}" count="{self._string_refs}" '
+                        f'uniqueCount="{len(self._strings)}">'.encode("utf-8"))
+                chunk = []
+                for text in self._strings:  # orden de inserción = índice
+                    chunk.append(f'<si><t xml:space="preserve">{text}</t></si>')
+                    if len(chunk) >= 10000:
+                        f.write("".join(chunk).encode("utf-8"))
+                        chunk.clear()
+                f.write(("".join(chunk) + "</sst>").encode("utf-8"))
+            for name, xml in _STATIC_PARTS.items():
+                self.zf.writestr(name, _XML_HEAD + xml)
+        finally:
+            self.zf.close()
@@ -1,11 +1,12 @@
 from __future__ import annotations
 from pathlib import Path
-import gzip, csv, sys
+import gzip, csv, io, sys
 from typing import Dict, Iterator
 import json
 from elasticsearch import Elasticsearch, helpers
 from openpyxl import load_workbook
 from .settings import settings
+from .convert import part_stem
 from itertools import chain
 
 try:
@@ -13,11 +14,20 @@ try:
 except Exception:
     csv.field_size_limit(min(sys.maxsize, 2_147_483_647))
 
+def _open_csv_text(csv_path: Path):
+    suffix = csv_path.suffix.lower()
+    if suffix == ".zst":
+        import zstandard
+        # la salida comprimida por bloques tiene un frame zstd por bloque
+        raw = zstandard.ZstdDecompressor().stream_reader(csv_path.open("rb"), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8", newline="", errors="ignore")
+    opener = gzip.open if suffix==".gz" else open
+    mode = "rt" if suffix==".gz" else "r"
+    return opener(csv_path, mode, encoding="utf-8", newline="", errors="ignore")
+
 def _iter_csv_docs(csv_path: Path):
     import json
-    opener = gzip.open if csv_path.suffix.lower()==".gz" else open
-    mode = "rt" if csv_path.suffix.lower()==".gz" else "r"
-    with opener(csv_path, mode, encoding="utf-8", newline="", errors="ignore") as f:
+    with _open_csv_text(csv_path) as f:
         rdr = csv.reader(f)
         headers = next(rdr, None)
         if not headers:
@@ -30,6 +40,18 @@ def _iter_csv_docs(csv_path: Path):
             yield json.dumps(obj, ensure_ascii=False)
 
 
+def _iter_parquet_docs(parquet_path: Path) -> Iterator[str]:
+    """
+    Itera filas de un Parquet por lotes (sin cargar el archivo completo)
+    y devuelve cada fila como JSON (str).
+    """
+    import pyarrow.parquet as pq
+    pf = pq.ParquetFile(parquet_path)
+    for batch in pf.iter_batches(batch_size=10000):
+        for obj in batch.to_pylist():
+            yield json.dumps({h: "" if v is None else v for h, v in obj.items()}, ensure_ascii=False)
+
+
 def _iter_excel_docs(xlsx_path: Path) -> Iterator[str]:
     """
     Itera filas de un XLSX (read-only) y devuelve cada fila como JSON (str).
@@ -66,9 +88,9 @@ def _get_index_name_from_file(file_name: str) -> tuple[str, bool]:
     from pathlib import Path
     
     # Obtener el nombre base del archivo sin extensión
-    base_name = Path(file_name).stem  # Elimina .xlsx, .csv, .gz
+    base_name = Path(file_name).stem  # Elimina .xlsx, .csv, .gz, .parquet
     
-    # Si termina en .csv (para archivos .csv.gz), quitarlo también
+    # Si termina en .csv (para archivos .csv.gz / .csv.zst), quitarlo también
     if base_name.endswith('.csv'):
         base_name = base_name[:-4]
     
@@ -118,7 +140,7 @@ def _create_elasticsearch_client() -> Elasticsearch:
 
 async def ingest_run_folder(run_output_dir: Path) -> Dict[str, int]:
     """
-    Recorre los XLSX del run y los ingesta en ES vía bulk API.
+    Recorre los XLSX / CSV / Parquet del run y los ingesta en ES vía bulk API.
     Devuelve conteo por índice.
     """
     count_by_index: Dict[str, int] = {}
@@ -131,9 +153,18 @@ async def ingest_run_folder(run_output_dir: Path) -> Dict[str, int]:
         info = es.info()
         print(f"✅ Conectado a Elasticsearch: {info['cluster_name']} (v{info['version']['number']})")
         
-        files = list(chain(sorted(run_output_dir.glob("*.xlsx")),
-                           sorted(run_output_dir.glob("*.csv.gz")),
-                           sorted(run_output_dir.glob("*.csv"))))
+        # Una parte convertida (POST /convert) tiene el mismo nombre base que la original:
+        # se ingesta una sola copia, prefiriendo Parquet / CSV (más rápidos de leer) a XLSX
+        files, seen = [], set()
+        for file_path in chain(sorted(run_output_dir.glob("*.parquet")),
+                               sorted(run_output_dir.glob("*.csv.gz")),
+                               sorted(run_output_dir.glob("*.csv.zst")),
+                               sorted(run_output_dir.glob("*.csv")),
+                               sorted(run_output_dir.glob("*.xlsx"))):
+            stem = part_stem(file_path.name)
+            if stem not in seen:
+                seen.add(stem)
+                files.append(file_path)
 
         for file_path in files:
             print(f"Procesando archivo: {file_path.name}")
@@ -142,8 +173,10 @@ async def ingest_run_folder(run_output_dir: Path) -> Dict[str, int]:
 
             # Preparar documentos para bulk insert
             def generate_docs():
-                if file_path.suffix.lower() in [".csv", ".gz"]:
+                if file_path.suffix.lower() in [".csv", ".gz", ".zst"]:
                     iter_docs = _iter_csv_docs(file_path)
+                elif file_path.suffix.lower() == ".parquet":
+                    iter_docs = _iter_parquet_docs(file_path)
                 else:
                     iter_docs = _iter_excel_docs(file_path)
                 
@@ -0,0 +1,533 @@
+"""
+Ejecutor de jobs de procesamiento fuera del event loop.
+
+La cola de jobs es el JobStore (SQLite en el volumen compartido): submit()
+solo encola y cada instancia del backend corre un hilo que toma jobs de la
+base mientras tenga alguno de sus JOB_WORKERS procesos libre. El orden es
+justo entre clientes (ver JobStore.claim) y respeta un presupuesto global de
+jobs y MB en proceso (JOB_MAX_RUNNING, JOB_MAX_RUNNING_MB). Con la cola
+llena (JOB_QUEUE_MAX en total o JOB_QUEUE_MAX_PER_CLIENT por cliente),
+submit lanza JobQueueFull con un tiempo sugerido para reintentar. Los
+workers escriben el estado del job directamente en la base, así cualquier
+instancia responde /api/jobs/{id}/status aunque el job corra en otra. Un
+job también puede ser la conversión de partes de un run ya terminado
+(run_conversion): misma cola, mismo estado y mismos eventos.
+
+Cada job tomado es un lease que el hilo renueva cada JOB_HEARTBEAT_SECONDS.
+Si la instancia muere, el lease vence a los JOB_LEASE_SECONDS y otra
+instancia retoma el job desde su último checkpoint; al apagarse en orden,
+la instancia detiene sus jobs y los devuelve a la cola en el acto.
+
+La cancelación es cooperativa: se marca en la base y el worker dueño la
+revisa (como mucho una vez por segundo) entre archivos y en cada aviso de
+progreso; al verla aborta, cierra su pool de parseo y borra el run. Un job
+que nadie está corriendo se cancela directamente.
+"""
+from __future__ import annotations
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+import json
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import zipfile
+
+from .convert import convert_parts, register_artifacts
+from .job_store import ClaimedJob, JobStore, QueueStats, Upload
+from .models import Artifact, JobStatus, ProcessJob, ProcessResponse, RunInfo
+from .parallel_processor import ParallelCsvProcessor
+from .settings import settings
+from .sources import CsvSource, upload_sources
+
+logger = logging.getLogger(__name__)
+
+_PROGRESS_INTERVAL = 0.5  # segundos mínimos entre avisos de progreso a la base
+_LEASE_CHECK_INTERVAL = 1.0  # segundos mínimos entre consultas de lease/cancelación del worker
+
+# store del worker y aviso de apagado de su instancia (los crea el initializer del pool)
+_store: Optional[JobStore] = None
+_stop_event = None
+_api_pid: Optional[int] = None
+
+
+class JobQueueFull(Exception):
+    """No hay lugar en la cola de jobs; `retry_after` en segundos."""
+
+    def __init__(self, message: str, retry_after: int, estimated_start: datetime):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.estimated_start = estimated_start
+
+
+class JobCancelled(BaseException):
+    """
+    Cancelación pedida por el usuario. Hereda de BaseException (como
+    asyncio.CancelledError) para que los `except Exception` por archivo del
+    procesador no la conviertan en una advertencia de parseo.
+    """
+
+
+class JobInterrupted(BaseException):
+    """
+    La instancia se apaga o murió, o perdió el lease del job: el job se
+    detiene dejando su checkpoint para quien lo retome.
+    """
+
+
+def _init_worker(store_path: Path, stop_event):
+    global _store, _stop_event, _api_pid
+    _store = JobStore(store_path)
+    _stop_event = stop_event
+    _api_pid = os.getppid()
+    # Ctrl+C llega a todo el grupo de procesos: el job se detiene por el stop_event que activa el API
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+
+
+class _JobControl:
+    """Estado del job en la base y puntos de cancelación, desde el worker dueño del lease."""
+
+    def __init__(self, job_id: str, owner: str):
+        self.job_id = job_id
+        self.owner = owner
+        self._last_check = 0.0
+
+    def report(self, **fields):
+        if not _store.update_job(self.job_id, fields, self.owner):
+            raise JobInterrupted()  # otra instancia tomó el job
+
+    def check_cancelled(self):
+        if _stop_event.is_set() or os.getppid() != _api_pid:
+            raise JobInterrupted()
+        now = time.monotonic()
+        if now - self._last_check < _LEASE_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        lease_owner, cancel_requested = _store.lease(self.job_id)
+        if lease_owner != self.owner:
+            raise JobInterrupted()
+        if cancel_requested:
+            raise JobCancelled()
+
+    def save_checkpoint(self, state: Dict[str, Any]):
+        if not _store.save_checkpoint(self.job_id, state, self.owner):
+            raise JobInterrupted()
+
+
+def run_job(
+    job_id: str,
+    owner: str,
+    run_dir: Path,
+    uploads: List[Upload],
+    client: str,
+    empresas_list: List[str],
+    nombre_defecto: Optional[str]
+):
+    """
+    Procesa los archivos de un run en el worker y guarda el estado del job.
+    `owner` es la instancia que tiene el lease; `uploads` son los archivos
+    ya guardados en disco: (nombre, ruta, sha256). Si el job tiene checkpoint
+    (se interrumpió antes, en esta u otra instancia), continúa desde ahí.
+    """
+    last_report = 0.0
+    control = _JobControl(job_id, owner)
+    report, check_cancelled, save_checkpoint = control.report, control.check_cancelled, control.save_checkpoint
+
+    try:
+        check_cancelled()
+        start_time = datetime.now()
+        resume = _store.load_checkpoint(job_id)
+        report(status=JobStatus.PROCESSING, start_time=start_time, total_files=len(uploads),
+               progress="Reanudando desde checkpoint..." if resume else "Iniciando procesamiento...")
+
+        run_id = run_dir.name
+        run_dir_output = run_dir / "output"
+        run_dir_output.mkdir(parents=True, exist_ok=True)
+
+        run = RunInfo(run_id=run_id, client=client, source_files=[], counts={})
+
+        # Fuentes CSV: archivos subidos, miembros de ZIP y .csv.gz / .csv.zst (se leen como stream, sin extraer)
+        saved_csvs: List[CsvSource] = []
+        upload_warnings: List[str] = []
+        for i, (filename, dest, digest) in enumerate(uploads):
+            check_cancelled()
+            report(current_file=filename, files_processed=i,
+                   progress=f"Preparando archivo {i+1}/{len(uploads)}: {filename}")
+            run.source_files.append(filename)
+
+            try:
+                saved_csvs.extend(upload_sources(filename, dest, digest) or [])
+            except zipfile.BadZipFile:
+                logger.warning(f"⚠️ {filename} ignorado: ZIP inválido")
+                upload_warnings.append(f"{filename}: ZIP inválido")
+            except ValueError as e:
+                logger.warning(f"⚠️ {filename} ignorado: {e}")
+                upload_warnings.append(f"{filename}: {e}")
+
+        logger.info(f"✅ {len(saved_csvs)} archivos CSV listos para procesar")
+
+        # Usar procesador optimizado (paralelo o secuencial según tamaño)
+        processor = ParallelCsvProcessor(cliente=client, out_dir=run_dir_output)
+        report(total_bytes=sum(src.progress_bytes for src in saved_csvs))
+        rate_mark: Optional[tuple] = None  # (instante, filas totales) del último aviso
+
+        def update_progress(filename: str, rows: int, total_files: int):
+            """Callback de progreso: punto de cancelación y aviso (espaciado) a la base"""
+            nonlocal last_report, rate_mark
+            check_cancelled()
+            now = time.monotonic()
+            if rows > 0 and now - last_report < _PROGRESS_INTERVAL:
+                return
+            last_report = now
+            counts = dict(processor.aggregator.counts)
+            total_rows = sum(counts.values())
+            fields: Dict[str, Any] = {"current_file": filename,
+                                      "cache_hits": processor.cache_stats["hits"],
+                                      "cache_misses": processor.cache_stats["misses"],
+                                      "rows": counts,
+                                      "bytes_read": processor.bytes_read,
+                                      "bytes_written": _dir_size(run_dir_output)}
+            if rate_mark is not None and now > rate_mark[0]:
+                fields["rows_per_sec"] = round((total_rows - rate_mark[1]) / (now - rate_mark[0]))
+            rate_mark = (now, total_rows)
+            if rows > 0:
+                fields["progress"] = f"Procesando {filename}: {rows:,} filas"
+            report(**fields)
+
+        nombres, warnings, counts = processor.process_csvs_parallel(
+            saved_csvs,
+            empresas_list,
+            nombre_defecto or client,
+            progress_callback=update_progress,
+            checkpoint_callback=save_checkpoint,
+            resume=resume
+        )
+        check_cancelled()
+        # se recalculan en cada intento (no van en el checkpoint)
+        warnings = upload_warnings + warnings
+
+        run.counts = counts
+        preview = processor.aggregator.preview
+
+        # Generar artifacts
+        report(progress="Generando artifacts...", files_processed=len(uploads),
+               cache_hits=processor.cache_stats["hits"], cache_misses=processor.cache_stats["misses"],
+               rows=dict(counts), bytes_read=processor.bytes_read, bytes_written=_dir_size(run_dir_output))
+        artifacts = []
+        for n in nombres:
+            p = run_dir_output / n
+            artifacts.append(Artifact(name=n, size=p.stat().st_size if p.exists() else 0,
+                                      download_url=f"/api/runs/{run_id}/artifact/{n}"))
+
+        # Guardar manifest
+        (run_dir / "manifest.json").write_text(json.dumps({
+            "run": run.model_dump(),
+            "artifacts": [a.model_dump() for a in artifacts],
+            "warnings": warnings
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        # Completar job
+        result = ProcessResponse(run=run, artifacts=artifacts, preview=preview, warnings=warnings)
+        end_time = datetime.now()
+        elapsed = (end_time - start_time).total_seconds()
+        report(result=result.model_dump(), status=JobStatus.COMPLETED, end_time=end_time,
+               progress=f"✅ Completado en {elapsed:.1f}s: {len(artifacts)} archivos generados")
+        logger.info(f"🎉 Job {job_id} completado en {elapsed:.1f}s")
+
+    except JobInterrupted:
+        logger.info(f"⏸️ Job {job_id} detenido; se reanudará desde su último checkpoint")
+    except JobCancelled:
+        logger.info(f"🛑 Job {job_id} cancelado")
+        shutil.rmtree(run_dir, ignore_errors=True)
+        _store.update_job(job_id, {"status": JobStatus.CANCELLED, "end_time": datetime.now(),
+                                   "progress": "Cancelado"}, owner)
+    except Exception as e:
+        logger.error(f"❌ Error en job {job_id}: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        _store.update_job(job_id, {"status": JobStatus.FAILED, "error": str(e), "end_time": datetime.now()}, owner)
+
+
+def run_conversion(job_id: str, owner: str, run_dir: Path, fmt: str, parts: List[str]):
+    """
+    Convierte partes ya terminadas de un run a XLSX o Parquet (ver convert.py).
+    Cada parte convertida se registra en el manifest en cuanto termina, así
+    una cancelación deja el run consistente: lo convertido queda, lo que
+    estaba a medias se borra. El run nunca se borra. Sin checkpoint: si el
+    job se interrumpe, quien lo retome convierte todo de nuevo.
+    """
+    control = _JobControl(job_id, owner)
+    report, check_cancelled = control.report, control.check_cancelled
+    out_dir = run_dir / "output"
+    artifacts: List[Artifact] = []
+    warnings: List[str] = []
+    rows: Dict[str, int] = {}
+    try:
+        check_cancelled()
+        start_time = datetime.now()
+        sizes = {p: (out_dir / p).stat().st_size for p in parts}
+        report(status=JobStatus.PROCESSING, start_time=start_time, total_files=len(parts), files_processed=0,
+               total_bytes=sum(sizes.values()), bytes_read=0, bytes_written=0, rows={},
+               progress=f"Convirtiendo {len(parts)} partes a {fmt.upper()}...")
+        manifest: Dict[str, Any] = {}
+        done: List[str] = []
+
+        def on_part(result):
+            nonlocal manifest
+            part, output, n, error = result
+            done.append(part)
+            if error is not None:
+                logger.warning(f"⚠️ {part}: no se pudo convertir: {error}")
+                warnings.append(f"{part}: no se pudo convertir a {fmt}: {error}")
+            else:
+                manifest, nuevos = register_artifacts(run_dir, [output])
+                artifacts.extend(nuevos)
+                rows[output] = n
+                logger.info(f"🔁 {part} → {output} ({n:,} filas)")
+            report(files_processed=len(done), current_file=part, rows=dict(rows),
+                   bytes_read=sum(sizes[p] for p in done), bytes_written=sum(a.size for a in artifacts),
+                   progress=f"Convertidas {len(done)}/{len(parts)} partes a {fmt.upper()}")
+
+        convert_parts(out_dir, parts, fmt, on_part, poll=check_cancelled)
+        check_cancelled()
+        if not artifacts:
+            raise ValueError("; ".join(warnings) or "No se convirtió ninguna parte")
+
+        run = RunInfo(**manifest["run"])
+        result = ProcessResponse(run=run, artifacts=artifacts, preview=None, warnings=warnings)
+        end_time = datetime.now()
+        elapsed = (end_time - start_time).total_seconds()
+        report(result=result.model_dump(), status=JobStatus.COMPLETED, end_time=end_time,
+               progress=f"✅ {len(artifacts)} partes convertidas a {fmt.upper()} en {elapsed:.1f}s")
+        logger.info(f"🎉 Conversión {job_id} completada en {elapsed:.1f}s")
+
+    except JobInterrupted:
+        logger.info(f"⏸️ Conversión {job_id} detenida; se repetirá al retomarla")
+    except JobCancelled:
+        logger.info(f"🛑 Conversión {job_id} cancelada ({len(artifacts)} partes ya convertidas)")
+        _store.update_job(job_id, {"status": JobStatus.CANCELLED, "end_time": datetime.now(),
+                                   "progress": f"Cancelado ({len(artifacts)} partes ya convertidas)"}, owner)
+    except Exception as e:
+        logger.error(f"❌ Error en conversión {job_id}: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        _store.update_job(job_id, {"status": JobStatus.FAILED, "error": str(e), "end_time": datetime.now()}, owner)
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.iterdir() if p.is_file())
+
+
+class JobExecutor:
+    """Pool de procesos para jobs + hilo que toma jobs de la cola compartida y renueva sus leases."""
+
+    def __init__(self, store: JobStore, workers: int, max_queue: int):
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        # host:pid identifica a la instancia; el sufijo distingue un reinicio que reusa el pid
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._ctx = multiprocessing.get_context("spawn")  # el proceso del API tiene hilos: no usar fork
+        self._stop_event = self._ctx.Event()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._futures: Dict[str, Future] = {}
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="job-dispatch", daemon=True)
+
+    def start(self):
+        """Libera los leases de instancias muertas de este host y empieza a tomar jobs."""
+        self._expire_dead_local_owners()
+        self._dispatcher.start()
+        logger.info(f"📥 Instancia {self.owner} tomando jobs de {self.store.path}")
+
+    def submit(
+        self,
+        job: ProcessJob,
+        run_dir: Path,
+        uploads: List[Upload],
+        empresas_list: List[str],
+        nombre_defecto: Optional[str],
+        convert: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Encola el job en la base (o lanza JobQueueFull) y devuelve su lugar en
+        la cola: jobs y bytes por delante y el inicio estimado. Con `convert`
+        ({"format", "parts"}) es una conversión de partes de un run terminado.
+        """
+        stats = self.check_capacity(job.client)
+        self.store.add_job(job, run_dir, uploads, empresas_list, nombre_defecto, convert)
+        self._wake.set()
+        wait = self._estimate_wait(stats, stats.queued_bytes)
+        return {"jobs_ahead": stats.waiting, "bytes_ahead": stats.queued_bytes,
+                "estimated_start": (datetime.now() + timedelta(seconds=wait)).isoformat(timespec="seconds")}
+
+    def check_capacity(self, client: str) -> QueueStats:
+        """Admisión: lanza JobQueueFull si la cola (total o del cliente) está llena."""
+        stats = self.store.queue_stats(client)
+        if stats.waiting >= self.max_queue:
+            message = f"{stats.waiting} jobs en espera"
+        elif stats.waiting_client >= settings.JOB_QUEUE_MAX_PER_CLIENT:
+            message = f"{stats.waiting_client} jobs de '{client}' en espera"
+        else:
+            return stats
+        # se libera un lugar cuando termina algo de lo que corre: reintentar entonces
+        retry_after = min(max(math.ceil(self._estimate_wait(stats, 0)), 5), 600)
+        wait = self._estimate_wait(stats, stats.queued_bytes)
+        raise JobQueueFull(message, retry_after, datetime.now() + timedelta(seconds=wait))
+
+    def _estimate_wait(self, stats: QueueStats, bytes_ahead: int) -> float:
+        """
+        Segundos hasta que empezaría un job con `bytes_ahead` bytes en cola
+        por delante: lo que falta de los jobs en curso más esos bytes,
+        repartido entre los jobs que corren a la vez, al throughput medido en
+        los últimos jobs (o JOB_ESTIMATE_MB_PER_SEC si todavía no hay).
+        """
+        slots = settings.JOB_MAX_RUNNING or max(self.workers, stats.running)
+        if stats.running < slots and bytes_ahead == 0:
+            return 0.0
+        rate = stats.throughput or settings.JOB_ESTIMATE_MB_PER_SEC * 1024 * 1024
+        return (stats.remaining_bytes + bytes_ahead) / (rate * slots)
+
+    def cancel(self, job_id: str) -> Optional[JobStatus]:
+        """
+        Cancela el job: si nadie lo está corriendo queda CANCELLED (y se borra
+        el run); si corre en esta u otra instancia, su worker aborta al verlo.
+        """
+        outcome = self.store.request_cancel(job_id)
+        if outcome is None:
+            return None
+        status, run_dir = outcome
+        # un run terminado (con manifest) no se borra: es una conversión de sus partes
+        if status == JobStatus.CANCELLED and not (run_dir / "manifest.json").exists():
+            shutil.rmtree(run_dir, ignore_errors=True)
+        return status
+
+    def shutdown(self):
+        """Detiene los jobs de esta instancia y los devuelve a la cola para que otra (o el próximo arranque) los retome."""
+        with self._lock:
+            self._stopping = True
+            running = list(self._futures)
+            pool, self._pool = self._pool, None
+        self._wake.set()
+        self._stop_event.set()
+        if pool is not None:
+            pool.shutdown(wait=True)  # sin el lock: los callbacks de fin de job lo toman
+        if self._dispatcher.is_alive():
+            self._dispatcher.join(timeout=5)
+        if running:
+            self.store.release(self.owner, running)
+            logger.info(f"↩️ {len(running)} job(s) devueltos a la cola")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._ctx, initializer=_init_worker,
+                                             initargs=(self.store.path, self._stop_event))
+        return self._pool
+
+    def _dispatch(self):
+        """Toma jobs mientras haya workers libres y renueva los leases cada JOB_HEARTBEAT_SECONDS."""
+        last_heartbeat = 0.0
+        while not self._stopping:
+            try:
+                if time.monotonic() - last_heartbeat >= settings.JOB_HEARTBEAT_SECONDS:
+                    last_heartbeat = time.monotonic()
+                    self._heartbeat()
+                claimed = None
+                if len(self._futures) < self.workers:
+                    claimed = self.store.claim(self.owner, settings.JOB_LEASE_SECONDS, settings.JOB_MAX_ATTEMPTS,
+                                               settings.JOB_MAX_RUNNING, settings.JOB_MAX_RUNNING_MB * 1024 * 1024)
+                if claimed is not None:
+                    self._start(claimed)
+                    continue
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Error accediendo a la cola de jobs: {e}")
+            self._wake.wait(settings.JOB_POLL_SECONDS)
+            self._wake.clear()
+
+    def _heartbeat(self):
+        with self._lock:
+            running = list(self._futures)
+        if not running:
+            return
+        for job_id in self.store.renew(self.owner, running, settings.JOB_LEASE_SECONDS):
+            logger.warning(f"⚠️ Lease del job {job_id} perdido: otra instancia lo retomará")
+
+    def _start(self, claimed: ClaimedJob):
+        job, run_dir, request = claimed
+        convert = request.get("convert")
+        if not (run_dir / ("manifest.json" if convert else "uploads")).exists():
+            error = "el run ya no existe" if convert else "los archivos subidos ya no existen"
+            self.store.update_job(job.job_id, {"status": JobStatus.FAILED, "end_time": datetime.now(),
+                                               "error": f"Run perdido: {error}"}, self.owner)
+            return
+        if job.status == JobStatus.PROCESSING:
+            logger.info(f"♻️ Retomando job {job.job_id} desde su último checkpoint")
+        if convert:
+            args = (run_conversion, job.job_id, self.owner, run_dir, convert["format"], convert["parts"])
+        else:
+            args = (run_job, job.job_id, self.owner, run_dir, request["uploads"], job.client,
+                    request["empresas"], request["nombre_defecto"])
+        with self._lock:
+            if self._stopping:
+                self.store.release(self.owner, [job.job_id])
+                return
+            try:
+                future = self._get_pool().submit(*args)
+            except BrokenProcessPool:
+                # un worker murió (p. ej. OOM): el pool queda inutilizable, se recrea
+                self._pool = None
+                future = self._get_pool().submit(*args)
+            self._futures[job.job_id] = future
+        future.add_done_callback(lambda f, job_id=job.job_id: self._on_done(job_id, f))
+
+    def _on_done(self, job_id: str, future: Future):
+        with self._lock:
+            self._futures.pop(job_id, None)
+            if self._stopping:
+                return  # al apagar, los jobs cortados se devuelven a la cola
+        self._wake.set()
+        if not future.cancelled() and future.exception() is not None:
+            # run_job captura sus errores: esto es la muerte del worker
+            try:
+                self.store.update_job(job_id, {"status": JobStatus.FAILED, "end_time": datetime.now(),
+                                               "error": f"worker de procesamiento terminado: {future.exception()}"},
+                                      self.owner)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ No se pudo guardar el estado del job {job_id}: {e}")
+
+    def _expire_dead_local_owners(self):
+        """
+        Un reinicio (crash, --reload) deja leases a nombre de un proceso que ya
+        no existe en este host: se vencen ya en vez de esperar JOB_LEASE_SECONDS.
+        """
+        host = socket.gethostname()
+        for owner in self.store.lease_owners(f"{host}:"):
+            try:
+                pid = int(owner.split(":")[1])
+            except (IndexError, ValueError):
+                continue
+            if owner != self.owner and (pid == os.getpid() or not _pid_alive(pid)):
+                self.store.expire_leases(owner)
+                logger.info(f"♻️ Leases de {owner} liberados (proceso terminado)")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
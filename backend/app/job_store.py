@@ -0,0 +1,345 @@
+"""
+Cola y estado de jobs en SQLite (RUNS_DIR/jobs.sqlite3).
+
+La base vive en el volumen compartido (backend_data), así que varias
+instancias del backend (workers de uvicorn o contenedores detrás de un
+balanceador) usan la misma cola: cualquiera acepta uploads (add_job),
+responde el estado de cualquier job (get_job) y toma jobs pendientes con
+claim(). Tomar un job es un lease: la instancia lo renueva con heartbeats
+mientras el job corre; si la instancia muere, el lease vence y otra lo toma
+y lo continúa desde su último checkpoint.
+
+Cada escritura de un worker (estado y checkpoints) va condicionada a que
+siga siendo el dueño del lease, así un worker que lo perdió no pisa al
+nuevo dueño. La base debe estar en un disco local del host (o un volumen de
+Docker): SQLite no garantiza los locks sobre NFS/SMB.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import json
+import sqlite3
+import threading
+import time
+
+from .models import JobStatus, ProcessJob, ProcessResponse
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id           TEXT PRIMARY KEY,
+    run_dir          TEXT NOT NULL,
+    status           TEXT NOT NULL,
+    job              TEXT NOT NULL,             -- ProcessJob (JSON)
+    request          TEXT NOT NULL,             -- uploads / empresas / nombre_defecto (JSON)
+    updated_at       REAL NOT NULL,
+    created_at       REAL NOT NULL DEFAULT 0,
+    lease_owner      TEXT,                      -- instancia que corre el job
+    lease_expires    REAL NOT NULL DEFAULT 0,   -- epoch; vencido = el job se puede volver a tomar
+    attempts         INTEGER NOT NULL DEFAULT 0, -- veces que se tomó sin terminar limpio
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    result           TEXT,                      -- ProcessResponse (JSON), aparte del estado liviano
+    client           TEXT NOT NULL DEFAULT '',  -- para el reparto justo entre clientes
+    bytes            INTEGER NOT NULL DEFAULT 0, -- tamaño de los uploads
+    run_seconds      REAL NOT NULL DEFAULT 0,   -- duración de los jobs completados (estimaciones)
+    claimed_at       REAL NOT NULL DEFAULT 0    -- última vez que una instancia tomó el job
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_client ON jobs (client, status);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    job_id     TEXT PRIMARY KEY,
+    state      TEXT NOT NULL,   -- estado de ParallelCsvProcessor (JSON)
+    updated_at REAL NOT NULL
+);
+"""
+
+_OPEN = (JobStatus.PENDING.value, JobStatus.PROCESSING.value)
+# jobs sin terminar que nadie corre / que una instancia corre (parámetros: *_OPEN, ahora)
+_WAITING = "status IN (?, ?) AND (lease_owner IS NULL OR lease_expires < ?)"
+_RUNNING = "status IN (?, ?) AND lease_owner IS NOT NULL AND lease_expires >= ?"
+_THROUGHPUT_SAMPLE = 20  # jobs completados recientes con los que se mide el throughput
+_TERMINAL = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+# (nombre, ruta, sha256) de cada archivo subido
+Upload = Tuple[str, Path, str]
+# job tomado de la cola: (job, run_dir, request) con los uploads como Upload
+ClaimedJob = Tuple[ProcessJob, Path, Dict[str, Any]]
+
+
+class QueueStats(NamedTuple):
+    """Foto de la cola compartida para admisión y estimaciones."""
+    waiting: int                 # jobs en cola (todas las instancias)
+    waiting_client: int          # de ellos, los del cliente consultado
+    queued_bytes: int            # bytes de los jobs en cola
+    running: int                 # jobs corriendo (todas las instancias)
+    remaining_bytes: int         # bytes que les faltan leer a los jobs en curso
+    throughput: Optional[float]  # bytes/s de un job, medido en los últimos completados
+
+
+class JobStore:
+    """Acceso a la base de jobs; una instancia por proceso."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transacción con el lock de escritura tomado desde el inicio (entre procesos)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def add_job(
+        self,
+        job: ProcessJob,
+        run_dir: Path,
+        uploads: List[Upload],
+        empresas: List[str],
+        nombre_defecto: Optional[str],
+        convert: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Encola un job nuevo (queda PENDING hasta que una instancia lo tome).
+        Con `convert` ({"format", "parts"}) el job no procesa uploads: convierte
+        esas partes de run_dir/output.
+        """
+        request = json.dumps({
+            "uploads": [[name, str(path), digest] for name, path, digest in uploads],
+            "empresas": empresas,
+            "nombre_defecto": nombre_defecto,
+            "convert": convert,
+        }, ensure_ascii=False)
+        if convert:
+            paths = [run_dir / "output" / name for name in convert["parts"]]
+        else:
+            paths = [path for _, path, _ in uploads]
+        size = sum(path.stat().st_size for path in paths if path.exists())
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, run_dir, status, job, request, updated_at, created_at, client, bytes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.job_id, str(run_dir), job.status.value, job.model_dump_json(), request, now, now,
+                 job.client, size))
+
+    def get_job(self, job_id: str, include_result: bool = False) -> Optional[ProcessJob]:
+        """El job sin su resultado (preview incluida), salvo que se pida."""
+        with self._lock:
+            row = self._conn.execute(f"SELECT job, {'result' if include_result else 'NULL'} FROM jobs WHERE job_id = ?",
+                                     (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = ProcessJob.model_validate_json(row[0])
+        if row[1] is not None:
+            job.result = ProcessResponse.model_validate_json(row[1])
+        return job
+
+    def get_result(self, job_id: str) -> Optional[Tuple[JobStatus, Optional[str]]]:
+        """(estado, ProcessResponse como JSON o None) sin deserializarlo."""
+        with self._lock:
+            row = self._conn.execute("SELECT status, result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return (JobStatus(row[0]), row[1]) if row else None
+
+    def update_job(self, job_id: str, fields: Dict[str, Any], owner: Optional[str] = None) -> bool:
+        """
+        Aplica `fields` sobre el ProcessJob guardado. Con `owner`, solo si esa
+        instancia sigue teniendo el lease (devuelve False si lo perdió).
+        Al llegar a un estado final se libera el lease y se borra el checkpoint.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT job, lease_owner FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None or (owner is not None and row[1] != owner):
+                return False
+            data = {**json.loads(row[0]), **fields}
+            result = data.pop("result", None)
+            if result is not None:
+                result = ProcessResponse.model_validate(result).model_dump_json()
+            job = ProcessJob.model_validate(data)
+            if job.status in _TERMINAL:
+                run_seconds = 0.0
+                if job.status == JobStatus.COMPLETED and job.start_time and job.end_time:
+                    run_seconds = (job.end_time - job.start_time).total_seconds()
+                conn.execute(
+                    "UPDATE jobs SET status = ?, job = ?, result = COALESCE(?, result), updated_at = ?, "
+                    "lease_owner = NULL, lease_expires = 0, run_seconds = ? WHERE job_id = ?",
+                    (job.status.value, job.model_dump_json(), result, time.time(), run_seconds, job_id))
+                conn.execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+            else:
+                conn.execute("UPDATE jobs SET status = ?, job = ?, result = COALESCE(?, result), updated_at = ? "
+                             "WHERE job_id = ?", (job.status.value, job.model_dump_json(), result, time.time(), job_id))
+            return True
+
+    def queue_stats(self, client: str = "") -> QueueStats:
+        with self._lock:
+            now = time.time()
+            waiting, queued_bytes, waiting_client = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(bytes), 0), COALESCE(SUM(client = ?), 0) FROM jobs WHERE {_WAITING}",
+                (client, *_OPEN, now)).fetchone()
+            running, remaining = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(MAX(bytes - COALESCE(json_extract(job, '$.bytes_read'), 0), 0)), 0) "
+                f"FROM jobs WHERE {_RUNNING}", (*_OPEN, now)).fetchone()
+            done_bytes, done_seconds = self._conn.execute(
+                "SELECT SUM(bytes), SUM(run_seconds) FROM (SELECT bytes, run_seconds FROM jobs "
+                "WHERE status = ? AND run_seconds > 0 ORDER BY updated_at DESC LIMIT ?)",
+                (JobStatus.COMPLETED.value, _THROUGHPUT_SAMPLE)).fetchone()
+        throughput = done_bytes / done_seconds if done_bytes and done_seconds else None
+        return QueueStats(waiting, waiting_client, queued_bytes, running, remaining, throughput)
+
+    def claim(
+        self,
+        owner: str,
+        lease_seconds: float,
+        max_attempts: int,
+        max_running: int = 0,
+        max_running_bytes: int = 0
+    ) -> Optional[ClaimedJob]:
+        """
+        Toma el siguiente job en cola (pendiente o con el lease vencido) y lo
+        deja a nombre de `owner` por `lease_seconds`.
+
+        Reparto justo: primero los clientes con menos jobs corriendo (en todas
+        las instancias); entre ellos, el que hace más que no recibe un turno
+        (round-robin), y dentro del cliente el job más antiguo. Así la corrida
+        gigante de un cliente no deja esperando a las chicas de los demás.
+        Presupuesto global: no se toma nada con `max_running` jobs corriendo,
+        ni un job que lleve los bytes en proceso por encima de
+        `max_running_bytes` (salvo que no corra ninguno). 0 = sin límite.
+
+        Los jobs que ya se tomaron `max_attempts` veces sin terminar (p. ej.
+        un archivo que tumba al worker) se marcan FAILED en vez de volver a correr.
+        """
+        while True:
+            with self._transaction() as conn:
+                now = time.time()
+                running, running_bytes = conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM jobs WHERE {_RUNNING}", (*_OPEN, now)).fetchone()
+                if max_running and running >= max_running:
+                    return None
+                row = conn.execute(
+                    f"SELECT job_id, job, run_dir, request, attempts, bytes FROM jobs AS j WHERE {_WAITING} "
+                    f"ORDER BY (SELECT COUNT(*) FROM jobs WHERE client = j.client AND {_RUNNING}), "
+                    "(SELECT MAX(claimed_at) FROM jobs WHERE client = j.client), created_at LIMIT 1",
+                    (*_OPEN, now, *_OPEN, now)).fetchone()
+                if row is None:
+                    return None
+                job_id, data, run_dir, request, attempts, size = row
+                if max_running_bytes and running and running_bytes + size > max_running_bytes:
+                    return None  # espera su turno: saltearlo dejaría a los jobs grandes sin correr nunca
+                job = ProcessJob.model_validate_json(data)
+                if attempts < max_attempts:
+                    conn.execute("UPDATE jobs SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                                 "claimed_at = ? WHERE job_id = ?", (owner, now + lease_seconds, now, job_id))
+                    req = json.loads(request)
+                    req["uploads"] = [(name, Path(path), digest) for name, path, digest in req["uploads"]]
+                    return job, Path(run_dir), req
+                job.status = JobStatus.FAILED
+                job.error = f"Job abandonado: se interrumpió {attempts} veces sin terminar"
+                job.end_time = datetime.now()
+                conn.execute(
+                    "UPDATE jobs SET status = ?, job = ?, updated_at = ?, lease_owner = NULL, lease_expires = 0 "
+                    "WHERE job_id = ?", (job.status.value, job.model_dump_json(), now, job_id))
+                conn.execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+
+    def renew(self, owner: str, job_ids: List[str], lease_seconds: float) -> List[str]:
+        """Heartbeat: extiende los leases de `owner`; devuelve los jobs sin terminar cuyo lease ya no es suyo."""
+        lost = []
+        with self._transaction() as conn:
+            expires = time.time() + lease_seconds
+            for job_id in job_ids:
+                cur = conn.execute("UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND lease_owner = ?",
+                                   (expires, job_id, owner))
+                if cur.rowcount == 0 and conn.execute("SELECT 1 FROM jobs WHERE job_id = ? AND status IN (?, ?)",
+                                                      (job_id, *_OPEN)).fetchone():
+                    lost.append(job_id)  # (un job que acaba de terminar ya no tiene lease)
+        return lost
+
+    def release(self, owner: str, job_ids: List[str]):
+        """
+        Devuelve a la cola los jobs de `owner` que quedaron sin terminar
+        (apagado ordenado): otra instancia los toma sin esperar a que venza
+        el lease, y la interrupción no cuenta como intento fallido.
+        """
+        with self._transaction() as conn:
+            for job_id in job_ids:
+                conn.execute(
+                    "UPDATE jobs SET lease_owner = NULL, lease_expires = 0, attempts = MAX(attempts - 1, 0) "
+                    "WHERE job_id = ? AND lease_owner = ? AND status IN (?, ?)", (job_id, owner, *_OPEN))
+
+    def lease_owners(self, prefix: str) -> List[str]:
+        """Dueños de leases vigentes cuyo identificador empieza con `prefix`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT lease_owner FROM jobs WHERE lease_owner IS NOT NULL AND lease_expires >= ?",
+                (time.time(),)).fetchall()
+        return [row[0] for row in rows if row[0].startswith(prefix)]
+
+    def expire_leases(self, owner: str):
+        """Vence ya los leases de una instancia que se sabe muerta."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET lease_expires = 0 WHERE lease_owner = ?", (owner,))
+
+    def lease(self, job_id: str) -> Tuple[Optional[str], bool]:
+        """(dueño del lease, cancelación pedida) del job."""
+        with self._lock:
+            row = self._conn.execute("SELECT lease_owner, cancel_requested FROM jobs WHERE job_id = ?",
+                                     (job_id,)).fetchone()
+        return (row[0], bool(row[1])) if row else (None, False)
+
+    def request_cancel(self, job_id: str) -> Optional[Tuple[JobStatus, Path]]:
+        """
+        Cancela el job: si nadie lo está corriendo pasa a CANCELLED en el acto;
+        si no, se marca la cancelación y el worker dueño aborta al verla.
+        Devuelve (estado resultante, run_dir) o None si el job no existe.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT job, run_dir, lease_owner, lease_expires FROM jobs WHERE job_id = ?",
+                               (job_id,)).fetchone()
+            if row is None:
+                return None
+            data, run_dir, lease_owner, lease_expires = row
+            job = ProcessJob.model_validate_json(data)
+            now = time.time()
+            if job.status in _TERMINAL:
+                return job.status, Path(run_dir)
+            if lease_owner is not None and lease_expires >= now:
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+                return job.status, Path(run_dir)
+            job.status = JobStatus.CANCELLED
+            job.end_time = datetime.now()
+            job.progress = "Cancelado"
+            conn.execute(
+                "UPDATE jobs SET status = ?, job = ?, updated_at = ?, lease_owner = NULL, lease_expires = 0, "
+                "cancel_requested = 1 WHERE job_id = ?", (job.status.value, job.model_dump_json(), now, job_id))
+            conn.execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+            return job.status, Path(run_dir)
+
+    def save_checkpoint(self, job_id: str, state: Dict[str, Any], owner: str) -> bool:
+        """Guarda el checkpoint si `owner` sigue teniendo el lease del job."""
+        data = json.dumps(state, ensure_ascii=False)
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (job_id, state, updated_at) "
+                "SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM jobs WHERE job_id = ? AND lease_owner = ?)",
+                (job_id, data, time.time(), job_id, owner))
+            return cur.rowcount > 0
+
+    def load_checkpoint(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM checkpoints WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,11 +1,12 @@
-from fastapi import FastAPI, UploadFile, File, Form, Body, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, Form, Body, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 from uuid import uuid4
 import asyncio
+import hashlib
 import json
 import shutil
 import time
@@ -20,17 +21,19 @@ from .settings import settings
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 from .models import RunInfo, ProcessResponse, Artifact, IngestResult
-from .parser import parse_csv_file
-from .excel_outputs import guardar_cuatro_excels
-from .excel_stream import ExcelAggregator
 from .ingest import ingest_run_folder
 from .parser_stream import stream_tables
-from .csv_stream import CsvAggregator
+from .csv_stream import CsvAggregator, PARQUET_AVAILABLE
+from .convert import FORMATS, convertible, output_name
+from .excel_stream import XLSX_MAX_ROWS
 from .models import JobStatus, ProcessJob
 from .parallel_processor import ParallelCsvProcessor
+from .sources import CsvSource, stream_source_tables, upload_sources
+from .job_executor import JobExecutor, JobQueueFull
+from .job_store import JobStore
 
-# Job storage en memoria (en producción usar Redis o DB)
-active_jobs: Dict[str, ProcessJob] = {}
+# Cola y estado de los jobs en RUNS_DIR/jobs.sqlite3, compartida por todas las instancias
+job_executor: Optional[JobExecutor] = None
 
 app = FastAPI(title="Qualys Hardening Backend", default_response_class=JSONResponse)
 
@@ -68,100 +71,22 @@ BASE_DIR = Path(settings.OUTPUT_BASE_DIR).resolve()
 RUNS_DIR = BASE_DIR / "runs"
 RUNS_DIR.mkdir(parents=True, exist_ok=True)
 
-async def process_files_background(job_id: str, files_data: List[tuple], client: str, empresas_list: List[str], nombre_defecto: str):
-    """Procesa archivos en background y actualiza el job status"""
-    job = active_jobs[job_id]
-    
-    try:
-        job.status = JobStatus.PROCESSING
-        job.start_time = datetime.now()
-        
-        run_id = uuid4().hex
-        run_dir = RUNS_DIR / run_id
-        run_dir_upload = run_dir / "uploads"  
-        run_dir_output = run_dir / "output"
-        run_dir_upload.mkdir(parents=True, exist_ok=True)
-        run_dir_output.mkdir(parents=True, exist_ok=True)
-
-        run = RunInfo(run_id=run_id, client=client, source_files=[], counts={})
-        
-        # Guardar archivos subidos (optimizado con buffer)
-        saved_csvs: List[Path] = []
-        job.total_files = len(files_data)
-        
-        logger.info(f"💾 Guardando {len(files_data)} archivos...")
-        for i, (filename, content) in enumerate(files_data):
-            job.current_file = filename
-            job.files_processed = i
-            job.progress = f"Guardando archivo {i+1}/{len(files_data)}: {filename}"
-            
-            run.source_files.append(filename)
-            dest = run_dir_upload / filename
-            
-            # Guardar contenido del archivo con buffer grande
-            with dest.open("wb", buffering=settings.WRITE_BUFFER_SIZE) as f:
-                f.write(content)
-            
-            if filename.lower().endswith(".zip"):
-                try:
-                    csvs = _collect_csvs_from_zip(dest, run_dir_upload)
-                    saved_csvs.extend(csvs)
-                except zipfile.BadZipFile:
-                    pass
-            elif filename.lower().endswith(".csv"):
-                saved_csvs.append(dest)
-
-        logger.info(f"✅ {len(saved_csvs)} archivos CSV listos para procesar")
-
-        # Usar procesador optimizado (paralelo o secuencial según tamaño)
-        processor = ParallelCsvProcessor(cliente=client, out_dir=run_dir_output)
-        
-        def update_progress(filename: str, rows: int, total_files: int):
-            """Callback para actualizar progreso durante procesamiento"""
-            job.current_file = filename
-            if rows > 0:
-                job.progress = f"Procesando {filename}: {rows:,} filas"
-        
-        nombres, warnings, counts = processor.process_csvs_parallel(
-            saved_csvs, 
-            empresas_list, 
-            nombre_defecto or client,
-            progress_callback=update_progress
-        )
-        
-        run.counts = counts
-        preview = processor.aggregator.preview
-        
-        # Generar artifacts
-        job.progress = "Generando artifacts..."
-        artifacts = []
-        for n in nombres:
-            p = run_dir_output / n
-            artifacts.append(Artifact(name=n, size=p.stat().st_size if p.exists() else 0,
-                                      download_url=f"/api/runs/{run_id}/artifact/{n}"))
-
-        # Guardar manifest
-        (run_dir / "manifest.json").write_text(json.dumps({
-            "run": run.model_dump(),
-            "artifacts": [a.model_dump() for a in artifacts],
-            "warnings": warnings
-        }, ensure_ascii=False, indent=2), encoding="utf-8")
-
-        # Completar job
-        result = ProcessResponse(run=run, artifacts=artifacts, preview=preview, warnings=warnings)
-        job.result = result
-        job.status = JobStatus.COMPLETED
-        job.end_time = datetime.now()
-        elapsed = (job.end_time - job.start_time).total_seconds()
-        job.progress = f"✅ Completado en {elapsed:.1f}s: {len(artifacts)} archivos generados"
-        logger.info(f"🎉 Job {job_id} completado en {elapsed:.1f}s")
-        
-    except Exception as e:
-        logger.error(f"❌ Error en job {job_id}: {str(e)}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        job.status = JobStatus.FAILED
-        job.error = str(e)
-        job.end_time = datetime.now()
+def _get_job_executor() -> JobExecutor:
+    global job_executor
+    if job_executor is None:
+        store = JobStore(RUNS_DIR / "jobs.sqlite3")
+        job_executor = JobExecutor(store, settings.JOB_WORKERS, settings.JOB_QUEUE_MAX)
+    return job_executor
+
+@app.on_event("startup")
+def start_job_executor():
+    """Empieza a tomar jobs de la cola compartida (incluidos los que otra instancia dejó a medias)"""
+    _get_job_executor().start()
+
+@app.on_event("shutdown")
+def shutdown_job_executor():
+    if job_executor is not None:
+        job_executor.shutdown()
 
 @app.get("/")
 def root():
@@ -171,22 +96,46 @@ def root():
 def health():
     return {"ok": True}
 
-def _save_upload(u: UploadFile, dest: Path):
+async def _save_upload(u: UploadFile, dest: Path) -> Tuple[int, str]:
+    """
+    Copia el upload a disco por bloques de UPLOAD_CHUNK_BYTES (las escrituras
+    corren fuera del event loop) calculando el SHA-256 en el camino.
+    La memoria queda acotada a un bloque sin importar el tamaño del archivo.
+    Devuelve (bytes, sha256).
+    """
     dest.parent.mkdir(parents=True, exist_ok=True)
-    with dest.open("wb") as f:
-        shutil.copyfileobj(u.file, f)
-
-def _collect_csvs_from_zip(zip_path: Path, dst_dir: Path) -> List[Path]:
-    paths = []
-    with zipfile.ZipFile(zip_path, "r") as z:
-        for name in z.namelist():
-            if name.lower().endswith(".csv") and not name.endswith("/"):
-                out = dst_dir / Path(name).name
-                out.parent.mkdir(parents=True, exist_ok=True)
-                with z.open(name) as src, out.open("wb") as f:
-                    shutil.copyfileobj(src, f)
-                paths.append(out)
-    return paths
+    h = hashlib.sha256()
+    size = 0
+    f = await asyncio.to_thread(dest.open, "wb", buffering=settings.WRITE_BUFFER_SIZE)
+    try:
+        while True:
+            chunk = await u.read(settings.UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            h.update(chunk)
+            size += len(chunk)
+            await asyncio.to_thread(f.write, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+        await u.close()
+    return size, h.hexdigest()
+
+@app.middleware("http")
+async def admit_uploads(request: Request, call_next):
+    """
+    Admisión de /api/process-async antes de leer el cuerpo: Starlette recibe
+    todo el multipart antes de llamar al endpoint, así que la cola se revisa
+    acá, solo con los headers. El cliente viene en ?client= (el del
+    formulario se conoce recién con el cuerpo); sin él solo se revisa el
+    límite total.
+    """
+    if request.method == "POST" and request.url.path == "/api/process-async":
+        try:
+            await asyncio.to_thread(_get_job_executor().check_capacity, request.query_params.get("client", ""))
+        except JobQueueFull as e:
+            exc = _queue_full(e)
+            return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers)
+    return await call_next(request)
 
 @app.post("/api/process-async")
 async def process_files_async(
@@ -195,19 +144,29 @@ async def process_files_async(
     empresas: Optional[str] = Form(None),
     nombre_defecto: Optional[str] = Form(None)
 ):
-    """Inicia procesamiento asíncrono y retorna job_id inmediatamente"""
+    """
+    Inicia procesamiento asíncrono y retorna job_id inmediatamente.
+    La admisión previa a la subida la hace admit_uploads(); submit() vuelve
+    a revisar la cola (por cliente, con el del formulario) al encolar.
+    """
     start_time = time.time()
     logger.info(f"🚀 Iniciando procesamiento asíncrono de {len(files)} archivos para cliente '{client}'")
+    executor = _get_job_executor()
     
     # Crear job_id único
     job_id = uuid4().hex
+    run_id = uuid4().hex
+    run_dir = RUNS_DIR / run_id
+    run_dir_upload = run_dir / "uploads"
     
-    # Leer archivos en memoria
-    files_data = []
+    # Guardar archivos en disco por bloques (sin cargarlos en memoria)
+    uploads: List[Tuple[str, Path, str]] = []
     for file in files:
-        content = await file.read()
-        files_data.append((file.filename, content))
-        logger.info(f"📁 Archivo leído: {file.filename} ({len(content):,} bytes)")
+        filename = Path(file.filename).name
+        dest = run_dir_upload / filename
+        size, digest = await _save_upload(file, dest)
+        uploads.append((filename, dest, digest))
+        logger.info(f"📁 Archivo guardado: {filename} ({size:,} bytes, sha256 {digest[:12]})")
     
     empresas_list = [e.strip() for e in (empresas or "").split(",")] if empresas else []
     
@@ -225,31 +184,37 @@ async def process_files_async(
         created_at=datetime.now()
     )
     
-    active_jobs[job_id] = job
-    
-    # Lanzar procesamiento en background
-    asyncio.create_task(process_files_background(job_id, files_data, client, empresas_list, nombre_defecto))
+    # Encolar: lo toma la primera instancia con un worker libre (fuera del event loop)
+    try:
+        queue = await asyncio.to_thread(executor.submit, job, run_dir, uploads, empresas_list, nombre_defecto)
+    except JobQueueFull as e:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        raise _queue_full(e)
     
     setup_time = time.time() - start_time
     logger.info(f"✅ Job {job_id} iniciado en {setup_time:.2f}s")
     
-    return {"job_id": job_id, "status": "started", "message": "Procesamiento iniciado"}
+    return {"job_id": job_id, "status": "started", "message": "Procesamiento iniciado", "queue": queue}
+
+def _queue_full(e: JobQueueFull) -> HTTPException:
+    """429 con el tiempo sugerido para reintentar (Retry-After) y el inicio estimado si se encolara ahora"""
+    return HTTPException(
+        status_code=429,
+        detail={"message": f"Cola de procesamiento llena: {e}", "retry_after": e.retry_after,
+                "estimated_start": e.estimated_start.isoformat(timespec="seconds")},
+        headers={"Retry-After": str(e.retry_after)}
+    )
 
 @app.get("/api/jobs/{job_id}/status")
 async def get_job_status(job_id: str):
-    """Obtiene el estado actual de un job"""
-    if job_id not in active_jobs:
+    """Obtiene el estado actual de un job (corra en esta instancia o en otra)"""
+    job = await asyncio.to_thread(_get_job_executor().store.get_job, job_id, True)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job no encontrado")
     
-    job = active_jobs[job_id]
-    
     response = {
         "job_id": job_id,
-        "status": job.status.value,
-        "progress": job.progress,
-        "files_processed": job.files_processed,
-        "total_files": job.total_files,
-        "current_file": job.current_file,
+        **_job_state(job),
         "created_at": job.created_at.isoformat(),
         "start_time": job.start_time.isoformat() if job.start_time else None,
         "end_time": job.end_time.isoformat() if job.end_time else None,
@@ -262,6 +227,92 @@ async def get_job_status(job_id: str):
     
     return response
 
+def _job_state(job: ProcessJob) -> Dict:
+    """Estado compacto del job (sin resultado): lo que muestran la barra de progreso y los eventos"""
+    return {
+        "status": job.status.value,
+        "progress": job.progress,
+        "files_processed": job.files_processed,
+        "total_files": job.total_files,
+        "current_file": job.current_file,
+        "rows": job.rows,
+        "rows_per_sec": job.rows_per_sec,
+        "bytes_read": job.bytes_read,
+        "total_bytes": job.total_bytes,
+        "bytes_written": job.bytes_written,
+        "cache": {"hits": job.cache_hits, "misses": job.cache_misses},
+    }
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Progreso del job como Server-Sent Events. El primer evento `progress` trae
+    el estado compacto completo y los siguientes solo los campos que cambiaron;
+    al terminar se envía `done` (con la URL del resultado si se completó) y se
+    cierra el stream. El resultado no viaja por aquí: se pide una sola vez a
+    /api/jobs/{job_id}/result.
+    """
+    store = _get_job_executor().store
+    if await asyncio.to_thread(store.get_job, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    
+    async def events():
+        sent: Dict = {}
+        last_sent = time.monotonic()
+        yield "retry: 2000\n\n"
+        while True:
+            job = await asyncio.to_thread(store.get_job, job_id)
+            if job is None:
+                return
+            delta = {k: v for k, v in _job_state(job).items() if sent.get(k) != v}
+            if delta:
+                sent.update(delta)
+                last_sent = time.monotonic()
+                yield f"event: progress\ndata: {json.dumps(delta, ensure_ascii=False)}\n\n"
+            elif time.monotonic() - last_sent >= 15:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"  # que proxies y balanceadores no corten la conexión
+            if job.status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED):
+                done = {"status": job.status.value}
+                if job.status == JobStatus.COMPLETED:
+                    done["result_url"] = f"/api/jobs/{job_id}/result"
+                elif job.error:
+                    done["error"] = job.error
+                yield f"event: done\ndata: {json.dumps(done, ensure_ascii=False)}\n\n"
+                return
+            await asyncio.sleep(settings.JOB_EVENTS_INTERVAL)
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/jobs/{job_id}/result", response_model=ProcessResponse)
+async def get_job_result(job_id: str):
+    """Resultado de un job completado (artifacts, preview, warnings)"""
+    found = await asyncio.to_thread(_get_job_executor().store.get_result, job_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    status, result = found
+    if status != JobStatus.COMPLETED or result is None:
+        raise HTTPException(status_code=409, detail=f"Job sin resultado ({status.value})")
+    # ya está serializado en la base: se devuelve tal cual
+    return Response(content=result, media_type="application/json")
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancela un job en espera o en curso (el job en curso aborta en su siguiente punto de control)"""
+    executor = _get_job_executor()
+    job = await asyncio.to_thread(executor.store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    
+    if job.status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED):
+        raise HTTPException(status_code=409, detail=f"Job ya terminado ({job.status.value})")
+    
+    status = await asyncio.to_thread(executor.cancel, job_id)
+    logger.info(f"🛑 Cancelación solicitada para job {job_id}")
+    
+    return {"job_id": job_id, "status": status.value if status == JobStatus.CANCELLED else "cancelling"}
+
 @app.post("/api/process", response_model=ProcessResponse)
 async def process_files(
     files: List[UploadFile],
@@ -298,22 +349,20 @@ async def process_files(
 
     # Guardar y expandir archivos
     logger.info(f"📁 Procesando {len(files)} archivos...")
-    saved_csvs: List[Path] = []
+    saved_csvs: List[CsvSource] = []
     for f in files:
         filename = Path(f.filename).name
         logger.info(f"📄 Procesando: {filename}")
         run.source_files.append(filename)
         dest = run_dir_upload / filename
-        _save_upload(f, dest)
+        _, digest = await _save_upload(f, dest)
 
-        if filename.lower().endswith(".zip"):
-            try:
-                csvs = _collect_csvs_from_zip(dest, run_dir_upload)
-                saved_csvs.extend(csvs)
-            except zipfile.BadZipFile:
-                warnings.append(f"{filename}: ZIP inválido")
-        elif filename.lower().endswith(".csv"):
-            saved_csvs.append(dest)
+        try:
+            saved_csvs.extend(upload_sources(filename, dest, digest) or [])
+        except zipfile.BadZipFile:
+            warnings.append(f"{filename}: ZIP inválido")
+        except ValueError as e:
+            warnings.append(f"{filename}: {e}")
 
     agg = CsvAggregator(cliente=client, out_dir=run_dir_output)
     warnings: List[str] = []
@@ -322,13 +371,13 @@ async def process_files(
     total_csvs = len(saved_csvs)
     logger.info(f"📊 Procesando {total_csvs} archivos CSV...")
     
-    for i, csv_path in enumerate(saved_csvs, 1):
-        logger.info(f"📄 [{i}/{total_csvs}] Procesando: {csv_path.name} ({csv_path.stat().st_size / 1024 / 1024:.1f} MB)")
+    for i, source in enumerate(saved_csvs, 1):
+        logger.info(f"📄 [{i}/{total_csvs}] Procesando: {source.name} ({source.size_mb:.1f} MB)")
         try:
             saw_t1 = saw_t2 = False
             rows_processed = 0
             
-            for table, es_aj, row, cols, os_name in stream_tables(csv_path, empresas_list, nombre_defecto or client):
+            for table, es_aj, row, cols, os_name in stream_source_tables(source, empresas_list, nombre_defecto or client):
                 if table == "t1": saw_t1 = True
                 if table == "t2": saw_t2 = True
                 agg.add_row(table, es_aj, row, cols, os_name)
@@ -338,18 +387,19 @@ async def process_files(
                 if rows_processed % 10000 == 0:
                     logger.info(f"   ⚡ {rows_processed:,} filas procesadas...")
             
-            logger.info(f"   ✅ {csv_path.name}: {rows_processed:,} filas procesadas")
+            logger.info(f"   ✅ {source.name}: {rows_processed:,} filas procesadas")
             
             if not saw_t1:
-                warnings.append(f"{csv_path.name}: 'Control Statistics' no encontrada o vacía")
+                warnings.append(f"{source.name}: 'Control Statistics' no encontrada o vacía")
             if not saw_t2:
-                warnings.append(f"{csv_path.name}: 'RESULTS' no encontrada o vacía")
+                warnings.append(f"{source.name}: 'RESULTS' no encontrada o vacía")
                 
         except Exception as ex:
-            logger.error(f"❌ Error procesando {csv_path.name}: {ex}")
-            warnings.append(f"{csv_path.name}: error de parseo: {ex}")
+            logger.error(f"❌ Error procesando {source.name}: {ex}")
+            warnings.append(f"{source.name}: error de parseo: {ex}")
 
     nombres = agg.close()
+    warnings.extend(agg.warnings)
     artifacts = []
     for n in nombres:
         p = run_dir_output / n
@@ -373,10 +423,65 @@ def download_artifact(run_id: str, filename: str):
     p = RUNS_DIR / run_id / "output" / filename
     if not p.exists():
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    mime = "text/csv" if filename.lower().endswith(".csv") \
-           else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    if filename.lower().endswith(".csv"):
+        mime = "text/csv"
+    elif filename.lower().endswith(".parquet"):
+        mime = "application/vnd.apache.parquet"
+    else:
+        mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     return FileResponse(p, filename=filename, media_type=mime)
 
+@app.post("/api/runs/{run_id}/convert")
+async def convert_run(run_id: str, fmt: str = Query(..., alias="format"), parts: Optional[List[str]] = Query(None)):
+    """
+    Convierte partes de un run terminado a XLSX o Parquet en segundo plano y
+    retorna job_id. Sin `parts`, todas las que aún no tienen ese formato.
+    """
+    run_dir = RUNS_DIR / run_id
+    manifest_path = run_dir / "manifest.json"
+    if not manifest_path.exists():
+        raise HTTPException(status_code=404, detail="Run no encontrado o sin terminar")
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {fmt} (xlsx o parquet)")
+    if fmt == "parquet" and not PARQUET_AVAILABLE:
+        raise HTTPException(status_code=400, detail="Salida Parquet no disponible (falta el paquete pyarrow)")
+    if fmt == "xlsx" and settings.CSV_PART_MAX_ROWS > XLSX_MAX_ROWS - 1:
+        # cada parte va a una sola hoja: rechazar antes de encolar, no parte por parte en el worker
+        raise HTTPException(status_code=400, detail=f"CSV_PART_MAX_ROWS ({settings.CSV_PART_MAX_ROWS:,}) supera las "
+                                                    f"{XLSX_MAX_ROWS - 1:,} filas de una hoja de Excel")
+
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    names = [a["name"] for a in manifest.get("artifacts", [])]
+    if parts:
+        invalidas = [p for p in parts if p not in names or not convertible(p, fmt)]
+        if invalidas:
+            raise HTTPException(status_code=400, detail=f"Partes que no se pueden convertir a {fmt}: {', '.join(invalidas)}")
+        parts = list(dict.fromkeys(parts))
+    else:
+        parts = [n for n in names if convertible(n, fmt) and output_name(n, fmt) not in names]
+        if not parts:
+            raise HTTPException(status_code=409, detail=f"No hay partes pendientes de convertir a {fmt}")
+
+    executor = _get_job_executor()
+    job = ProcessJob(
+        job_id=uuid4().hex,
+        status=JobStatus.PENDING,
+        client=manifest["run"]["client"],
+        total_files=len(parts),
+        files_processed=0,
+        progress=f"Conversión a {fmt.upper()} en cola...",
+        current_file="",
+        created_at=datetime.now()
+    )
+    try:
+        queue = await asyncio.to_thread(executor.submit, job, run_dir, [], [], None, {"format": fmt, "parts": parts})
+    except JobQueueFull as e:
+        raise _queue_full(e)
+
+    logger.info(f"🔁 Conversión {job.job_id}: {len(parts)} partes del run {run_id} a {fmt}")
+    return {"job_id": job.job_id, "status": "started", "message": f"Conversión de {len(parts)} partes iniciada",
+            "queue": queue}
+
 @app.get("/api/elasticsearch/status")
 async def elasticsearch_status():
     """Verifica el estado de la conexión con Elasticsearch."""
@@ -31,6 +31,7 @@ class JobStatus(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 class ProcessJob(BaseModel):
     job_id: str
@@ -42,6 +43,13 @@ class ProcessJob(BaseModel):
     current_file: Optional[str] = None
     files_processed: int = 0
     total_files: int = 0
+    cache_hits: int = 0     # CSVs servidos desde la caché de parseo
+    cache_misses: int = 0   # CSVs parseados (y guardados en la caché)
+    rows: Dict[str, int] = Field(default_factory=dict)  # filas escritas por tabla (t1_normal, ...)
+    rows_per_sec: float = 0.0
+    bytes_read: int = 0      # bytes de CSV leídos (por archivo; dentro del archivo en el parseo por rangos)
+    total_bytes: int = 0
+    bytes_written: int = 0   # tamaño actual de los archivos de salida
     created_at: datetime
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
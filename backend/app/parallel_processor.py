@@ -4,98 +4,216 @@ Utiliza PyArrow para parsing ultra-rápido cuando está disponible.
 """
 from __future__ import annotations
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import Iterator, List, Dict, Optional, Tuple, Union
 from multiprocessing import Pool, cpu_count
+from collections import deque
+from uuid import uuid4
+import pickle
+import shutil
+import tempfile
 import logging
 
 logger = logging.getLogger(__name__)
 
+from .parser_stream import stream_tables
+
 # Intentar importar parser optimizado
 try:
-    from .parser_arrow import stream_tables_arrow, PYARROW_AVAILABLE
+    from .parser_arrow import stream_tables_arrow, stream_batches_arrow, arrow_supports, PYARROW_AVAILABLE
     if PYARROW_AVAILABLE:
         logger.info("✅ Usando parser PyArrow ultra-rápido")
         stream_tables_func = stream_tables_arrow
     else:
-        from .parser_stream import stream_tables
         stream_tables_func = stream_tables
         logger.info("ℹ️ PyArrow no disponible, usando parser estándar")
 except ImportError:
-    from .parser_stream import stream_tables
+    PYARROW_AVAILABLE = False
+    stream_tables_arrow = None
     stream_tables_func = stream_tables
     logger.info("ℹ️ Usando parser estándar")
 
+from .parser_bytes import stream_batches_bytes
+from .parse_cache import cached_batches
 from .csv_stream import CsvAggregator
 from .settings import settings
+from .section_index import build_section_index, split_range
+from .parser_stream import _detect_head_lines, section_columns, parse_range_rows, stream_tables_from_stream, with_cliente
+from .sources import CsvSource, as_source, local_path
+from .rows import intern_header
+
+# (table, es_ajustada, cols, os_name, batch): batch = filas alineadas a cols o arrays Arrow
+Batch = Tuple[str, bool, List[str], Optional[str], list]
+
+CHECKPOINT_VERSION = 1
+
+
+def _rows_to_batches(rows_iter, batch_size: int) -> Iterator[Batch]:
+    """Agrupa el protocolo por filas (tuplas + header compartido) en lotes."""
+    current = None
+    meta = None
+    buf: list = []
+    for table, es_aj, row, cols, os_name in rows_iter:
+        key = (table, es_aj, id(cols), os_name)
+        if key != current or len(buf) >= batch_size:
+            if buf:
+                yield (*meta, buf)
+            buf = []
+            current = key
+            meta = (table, es_aj, cols, os_name)
+        buf.append(row)
+    if buf:
+        yield (*meta, buf)
 
 
-def _process_single_csv(args: Tuple[Path, List[str], str, Path]) -> Tuple[str, Dict, List[str]]:
+def iter_file_batches(
+    source: Union[Path, CsvSource],
+    empresas_list: List[str],
+    nombre_defecto: str,
+    warnings: Optional[List[str]] = None,
+    tmp_dir: Optional[Path] = None
+) -> Iterator[Batch]:
     """
-    Procesa un solo CSV y retorna los datos acumulados.
-    Esta función se ejecuta en un proceso separado.
-    
-    Returns:
-        (filename, {table: rows_list}, warnings)
+    Lotes de un CSV con el parser configurado (PARSER_ENGINE): columnar
+    (Arrow) cuando aplica, lotes de filas del parser por bytes, o el protocolo
+    por filas agrupado en lotes de BATCH_SIZE.
+    Los miembros de ZIP y los CSV comprimidos se parsean como stream
+    (COMPRESSED_INPUT_MODE=stream) o se extraen a un temporal en `tmp_dir`
+    para los motores con acceso aleatorio.
+    Las advertencias del parser (p. ej. filas descartadas) van a `warnings`.
     """
-    csv_path, empresas_list, nombre_defecto, temp_dir = args
-    
-    filename = csv_path.name
+    source = as_source(source)
+    if source.sequential and settings.COMPRESSED_INPUT_MODE == "stream":
+        with source.open() as f:
+            yield from _rows_to_batches(stream_tables_from_stream(f, empresas_list, nombre_defecto), settings.BATCH_SIZE)
+        return
+    with local_path(source, tmp_dir or Path(tempfile.gettempdir())) as csv_path:
+        yield from _path_batches(csv_path, empresas_list, nombre_defecto, warnings)
+
+
+def _row_batches(
+    csv_path: Path,
+    empresas_list: List[str],
+    nombre_defecto: str
+) -> Iterator[Batch]:
+    """
+    Lotes de filas: parser por bytes si hay proyección (OUTPUT_COLUMNS), si
+    no el parser estándar, que sin proyección es el más rápido de los dos.
+    """
+    if settings.OUTPUT_COLUMNS:
+        yield from stream_batches_bytes(csv_path, empresas_list, nombre_defecto)
+    else:
+        yield from _rows_to_batches(stream_tables(csv_path, empresas_list, nombre_defecto), settings.BATCH_SIZE)
+
+
+def _path_batches(
+    csv_path: Path,
+    empresas_list: List[str],
+    nombre_defecto: str,
+    warnings: Optional[List[str]] = None
+) -> Iterator[Batch]:
+    """Lotes de un CSV en disco con el motor configurado."""
+    engine = settings.PARSER_ENGINE
+    use_arrow = stream_tables_func is stream_tables_arrow and settings.USE_PYARROW
+    if engine == "python":
+        yield from _rows_to_batches(stream_tables(csv_path, empresas_list, nombre_defecto), settings.BATCH_SIZE)
+        return
+    if engine == "bytes":
+        yield from stream_batches_bytes(csv_path, empresas_list, nombre_defecto)
+        return
     file_size_mb = csv_path.stat().st_size / 1024 / 1024
-    
-    logger.info(f"🔄 Worker procesando: {filename} ({file_size_mb:.1f} MB)")
-    
-    # Acumuladores temporales para este archivo
-    data = {
-        't1_normal': [],
-        't1_ajustada': [],
-        't2_normal': [],
-        't2_ajustada': []
-    }
-    
-    cols_by_table = {
-        't1': None,
-        't2': None
-    }
-    
-    warnings = []
+    if use_arrow and arrow_supports(file_size_mb):
+        yielded = False
+        try:
+            for batch in stream_batches_arrow(csv_path, empresas_list, nombre_defecto, warnings):
+                yielded = True
+                yield batch
+            return
+        except Exception as e:
+            if yielded:
+                raise
+            logger.warning(f"⚠️ Error en PyArrow para {csv_path.name}: {e}, usando parser estándar")
+    yield from _row_batches(csv_path, empresas_list, nombre_defecto)
+
+
+def _is_columnar(batch: list) -> bool:
+    return PYARROW_AVAILABLE and len(batch) > 0 and not isinstance(batch[0], (list, tuple))
+
+
+def _process_single_csv(args: Tuple[CsvSource, List[str], str, Path]) -> Tuple[str, List[Tuple], List[str], int, Dict[str, int]]:
+    """
+    Procesa un solo CSV (archivo o miembro de ZIP) en un proceso worker y escribe sus lotes en archivos
+    "shard" dentro de shard_dir (uno por sección), en lugar de devolverlos
+    en memoria. Los lotes van tal como salen del parser (arrays Arrow o
+    tuplas), serializados con pickle: el padre no vuelve a tokenizar CSV,
+    solo los deserializa y los fusiona en el CsvAggregator en orden.
+
+    Returns:
+        (filename, shards, warnings, rows_processed, cache_stats)
+        shards = [(table, es_ajustada, cols, os_name, shard_path, count), ...]
+        cache_stats = {"hits": n, "misses": n} de la caché de parseo
+    """
+    source, empresas_list, nombre_defecto, shard_dir = args
+
+    filename = source.name
+    logger.info(f"🔄 Worker procesando: {filename} ({source.size_mb:.1f} MB)")
+
+    shards: List[Tuple] = []
+    warnings: List[str] = []
+    cache_stats = {"hits": 0, "misses": 0}
     saw_t1 = saw_t2 = False
     rows_processed = 0
-    
+
+    fh = None
+    current = None  # (table, es_aj, id(cols), os_name) del shard abierto
+
+    def close_shard():
+        nonlocal fh
+        if fh is not None:
+            fh.close()
+            fh = None
+
     try:
-        for table, es_aj, row, cols, os_name in stream_tables(csv_path, empresas_list, nombre_defecto):
-            if table == "t1": 
-                saw_t1 = True
-                if cols_by_table['t1'] is None:
-                    cols_by_table['t1'] = cols
-            if table == "t2": 
-                saw_t2 = True
-                if cols_by_table['t2'] is None:
-                    cols_by_table['t2'] = cols
-            
-            # Agregar OS al row
-            row['os'] = os_name or ""
-            
-            key = f"{'t1' if table=='t1' else 't2'}_{'ajustada' if es_aj else 'normal'}"
-            data[key].append(row)
-            rows_processed += 1
-            
-            # Log cada 50k filas
-            if rows_processed % 50000 == 0:
+        batches = cached_batches(
+            source, empresas_list, nombre_defecto,
+            lambda: iter_file_batches(source, empresas_list, nombre_defecto, warnings, shard_dir),
+            warnings, cache_stats
+        )
+        for table, es_aj, cols, os_name, batch in batches:
+            if table == "t1": saw_t1 = True
+            if table == "t2": saw_t2 = True
+
+            key = (table, es_aj, id(cols), os_name)
+            if key != current:
+                # Nueva sección → nuevo shard (conserva el orden original)
+                close_shard()
+                shard_path = shard_dir / f"{source.stem}-{uuid4().hex[:8]}-{len(shards):03d}.pkl"
+                fh = shard_path.open("wb", buffering=settings.WRITE_BUFFER_SIZE)
+                shards.append([table, es_aj, tuple(cols), os_name, shard_path, 0])
+                current = key
+
+            n = len(batch[0]) if _is_columnar(batch) else len(batch)
+            pickle.dump(batch, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            shards[-1][5] += n
+            prev = rows_processed
+            rows_processed += n
+
+            if rows_processed // 50000 != prev // 50000:
                 logger.info(f"   {filename}: {rows_processed:,} filas procesadas")
-        
+
         logger.info(f"✅ {filename}: {rows_processed:,} filas totales")
-        
+
         if not saw_t1:
             warnings.append(f"{filename}: 'Control Statistics' no encontrada o vacía")
         if not saw_t2:
             warnings.append(f"{filename}: 'RESULTS' no encontrada o vacía")
-        
-        return (filename, data, warnings, cols_by_table)
-        
+
     except Exception as ex:
         logger.error(f"❌ Error procesando {filename}: {ex}")
         warnings.append(f"{filename}: error de parseo: {ex}")
-        return (filename, data, warnings, cols_by_table)
+    finally:
+        close_shard()
+
+    return (filename, [tuple(sh) for sh in shards], warnings, rows_processed, cache_stats)
 
 
 class ParallelCsvProcessor:
@@ -109,109 +227,296 @@ class ParallelCsvProcessor:
         self.out_dir = out_dir
         self.num_workers = num_workers or min(settings.WORKER_PROCESSES, cpu_count())
         self.aggregator = CsvAggregator(cliente=cliente, out_dir=out_dir)
+        self.cache_stats = {"hits": 0, "misses": 0}  # caché de parseo por contenido
+        self.bytes_read = 0  # bytes de CSV consumidos (para el progreso del job)
+        self._pool = None
+        self._checkpoint_callback = None
+        self._intra_pos: Optional[Tuple[int, int]] = None  # (sección, fin del último rango entregado)
         
     def process_csvs_parallel(
         self, 
-        csv_paths: List[Path], 
+        csv_paths: List[Union[Path, CsvSource]], 
         empresas_list: List[str], 
         nombre_defecto: str,
-        progress_callback = None
+        progress_callback = None,
+        checkpoint_callback = None,
+        resume: Optional[Dict] = None
     ) -> Tuple[List[str], List[str], Dict]:
         """
         Procesa múltiples CSVs en paralelo.
         
         Args:
-            csv_paths: Lista de rutas a archivos CSV
+            csv_paths: Lista de rutas a archivos CSV o CsvSource (miembros de ZIP, hash ya calculado)
             empresas_list: Lista de empresas para detección
             nombre_defecto: Nombre por defecto del cliente
             progress_callback: Función callback(filename, rows_processed, total_files)
+            checkpoint_callback: Función callback(state) con un estado JSON desde el que reanudar;
+                se llama al terminar cada archivo y, en el parseo por rangos, cada vez que se cierra una parte
+            resume: Último estado recibido por checkpoint_callback (mismos csv_paths) para continuar desde ahí
             
         Returns:
             (nombres_archivos_generados, warnings, counts)
         """
-        total_csvs = len(csv_paths)
-        total_size_mb = sum(p.stat().st_size for p in csv_paths) / 1024 / 1024
+        sources = [as_source(p) for p in csv_paths]
+        total_csvs = len(sources)
+        total_size_mb = sum(src.size_mb for src in sources)
         
         logger.info(f"🚀 Procesamiento paralelo con {self.num_workers} workers")
         logger.info(f"📊 {total_csvs} archivos CSV ({total_size_mb:.1f} MB total)")
         
         # Determinar estrategia: paralelo vs secuencial
-        # Para archivos pequeños (<50MB total), secuencial es más eficiente
-        use_parallel = total_size_mb > 50 and total_csvs > 1
+        # En paralelo el padre igual fusiona todo (agregar cuesta ~lo mismo que parsear);
+        # se gana el parseo de los archivos siguientes solapado con la fusión, que con
+        # menos de 3 archivos o <50MB en total no compensa el primer parseo en serie
+        use_parallel = total_size_mb > 50 and total_csvs >= 3
         
         all_warnings = []
+        start = 0
+        file_pos = None
+        self._checkpoint_callback = checkpoint_callback
+        if resume is not None:
+            if resume.get("version") != CHECKPOINT_VERSION:
+                raise ValueError(f"checkpoint incompatible (versión {resume.get('version')})")
+            self.aggregator.restore(resume["aggregator"])
+            self.cache_stats = dict(resume["cache_stats"])
+            all_warnings = list(resume["warnings"])
+            start, file_pos = resume["next_file"], resume["file_pos"]
+            at = f", byte {file_pos['offset']:,}" if file_pos else ""
+            logger.info(f"♻️ Reanudando desde checkpoint: archivo {start + 1}/{total_csvs}{at}")
+            # un archivo a medias solo se retoma por rangos (camino secuencial)
+            use_parallel = use_parallel and file_pos is None
+        self.bytes_read = sum(src.progress_bytes for src in sources[:start])
         
-        if use_parallel and self.num_workers > 1:
-            logger.info(f"⚡ Usando procesamiento PARALELO ({self.num_workers} workers)")
-            all_warnings = self._process_parallel(csv_paths, empresas_list, nombre_defecto, progress_callback)
-        else:
-            logger.info(f"📝 Usando procesamiento SECUENCIAL (archivos pequeños o worker único)")
-            all_warnings = self._process_sequential(csv_paths, empresas_list, nombre_defecto, progress_callback)
+        try:
+            if use_parallel and self.num_workers > 1:
+                logger.info(f"⚡ Usando procesamiento PARALELO ({self.num_workers} workers)")
+                self._process_parallel(sources, empresas_list, nombre_defecto, progress_callback, start, all_warnings)
+            else:
+                logger.info(f"📝 Usando procesamiento SECUENCIAL (archivos pequeños o worker único)")
+                self._process_sequential(sources, empresas_list, nombre_defecto, progress_callback,
+                                         start, file_pos, all_warnings)
+        except BaseException:
+            # error o cancelación del job: no esperar a los parseos en curso
+            if self._pool is not None:
+                self._pool.terminate()
+            self.aggregator.abort()
+            raise
+        finally:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
         
         # Cerrar agregador y obtener nombres de archivos
         logger.info("🔄 Cerrando escritores CSV...")
         nombres = self.aggregator.close()
         counts = self.aggregator.counts
+        all_warnings.extend(self.aggregator.warnings)
         
         return nombres, all_warnings, counts
     
     def _process_sequential(
         self, 
-        csv_paths: List[Path], 
+        sources: List[CsvSource], 
         empresas_list: List[str], 
         nombre_defecto: str,
-        progress_callback
+        progress_callback,
+        start: int = 0,
+        file_pos: Optional[Dict] = None,
+        all_warnings: Optional[List[str]] = None
     ) -> List[str]:
-        """Procesamiento secuencial tradicional (más eficiente para archivos pequeños)"""
-        all_warnings = []
+        """
+        Procesamiento secuencial tradicional (más eficiente para archivos pequeños).
+        Empieza en sources[start]; con `file_pos` ese archivo se retoma por
+        rangos desde el offset del checkpoint.
+        """
+        all_warnings = [] if all_warnings is None else all_warnings
         
-        for i, csv_path in enumerate(csv_paths, 1):
-            file_size_mb = csv_path.stat().st_size / 1024 / 1024
-            logger.info(f"📄 [{i}/{len(csv_paths)}] {csv_path.name} ({file_size_mb:.1f} MB)")
+        for i, source in enumerate(sources[start:], start + 1):
+            logger.info(f"📄 [{i}/{len(sources)}] {source.name} ({source.size_mb:.1f} MB)")
+            pos = file_pos if i == start + 1 else None
+            read_before = self.bytes_read
             
             if progress_callback:
-                progress_callback(csv_path.name, 0, len(csv_paths))
+                progress_callback(source.name, 0, len(sources))
             
             try:
-                saw_t1 = saw_t2 = False
+                saw_t1, saw_t2 = pos["saw"] if pos else (False, False)
                 rows_processed = 0
+                self._intra_pos = None
                 
-                # Usar parser optimizado (PyArrow si disponible)
-                for table, es_aj, row, cols, os_name in stream_tables_func(csv_path, empresas_list, nombre_defecto):
+                # Archivos grandes: rangos de la sección repartidos en el pool;
+                # el resto usa el parser optimizado (PyArrow si disponible).
+                # Se decide con el tamaño real en disco (ya extraído), no con
+                # el estimado de los comprimidos
+                if pos is not None or self._can_split(source):
+                    def parse(source=source, pos=pos):
+                        with local_path(source, self.out_dir.parent) as csv_path:
+                            if pos is None and not self._use_intra_file(csv_path):
+                                yield from _path_batches(csv_path, empresas_list, nombre_defecto, all_warnings)
+                                return
+                            logger.info(f"   ⚡ Parseo intra-archivo con {self.num_workers} workers")
+                            yield from self._stream_batches_intra_file(csv_path, empresas_list, nombre_defecto, pos)
+                else:
+                    def parse(source=source):
+                        return iter_file_batches(source, empresas_list, nombre_defecto, all_warnings, self.out_dir.parent)
+                if pos is not None:
+                    batches = parse()  # parseo parcial: no se guarda en la caché
+                else:
+                    batches = cached_batches(source, empresas_list, nombre_defecto, parse, all_warnings, self.cache_stats)
+                parts = len(self.aggregator.saved_files)
+                for table, es_aj, cols, os_name, batch in batches:
                     if table == "t1": saw_t1 = True
                     if table == "t2": saw_t2 = True
-                    self.aggregator.add_row(table, es_aj, row, cols, os_name)
-                    rows_processed += 1
+                    prev = rows_processed
+                    rows_processed += self.aggregator.add_batch(table, es_aj, cols, batch, os_name)
+                    if self._intra_pos is not None and source.size is not None:
+                        self.bytes_read = read_before + self._intra_pos[1]
+                    
+                    if rows_processed // 50000 != prev // 50000 and progress_callback:
+                        progress_callback(source.name, rows_processed, len(sources))
                     
-                    if rows_processed % 50000 == 0 and progress_callback:
-                        progress_callback(csv_path.name, rows_processed, len(csv_paths))
+                    # parte cerrada a mitad de un archivo parseado por rangos: checkpoint en el offset del rango
+                    if self._intra_pos is not None and len(self.aggregator.saved_files) != parts:
+                        parts = len(self.aggregator.saved_files)
+                        section, offset = self._intra_pos
+                        self._checkpoint(i - 1, all_warnings,
+                                         {"section": section, "offset": offset, "saw": [saw_t1, saw_t2]})
                 
                 logger.info(f"   ✅ {rows_processed:,} filas procesadas")
                 
                 if not saw_t1:
-                    all_warnings.append(f"{csv_path.name}: 'Control Statistics' no encontrada o vacía")
+                    all_warnings.append(f"{source.name}: 'Control Statistics' no encontrada o vacía")
                 if not saw_t2:
-                    all_warnings.append(f"{csv_path.name}: 'RESULTS' no encontrada o vacía")
+                    all_warnings.append(f"{source.name}: 'RESULTS' no encontrada o vacía")
                     
             except Exception as ex:
-                logger.error(f"❌ Error procesando {csv_path.name}: {ex}")
-                all_warnings.append(f"{csv_path.name}: error de parseo: {ex}")
+                logger.error(f"❌ Error procesando {source.name}: {ex}")
+                all_warnings.append(f"{source.name}: error de parseo: {ex}")
+            
+            self.bytes_read = read_before + source.progress_bytes
+            self._checkpoint(i, all_warnings)
         
         return all_warnings
     
+    def _checkpoint(self, next_file: int, warnings: List[str], file_pos: Optional[Dict] = None):
+        """Estado para reanudar en sources[next_file] (desde file_pos, si el archivo quedó a medias)."""
+        if self._checkpoint_callback is None:
+            return
+        self._checkpoint_callback({
+            "version": CHECKPOINT_VERSION,
+            "next_file": next_file,
+            "file_pos": file_pos,
+            "warnings": list(warnings),
+            "cache_stats": dict(self.cache_stats),
+            "aggregator": self.aggregator.snapshot(),
+        })
+    
+    def _can_split(self, source: CsvSource) -> bool:
+        # los rangos de bytes necesitan acceso aleatorio: ZIP / comprimidos solo si se extraen
+        if source.sequential and settings.COMPRESSED_INPUT_MODE == "stream":
+            return False
+        return self.num_workers > 1
+
+    def _use_intra_file(self, csv_path: Path) -> bool:
+        return csv_path.stat().st_size / 1024 / 1024 >= settings.INTRA_FILE_PARALLEL_MIN_MB
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = Pool(self.num_workers)
+        return self._pool
+
+    def _stream_batches_intra_file(
+        self,
+        csv_path: Path,
+        empresas_list: List[str],
+        nombre_defecto: str,
+        resume_at: Optional[Dict] = None
+    ) -> Iterator[Batch]:
+        """
+        Mismas filas que parser_stream.stream_tables (un lote por rango), pero
+        Control Statistics y RESULTS se dividen en rangos de bytes (cortados
+        fuera de comillas) que los workers parsean en paralelo. Los resultados se consumen en el orden
+        original, así que los archivos de salida son idénticos al camino secuencial.
+        Como máximo 2 rangos por worker quedan en vuelo (memoria acotada).
+        Antes de entregar cada lote deja en self._intra_pos el offset donde
+        termina su rango; `resume_at` ({"section", "offset"}) retoma desde ahí.
+        """
+        index = build_section_index(csv_path)
+        es_ajustada, cliente, os_name = _detect_head_lines(index.head_lines, empresas_list, nombre_defecto)
+        pool = self._get_pool()
+        window = self.num_workers * 2
+
+        for sec in index.of_kind("t1", "t2"):
+            body_start = sec.body_start
+            if resume_at is not None:
+                if sec.marker_start < resume_at["section"]:
+                    continue  # sección ya escrita antes del checkpoint
+                if sec.marker_start == resume_at["section"]:
+                    body_start = resume_at["offset"]
+            delim, cols = section_columns(sec)
+            need = len(cols) - 1  # sin 'Cliente'
+            ci = cols.index("Cliente")
+            pending = deque()
+
+            def drain(item):
+                end, result = item
+                rows = [with_cliente(row, cliente, ci) for row in result.get()]
+                self._intra_pos = (sec.marker_start, end)
+                yield (sec.kind, es_ajustada, cols, os_name, rows)
+
+            for start, end in split_range(csv_path, body_start, sec.body_end, settings.INTRA_FILE_CHUNK_BYTES):
+                pending.append((end, pool.apply_async(parse_range_rows, ((str(csv_path), start, end, delim, need),))))
+                if len(pending) >= window:
+                    yield from drain(pending.popleft())
+            while pending:
+                yield from drain(pending.popleft())
+
     def _process_parallel(
         self, 
-        csv_paths: List[Path], 
+        sources: List[CsvSource], 
         empresas_list: List[str], 
         nombre_defecto: str,
-        progress_callback
+        progress_callback,
+        start: int = 0,
+        all_warnings: Optional[List[str]] = None
     ) -> List[str]:
         """
-        Procesamiento paralelo usando multiprocessing.
-        NOTA: Actualmente deshabilitado para evitar problemas de serialización.
-        Usar _process_sequential en su lugar.
+        Procesamiento multi-archivo con un pool de procesos (desde sources[start]).
+        Cada worker parsea un CSV completo y lo vuelca a shards en disco; el
+        padre los fusiona en el CsvAggregator en el orden de `sources`, así la
+        rotación de partes y los nombres son los mismos que en secuencial.
+        La memoria queda acotada sin importar cuántos archivos haya: por el
+        pool solo viajan metadatos, y cada shard se borra tras fusionarse.
         """
-        # Por ahora, usar procesamiento secuencial ya que multiprocessing
-        # tiene problemas con objetos complejos como CsvAggregator
-        logger.warning("⚠️ Procesamiento paralelo no implementado, usando secuencial")
-        return self._process_sequential(csv_paths, empresas_list, nombre_defecto, progress_callback)
+        all_warnings = [] if all_warnings is None else all_warnings
+        shard_dir = Path(tempfile.mkdtemp(prefix="shards-", dir=self.out_dir.parent))
+        tasks = [(src, empresas_list, nombre_defecto, shard_dir) for src in sources[start:]]
+
+        try:
+            pool = self._get_pool()
+            for i, (filename, shards, warnings, rows, cache_stats) in enumerate(pool.imap(_process_single_csv, tasks), start + 1):
+                for k, v in cache_stats.items():
+                    self.cache_stats[k] += v
+                self.bytes_read += sources[i - 1].progress_bytes
+                logger.info(f"📄 [{i}/{len(sources)}] {filename}: fusionando {len(shards)} shard(s), {rows:,} filas")
+                if progress_callback:
+                    progress_callback(filename, rows, len(sources))
+                for table, es_aj, cols, os_name, shard_path, count in shards:
+                    self._merge_shard(table, es_aj, intern_header(cols), os_name, shard_path)
+                    shard_path.unlink(missing_ok=True)
+                all_warnings.extend(warnings)
+                self._checkpoint(i, all_warnings)
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+        return all_warnings
+
+    def _merge_shard(self, table: str, es_aj: bool, cols: List[str], os_name: Optional[str], shard_path: Path):
+        with shard_path.open("rb", buffering=settings.WRITE_BUFFER_SIZE) as fh:
+            while True:
+                try:
+                    batch = pickle.load(fh)
+                except EOFError:
+                    break
+                self.aggregator.add_batch(table, es_aj, cols, batch, os_name)
@@ -0,0 +1,245 @@
+"""
+Caché de parseo direccionada por contenido.
+
+Cada CSV fuente se identifica por el SHA-256 de sus bytes. La primera vez
+que se parsea, sus lotes (Control Statistics / RESULTS) se guardan sin la
+columna 'Cliente' en archivos Arrow IPC bajo OUTPUT_BASE_DIR/cache/<hash>/,
+junto a un meta.json con las líneas de cabecera, los headers y las
+advertencias del parser. Un re-upload del mismo reporte (otras empresas,
+otro nombre por defecto, reintento) no se vuelve a parsear: se leen los
+arrays por memory map y solo se rehace la detección del cliente.
+
+El tamaño total se limita con PARSE_CACHE_MAX_MB; se desalojan primero las
+entradas usadas hace más tiempo (LRU por mtime de meta.json).
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+from .settings import settings
+from .parser_stream import _detect_head_lines
+from .sources import CsvSource, source_digest
+from .rows import intern_header
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    PARSE_CACHE_AVAILABLE = True
+except ImportError:
+    PARSE_CACHE_AVAILABLE = False
+
+CACHE_VERSION = 1
+_META = "meta.json"
+
+# (table, es_ajustada, cols, os_name, batch)
+Batch = Tuple[str, bool, List[str], Optional[str], list]
+
+
+def _entry_key(digest: str) -> str:
+    """Clave de la entrada: el hash del reporte + la proyección de columnas, si hay."""
+    if not settings.OUTPUT_COLUMNS:
+        return digest
+    proj = hashlib.sha1(json.dumps(settings.OUTPUT_COLUMNS).encode()).hexdigest()[:8]
+    return f"{digest}-{proj}"
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.iterdir() if p.is_file())
+
+
+class ParseCache:
+    """Entradas <hash>/ con meta.json + un archivo Arrow IPC por segmento de sección."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def load(
+        self,
+        digest: str,
+        empresas: List[str],
+        nombre_defecto: str,
+        warnings: Optional[List[str]] = None
+    ) -> Optional[Iterator[Batch]]:
+        """
+        Lotes cacheados con el cliente recalculado, o None si no hay entrada.
+        Una entrada ilegible o de otra CACHE_VERSION se borra: si no, el
+        rename de _publish() chocaría con ella y nunca se reemplazaría.
+        """
+        entry = self.root / _entry_key(digest)
+        if not entry.is_dir():
+            return None
+        try:
+            meta = json.loads((entry / _META).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get("version") != CACHE_VERSION:
+            shutil.rmtree(entry, ignore_errors=True)
+            logger.info(f"🧹 Caché de parseo: {entry.name[:12]} obsoleto, se vuelve a parsear")
+            return None
+        os.utime(entry / _META)  # último uso (LRU)
+        _, cliente, _ = _detect_head_lines(meta["head_lines"], empresas, nombre_defecto)
+        if warnings is not None:
+            warnings.extend(meta.get("warnings", []))
+        return self._replay(entry, meta, cliente)
+
+    def _replay(self, entry: Path, meta: Dict, cliente: str) -> Iterator[Batch]:
+        const = pa.scalar(cliente, pa.string())
+        for seg in meta["segments"]:
+            cols = intern_header(seg["cols"])
+            ci = cols.index("Cliente")
+            with pa.memory_map(str(entry / seg["file"]), "r") as source:
+                for rb in _file_batches(pa.ipc.open_file(source)):
+                    arrays = list(rb.columns)
+                    arrays.insert(ci, pa.repeat(const, rb.num_rows))
+                    yield (seg["table"], seg["es_ajustada"], cols, seg["os_name"], arrays)
+
+    def record(
+        self,
+        digest: str,
+        source: CsvSource,
+        batches: Iterator[Batch],
+        warnings: Optional[List[str]] = None
+    ) -> Iterator[Batch]:
+        """
+        Deja pasar los lotes del parser y los guarda a la vez. La entrada solo
+        se publica si el parseo termina completo; si falla o se corta, se
+        descarta.
+        """
+        key = _entry_key(digest)
+        tmp = self.root / f"tmp-{key}-{uuid4().hex[:8]}"
+        tmp.mkdir(parents=True)
+        first_warning = len(warnings) if warnings is not None else 0
+        segments: List[Dict] = []
+        writer = schema = None
+        current = None
+        done = False
+        try:
+            for batch in batches:
+                table, es_aj, cols, os_name, data = batch
+                seg_key = (table, es_aj, id(cols), os_name)
+                ci = cols.index("Cliente")
+                if seg_key != current:
+                    if writer is not None:
+                        writer.close()
+                    schema = pa.schema([(f"c{j}", pa.string()) for j in range(len(cols)) if j != ci])
+                    name = f"seg-{len(segments):03d}.arrow"
+                    writer = pa.ipc.new_file(str(tmp / name), schema)
+                    segments.append({"table": table, "es_ajustada": es_aj, "os_name": os_name,
+                                     "cols": list(cols), "file": name, "rows": 0})
+                    current = seg_key
+                arrays = _without_column(data, ci, len(cols))
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                segments[-1]["rows"] += len(arrays[0]) if arrays else 0
+                yield batch
+            done = True
+        finally:
+            if writer is not None:
+                writer.close()
+            if done:
+                meta = {
+                    "version": CACHE_VERSION,
+                    "source": source.name,
+                    "head_lines": source.head_lines(),
+                    "warnings": list(warnings[first_warning:]) if warnings is not None else [],
+                    "segments": segments,
+                    "created": time.time(),
+                }
+                (tmp / _META).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+                self._publish(tmp, self.root / key)
+            else:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+    def _publish(self, tmp: Path, entry: Path):
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # otro proceso ya publicó el mismo reporte
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        logger.info(f"💾 Caché de parseo: {entry.name[:12]} guardado ({_dir_size(entry) / 1024 / 1024:.1f} MB)")
+        self.evict()
+
+    def evict(self):
+        """Desaloja las entradas menos usadas hasta quedar bajo max_bytes."""
+        entries = []
+        for d in self.root.iterdir():
+            meta = d / _META
+            if d.is_dir() and not d.name.startswith("tmp-") and meta.exists():
+                entries.append((meta.stat().st_mtime, _dir_size(d), d))
+        total = sum(size for _, size, _ in entries)
+        for _, size, d in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(d, ignore_errors=True)
+            total -= size
+            logger.info(f"🧹 Caché de parseo: {d.name[:12]} desalojado ({size / 1024 / 1024:.1f} MB)")
+
+
+def _file_batches(reader) -> Iterator:
+    for i in range(reader.num_record_batches):
+        yield reader.get_batch(i)
+
+
+def _without_column(data: list, ci: int, width: int) -> list:
+    """Lote (filas o arrays) → arrays Arrow de todas las columnas menos 'Cliente'."""
+    if data and not isinstance(data[0], (list, tuple)):
+        arrays = [a.combine_chunks() if isinstance(a, pa.ChunkedArray) else a
+                  for j, a in enumerate(data) if j != ci]
+        return [a if a.type == pa.string() else a.cast(pa.string()) for a in arrays]
+    if not data:
+        return [pa.array([], pa.string()) for j in range(width) if j != ci]
+    return [pa.array(col, pa.string()) for j, col in enumerate(zip(*data)) if j != ci]
+
+
+_CACHE: Optional[ParseCache] = None
+
+
+def get_parse_cache() -> Optional[ParseCache]:
+    """Caché del proceso (una por worker), o None si está deshabilitada o falta pyarrow."""
+    global _CACHE
+    if not (settings.PARSE_CACHE_ENABLED and PARSE_CACHE_AVAILABLE):
+        return None
+    if _CACHE is None:
+        root = Path(settings.OUTPUT_BASE_DIR).resolve() / "cache"
+        _CACHE = ParseCache(root, settings.PARSE_CACHE_MAX_MB * 1024 * 1024)
+    return _CACHE
+
+
+def cached_batches(
+    source: CsvSource,
+    empresas: List[str],
+    nombre_defecto: str,
+    parse: Callable[[], Iterator[Batch]],
+    warnings: Optional[List[str]] = None,
+    stats: Optional[Dict[str, int]] = None
+) -> Iterator[Batch]:
+    """
+    Lotes de la fuente desde la caché si ya se parseó este contenido; si no,
+    los de `parse()` guardándolos de paso. `stats` acumula hits / misses.
+    El hash calculado al subir (source.digest) evita releer el archivo.
+    """
+    cache = get_parse_cache()
+    if cache is None:
+        yield from parse()
+        return
+    digest = source_digest(source)
+    cached = cache.load(digest, empresas, nombre_defecto, warnings)
+    if cached is not None:
+        logger.info(f"⚡ Caché de parseo: {source.name} ({digest[:12]}) sin reparsear")
+        if stats is not None:
+            stats["hits"] = stats.get("hits", 0) + 1
+        yield from cached
+        return
+    if stats is not None:
+        stats["misses"] = stats.get("misses", 0) + 1
+    yield from cache.record(digest, source, parse(), warnings)
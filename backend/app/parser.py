@@ -126,146 +126,3 @@ def _extract_os(head_text: str) -> Optional[str]:
             os_name = m.group(1).strip()
             return re.sub(r"\s+", " ", os_name)
     return None
-
-def parse_csv_file(
-    path: Path,
-    empresas: List[str],
-    nombre_defecto: str
-) -> Tuple[bool, str, List[dict], List[str], List[dict], List[str], Optional[str]]:
-    """
-    Devuelve:
-      (es_ajustada, cliente_detectado,
-       t1_rows, t1_cols,
-       t2_rows, t2_cols,
-       os_name)
-    """
-    # --- Heurística inicial: ajustada/cliente/os en primeras líneas ---
-    es_ajustada = False
-    cliente = nombre_defecto
-    os_name: Optional[str] = None
-
-    with path.open("r", encoding="utf-8", errors="ignore", newline="") as f:
-        head_lines = []
-        for _ in range(8):
-            ln = f.readline()
-            if not ln:
-                break
-            head_lines.append(ln)
-        head_text = " ".join(head_lines)
-        es_ajustada = any(tok in head_text.upper() for tok in AJUSTADA_TOKENS)
-        low = head_text.lower()
-        for e in empresas:
-            if e.lower() in low:
-                cliente = e
-                break
-        os_name = _extract_os(head_text)
-
-    # Reabrimos para parsear todo desde cero (no dependemos del primer read)
-    t1_rows: List[dict] = []
-    t2_rows: List[dict] = []
-    t1_cols: List[str] = []
-    t2_cols: List[str] = []
-
-    with path.open("r", encoding="utf-8", errors="ignore", newline="") as f:
-        pending_line: Optional[str] = None
-
-        def next_line() -> str:
-            nonlocal pending_line
-            if pending_line is not None:
-                ln = pending_line
-                pending_line = None
-                return ln
-            return f.readline()
-
-        while True:
-            # Avanza hasta encontrar un marcador de sección
-            marker = ""
-            while True:
-                ln = next_line()
-                if not ln:
-                    marker = ""
-                    break
-                s = _norm(ln)
-                if not s:
-                    continue
-                if _is_any_marker(s):
-                    marker = s
-                    break
-            if not marker:
-                break  # EOF
-
-            # Header = siguiente línea no vacía
-            header_line = ""
-            while True:
-                ln = next_line()
-                if not ln:
-                    break
-                if ln.strip():
-                    header_line = ln
-                    break
-            if not header_line:
-                # marcador sin header; continúa buscando siguiente sección
-                continue
-
-            delim = _detect_delimiter(header_line)
-            # Columnas (limpiamos comillas)
-            cols = next(csv.reader([header_line], delimiter=delim), [])
-            cols = [_norm(c) for c in cols]
-            # Aseguramos 'Cliente'
-            if "Cliente" not in cols:
-                cols.append("Cliente")
-
-            # Iterador de la sección: entrega líneas hasta el próximo marcador
-            class _SectionIter:
-                def __init__(self):
-                    self.stopped_line: Optional[str] = None
-                def __iter__(self):
-                    return self
-                def __next__(self):
-                    nonlocal pending_line
-                    ln = f.readline()
-                    if ln == "":
-                        raise StopIteration
-                    s = _norm(ln)
-                    if _is_any_marker(s):
-                        # guardamos el marcador para el próximo ciclo y cerramos esta sección
-                        pending_line = ln
-                        raise StopIteration
-                    return ln
-
-            it = _SectionIter()
-            rdr = csv.reader(it, delimiter=delim)
-
-            # Procesar filas de la sección
-            is_t1 = _is_t1_marker(marker)
-            is_t2 = _is_t2_marker(marker)
-            # Host Statistics: lo ignoramos
-            for row in rdr:
-                # normaliza tamaño vs columnas sin contar 'Cliente'
-                need = len(cols) - 1
-                row = list(row)
-                if len(row) < need:
-                    row += [""] * (need - len(row))
-                elif len(row) > need:
-                    row = row[:need]
-
-                obj = {cols[i]: _norm(row[i]) for i in range(need)}
-                obj["Cliente"] = cliente
-                if os_name:
-                    obj["os"] = os_name
-
-                if is_t1:
-                    if not t1_cols:
-                        t1_cols = cols[:]  # conserva orden del primer header T1
-                    t1_rows.append(obj)
-                elif is_t2:
-                    if not t2_cols:
-                        t2_cols = cols[:]
-                    t2_rows.append(obj)
-                else:
-                    # Host Statistics: ignorado
-                    pass
-
-            # Siguiente iteración usará 'pending_line' como nuevo marcador (si quedó algo)
-
-    return es_ajustada, cliente, t1_rows, t1_cols, t2_rows, t2_cols, os_name
\ No newline at end of file
@@ -1,20 +1,34 @@
 """
 Parser optimizado con fallback robusto.
 Usa PyArrow cuando es posible, pero con fallback automático al parser estándar.
+
+Motor "native": cada sección indexada (Control Statistics / RESULTS) se
+entrega a `pyarrow.csv` en rangos de bytes de un memory map (cortados fuera
+de comillas, campos multilínea soportados).
+Motor "pandas": mismos rangos leídos con pandas, limitado a archivos de
+hasta ARROW_MAX_FILE_MB.
 """
 from __future__ import annotations
 from pathlib import Path
-from typing import Iterator, Tuple, List, Dict, Optional
-import re
+from typing import Iterator, Tuple, List, Dict, Optional, Union
+import csv
+import io
+import time
 import logging
+from .rows import Header, Row, column_values
+from .section_index import Section, build_section_index, log_skipped_sections, split_range
+from .parser_stream import _detect_head_lines, iter_range_rows, section_columns, with_cliente
+from .settings import settings
 
 logger = logging.getLogger(__name__)
 
-AJUSTADA_TOKENS = ("AJUSTA", "AJUSTADA", "AJU")
+ARROW_MAX_FILE_MB = 1000  # motor pandas: por encima se usa el parser estándar
+_MIN_NATIVE_RANGE = 256 * 1024  # rango mínimo que se reintenta con Arrow antes del parser estándar
 
 try:
     import pyarrow.csv as pa_csv
     import pyarrow as pa
+    import pyarrow.compute as pc
     import pandas as pd
     PYARROW_AVAILABLE = True
     logger.info("✅ PyArrow y Pandas disponibles - Parser optimizado activo")
@@ -23,82 +37,36 @@ except ImportError as e:
     logger.warning(f"⚠️ PyArrow/Pandas no disponible: {e} - Usando parser estándar")
 
 
-def _norm(s: str) -> str:
-    return s.strip().strip('"').strip("'")
-
-
-def _is_t1_marker(s: str) -> bool:
-    return _norm(s).upper().startswith("CONTROL STATISTICS")
-
-
-def _is_t2_marker(s: str) -> bool:
-    return _norm(s).upper() == "RESULTS"
-
-
-def _is_host_marker(s: str) -> bool:
-    return _norm(s).upper().startswith("HOST STATISTICS")
-
-
-def _is_any_marker(s: str) -> bool:
-    s = _norm(s)
-    return _is_t1_marker(s) or _is_t2_marker(s) or _is_host_marker(s) or s.upper() in ("ASSET TAGS", "SUMMARY")
-
-
-def _extract_os(head_text: str) -> Optional[str]:
-    pats = [
-        r"CIS\s+Benchmark\s+for\s+(.+?)\s+v\d",
-        r"CIS\s+(.+?)\s+Benchmark\s+v\d",
-        r"CIS\s+Benchmark\s+for\s+(.+?)\s+version\s+\d",
-        r"CIS\s+(.+?)\s+Benchmark\s+version\s+\d",
-    ]
-    for pat in pats:
-        m = re.search(pat, head_text, flags=re.IGNORECASE)
-        if m:
-            return re.sub(r"\s+", " ", m.group(1).strip())
-    return None
+def _detect_delimiter(header_line: str) -> str:
+    return ";" if header_line.count(";") > header_line.count(",") else ","
 
 
-def _detect_head(path: Path, empresas: List[str], nombre_defecto: str) -> tuple[bool, str, Optional[str]]:
-    es_ajustada = False
-    cliente = nombre_defecto
-    os_name: Optional[str] = None
-    
-    with path.open("r", encoding="utf-8", errors="ignore", newline="") as f:
-        head = []
-        for _ in range(10):
-            ln = f.readline()
-            if not ln:
-                break
-            head.append(ln)
-        head_text = " ".join(head)
-        es_ajustada = any(tok in head_text.upper() for tok in AJUSTADA_TOKENS)
-        low = head_text.lower()
-        for e in empresas:
-            if e.lower() in low:
-                cliente = e
-                break
-        os_name = _extract_os(head_text)
-    
-    return es_ajustada, cliente, os_name
+# (table, es_ajustada, header, os_name, batch): una columna Arrow por cada nombre del
+# header, o (filas recuperadas por el parser estándar) una lista de tuplas
+ArrowBatch = Tuple[str, bool, Header, Optional[str], Union[List["pa.Array"], List[Row]]]
 
 
-def _detect_delimiter(header_line: str) -> str:
-    return ";" if header_line.count(";") > header_line.count(",") else ","
+def arrow_supports(file_size_mb: float) -> bool:
+    """¿El motor Arrow configurado acepta un archivo de este tamaño?"""
+    if not PYARROW_AVAILABLE:
+        return False
+    return settings.ARROW_ENGINE != "pandas" or file_size_mb <= ARROW_MAX_FILE_MB
 
 
 def stream_tables_arrow(
     path: Path, 
     empresas: List[str], 
     nombre_defecto: str
-) -> Iterator[Tuple[str, bool, Dict[str, str], List[str], Optional[str]]]:
+) -> Iterator[Tuple[str, bool, Row, Header, Optional[str]]]:
     """
     Parser optimizado con fallback automático robusto.
-    Intenta usar PyArrow/Pandas, pero si falla, usa el parser estándar.
+    Adaptador por filas (compatibilidad) sobre stream_batches_arrow; si PyArrow
+    no está disponible o falla, usa el parser estándar.
     """
     file_size_mb = path.stat().st_size / 1024 / 1024
     
-    # Para archivos muy grandes o si PyArrow no está disponible, usar parser estándar directamente
-    if not PYARROW_AVAILABLE or file_size_mb > 1000:  # >1GB usar siempre parser estándar
+    # Si PyArrow no está disponible (o el motor pandas recibe >1GB), usar parser estándar directamente
+    if not arrow_supports(file_size_mb):
         logger.info(f"📄 Usando parser estándar para {path.name} ({file_size_mb:.1f} MB)")
         from .parser_stream import stream_tables
         yield from stream_tables(path, empresas, nombre_defecto)
@@ -108,7 +76,8 @@ def stream_tables_arrow(
     
     try:
         # Intentar procesamiento optimizado con PyArrow/Pandas
-        yield from _stream_with_pandas(path, empresas, nombre_defecto, file_size_mb)
+        for batch in stream_batches_arrow(path, empresas, nombre_defecto):
+            yield from iter_batch_rows(batch)
     except Exception as e:
         logger.warning(f"⚠️ Error en PyArrow para {path.name}: {e}, usando parser estándar")
         # Fallback automático al parser estándar
@@ -116,135 +85,295 @@ def stream_tables_arrow(
         yield from stream_tables(path, empresas, nombre_defecto)
 
 
-def _stream_with_pandas(
+def stream_batches_arrow(
     path: Path,
     empresas: List[str],
     nombre_defecto: str,
-    file_size_mb: float
-) -> Iterator[Tuple[str, bool, Dict[str, str], List[str], Optional[str]]]:
+    warnings: Optional[List[str]] = None
+) -> Iterator[ArrowBatch]:
     """
-    Procesamiento optimizado usando Pandas para archivos medianos (<1GB).
-    Mucho más robusto que PyArrow directo.
+    Protocolo columnar: entrega secciones completas (o chunks) como columnas
+    Arrow ya recortadas y con 'Cliente' agregado, sin pasar por dicts por fila.
+    Las advertencias de datos (filas descartadas) se agregan a `warnings`.
     """
-    es_ajustada, cliente, os_name = _detect_head(path, empresas, nombre_defecto)
-    
-    # Leer archivo línea por línea para encontrar secciones
-    with path.open("r", encoding="utf-8", errors="ignore") as f:
-        current_section = None
-        section_lines = []
-        
-        for line_num, line in enumerate(f, 1):
-            line_stripped = _norm(line)
-            
-            if _is_any_marker(line_stripped):
-                # Procesar sección anterior
-                if current_section and section_lines:
-                    try:
-                        yield from _process_section_pandas(
-                            section_lines, current_section, cliente, es_ajustada, os_name
-                        )
-                    except Exception as e:
-                        logger.warning(f"⚠️ Error procesando sección {current_section[:20]}: {e}")
-                        # Continuar con la siguiente sección en lugar de fallar
-                
-                # Iniciar nueva sección
-                current_section = line_stripped
-                section_lines = []
-                
-            elif current_section:
-                section_lines.append(line)
-                
-                # Procesar por chunks para archivos medianos (cada 50k líneas)
-                if len(section_lines) > 50000:
-                    try:
-                        yield from _process_section_pandas(
-                            section_lines, current_section, cliente, es_ajustada, os_name
-                        )
-                        section_lines = []  # Limpiar buffer
-                    except Exception as e:
-                        logger.warning(f"⚠️ Error en chunk de sección {current_section[:20]}: {e}")
-                        section_lines = []  # Limpiar y continuar
-        
-        # Procesar última sección
-        if current_section and section_lines:
+    if settings.ARROW_ENGINE == "pandas":
+        file_size_mb = path.stat().st_size / 1024 / 1024
+        yield from _stream_with_pandas(path, empresas, nombre_defecto, file_size_mb, warnings)
+    else:
+        yield from _stream_with_pyarrow(path, empresas, nombre_defecto)
+
+
+def iter_batch_rows(batch: ArrowBatch) -> Iterator[Tuple[str, bool, Row, Header, Optional[str]]]:
+    """Convierte un batch (columnar o de filas) en el protocolo por filas (tuplas + header compartido)."""
+    table, es_ajustada, cols, os_name, data = batch
+    rows = data if data and isinstance(data[0], tuple) else zip(*[column_values(a) for a in data])
+    for values in rows:
+        yield (table, es_ajustada, values, cols, os_name)
+
+
+def _stream_with_pyarrow(
+    path: Path,
+    empresas: List[str],
+    nombre_defecto: str
+) -> Iterator[ArrowBatch]:
+    """
+    Motor nativo: índice de secciones + `pyarrow.csv` sobre rangos de bytes
+    de cada sección. Memoria acotada a PYARROW_RANGE_BYTES, sin límite de
+    tamaño de archivo.
+    """
+    index = build_section_index(path)
+    es_ajustada, cliente, os_name = _detect_head_lines(index.head_lines, empresas, nombre_defecto)
+    log_skipped_sections(index)
+    sections = index.of_kind("t1", "t2")
+    if not sections:
+        return
+
+    source = pa.memory_map(str(path), "r")
+    try:
+        for sec in sections:
+            t0 = time.perf_counter()
+            stats = {"rows": 0, "fallback": 0}
+            yield from _read_section_native(source, path, sec, cliente, es_ajustada, os_name, stats)
+            if stats["fallback"]:
+                logger.warning(f"⚠️ {stats['fallback']} rango(s) de {sec.marker[:20]} "
+                               f"leídos con el parser estándar (filas irregulares o no UTF-8)")
+            logger.info(f"   ✅ PyArrow procesó {stats['rows']:,} filas de {sec.marker[:30]} "
+                        f"({sec.body_size / 1024 / 1024:.1f} MB en {time.perf_counter() - t0:.2f}s)")
+    finally:
+        source.close()
+
+
+def _raw_width(sec: Section, delim: str) -> int:
+    """Número de campos del header tal como viene en el archivo."""
+    return len(next(csv.reader([sec.header], delimiter=delim), []))
+
+
+def _trim(arr: "pa.Array") -> "pa.Array":
+    """Equivalente vectorizado de _norm(): espacios, luego comillas dobles, luego simples."""
+    arr = pc.utf8_trim_whitespace(arr)
+    arr = pc.utf8_trim(arr, characters='"')
+    return pc.utf8_trim(arr, characters="'")
+
+
+def _content_end(source: "pa.MemoryMappedFile", start: int, end: int) -> Tuple[int, int]:
+    """
+    Separa las líneas vacías finales de una sección (las que preceden al
+    siguiente marcador): devuelve (fin del último registro, nº de líneas vacías).
+    """
+    tail_start = max(start, end - 4096)
+    tail = source.read_at(end - tail_start, tail_start)
+    stripped = tail.rstrip(b"\r\n")
+    if not stripped and tail_start > start:
+        return end, 0  # cola vacía demasiado larga: se deja al parser
+    cut = len(stripped)
+    nl = tail.find(b"\n", cut)
+    cut = len(tail) if nl < 0 else nl + 1
+    if not stripped:
+        cut = 0
+    return tail_start + cut, len(tail[cut:].splitlines())
+
+
+def _read_section_native(
+    source: "pa.MemoryMappedFile",
+    path: Path,
+    sec: Section,
+    cliente: str,
+    es_ajustada: bool,
+    os_name: Optional[str],
+    stats: Dict[str, int]
+) -> Iterator[ArrowBatch]:
+    """
+    Lee el cuerpo de una sección en rangos de ~PYARROW_RANGE_BYTES cortados
+    fuera de comillas (split_range). Cada rango se parsea con pyarrow.csv;
+    si Arrow lo rechaza (filas con más/menos campos que el header, líneas
+    vacías intermedias, bytes no UTF-8) se reintenta en subrangos y solo el
+    subrango culpable (≤ _MIN_NATIVE_RANGE) se parsea con el parser estándar,
+    de modo que el resultado y el orden de las filas son los mismos que en
+    stream_tables.
+    """
+    delim, cols = section_columns(sec)
+    need = len(cols) - 1  # sin 'Cliente'
+    ci = cols.index("Cliente")
+    width = max(_raw_width(sec, delim), 1)
+    names = [f"c{i}" for i in range(width)]
+    table = sec.kind
+
+    read_options = pa_csv.ReadOptions(column_names=names)
+    parse_options = pa_csv.ParseOptions(delimiter=delim, newlines_in_values=True, ignore_empty_lines=False)
+    convert_options = pa_csv.ConvertOptions(
+        column_types={n: pa.string() for n in names},
+        include_columns=names[:need],
+        strings_can_be_null=False,
+        quoted_strings_can_be_null=False,
+    )
+    const = pa.scalar(cliente, pa.string())
+    blank = pa.scalar("", pa.string())
+
+    body_end, trailing_blank = _content_end(source, sec.body_start, sec.body_end)
+    ranges = split_range(path, sec.body_start, body_end, settings.PYARROW_RANGE_BYTES) if body_end > sec.body_start else ()
+    for rng in ranges:
+        todo = [rng]
+        while todo:
+            start, end = todo.pop()
             try:
-                yield from _process_section_pandas(
-                    section_lines, current_section, cliente, es_ajustada, os_name
-                )
-            except Exception as e:
-                logger.warning(f"⚠️ Error en última sección {current_section[:20]}: {e}")
+                source.seek(start)
+                data = pa_csv.read_csv(pa.BufferReader(source.read_buffer(end - start)),  # sin copia
+                                       read_options=read_options, parse_options=parse_options,
+                                       convert_options=convert_options)
+            except pa.ArrowInvalid:
+                # acotar la fila problemática: reintentar en subrangos antes de caer al parser estándar
+                if end - start > _MIN_NATIVE_RANGE:
+                    subs = list(split_range(path, start, end, max((end - start) // 8, _MIN_NATIVE_RANGE)))
+                    if len(subs) > 1:
+                        todo.extend(reversed(subs))
+                        continue
+                stats["fallback"] += 1
+                rows = [with_cliente(r, cliente, ci) for r in iter_range_rows(path, start, end, delim, need)]
+                if rows:
+                    stats["rows"] += len(rows)
+                    yield (table, es_ajustada, cols, os_name, rows)
+                continue
+            for rb in data.to_batches():
+                n = rb.num_rows
+                if not n:
+                    continue
+                arrays = [_trim(col) for col in rb.columns]
+                # mismas reglas que with_cliente(): se agrega al final o se sobrescribe
+                if ci < need:
+                    arrays[ci] = pa.repeat(const, n)
+                    arrays.append(pa.repeat(blank, n))
+                else:
+                    arrays.append(pa.repeat(const, n))
+                stats["rows"] += n
+                yield (table, es_ajustada, cols, os_name, arrays)
+
+    if trailing_blank:
+        # csv.reader convierte cada línea vacía en una fila vacía: se conserva
+        stats["rows"] += trailing_blank
+        yield (table, es_ajustada, cols, os_name, [with_cliente([""] * need, cliente, ci)] * trailing_blank)
+
+
+def _stream_with_pandas(
+    path: Path,
+    empresas: List[str],
+    nombre_defecto: str,
+    file_size_mb: float,
+    warnings: Optional[List[str]] = None
+) -> Iterator[ArrowBatch]:
+    """
+    Procesamiento usando Pandas para archivos medianos (<1GB).
+    Cada sección indexada se lee en chunks de ~PYARROW_RANGE_BYTES cortados
+    fuera de comillas (split_range), de modo que ningún chunk parte un campo
+    multilínea; los nombres de columna salen de section_columns(), no del
+    header que interpretaría pandas.
+    Las filas descartadas por pandas se cuentan y se reportan en `warnings`.
+    """
+    index = build_section_index(path)
+    es_ajustada, cliente, os_name = _detect_head_lines(index.head_lines, empresas, nombre_defecto)
+    log_skipped_sections(index)
+
+    with path.open("rb") as f:
+        for sec in index.of_kind("t1", "t2"):
+            skipped = 0
+            total = 0
+            for start, end in split_range(path, sec.body_start, sec.body_end, settings.PYARROW_RANGE_BYTES):
+                f.seek(start)
+                body = f.read(end - start)
+                try:
+                    batch, dropped = _process_section_pandas(body, sec, cliente, es_ajustada, os_name)
+                except Exception as e:
+                    # chunk ilegible para pandas: el mismo rango con el parser estándar
+                    logger.warning(f"⚠️ Error en Pandas para sección {sec.marker[:20]}: {e}, usando parser estándar")
+                    batch, dropped = _range_rows_batch(path, start, end, sec, cliente, es_ajustada, os_name), 0
+                skipped += dropped
+                if batch is not None:
+                    total += _batch_len(batch)
+                    yield batch
+            logger.info(f"   ✅ Pandas procesó {total:,} filas de {sec.marker[:30]}")
+            if skipped:
+                msg = f"{path.name}: {skipped:,} filas descartadas en '{sec.marker[:30]}' (número de campos inválido)"
+                logger.warning(f"⚠️ {msg}")
+                if warnings is not None:
+                    warnings.append(msg)
+
+
+def _batch_len(batch: ArrowBatch) -> int:
+    data = batch[-1]
+    return len(data) if not data or isinstance(data[0], tuple) else len(data[0])
+
+
+def _count_records(data: bytes) -> int:
+    """Registros CSV en `data` (saltos de línea fuera de comillas, más una línea final sin salto)."""
+    outside = data.split(b'"')[::2]
+    n = sum(seg.count(b"\n") for seg in outside)
+    if data and not data.endswith(b"\n"):
+        n += 1
+    return n
+
+
+def _range_rows_batch(
+    path: Path,
+    start: int,
+    end: int,
+    sec: Section,
+    cliente: str,
+    es_ajustada: bool,
+    os_name: Optional[str]
+) -> Optional[ArrowBatch]:
+    delim, cols = section_columns(sec)
+    need = len(cols) - 1
+    ci = cols.index("Cliente")
+    rows = [with_cliente(r, cliente, ci) for r in iter_range_rows(path, start, end, delim, need)]
+    return (sec.kind, es_ajustada, cols, os_name, rows) if rows else None
 
 
 def _process_section_pandas(
-    lines: List[str],
-    marker: str,
+    data: bytes,
+    sec: Section,
     cliente: str,
     es_ajustada: bool,
     os_name: Optional[str]
-) -> Iterator[Tuple[str, bool, Dict[str, str], List[str], Optional[str]]]:
+) -> Tuple[Optional[ArrowBatch], int]:
     """
-    Procesa una sección usando Pandas (más robusto que PyArrow directo).
+    Procesa un chunk (registros completos, sin header) usando Pandas y lo
+    entrega como un único batch columnar, junto con el número de filas que
+    pandas descartó (on_bad_lines='skip'). Columnas y 'Cliente' igual que
+    _read_section_native().
     """
-    if not lines or len(lines) < 2:  # Necesita al menos header + 1 fila
-        return
-    
-    is_t1 = _is_t1_marker(marker)
-    is_t2 = _is_t2_marker(marker)
-    
-    if not (is_t1 or is_t2):
-        return  # Ignorar otras secciones
-    
-    try:
-        # Detectar delimitador del header
-        header_line = lines[0]
-        delim = _detect_delimiter(header_line)
-        
-        # Crear CSV temporal en memoria
-        from io import StringIO
-        csv_data = StringIO("".join(lines))
-        
-        # Leer con Pandas (más robusto que PyArrow directo)
-        df = pd.read_csv(
-            csv_data,
-            delimiter=delim,
-            dtype=str,  # Todo como string para evitar problemas de tipos
-            na_filter=False,  # No convertir strings a NaN
-            encoding='utf-8',
-            on_bad_lines='skip',  # Saltar líneas problemáticas
-            low_memory=False
-        )
-        
-        if df.empty:
-            return
-        
-        # Agregar columna Cliente si no existe
-        if "Cliente" not in df.columns:
-            df["Cliente"] = cliente
-        else:
-            df["Cliente"] = cliente  # Sobrescribir con el cliente detectado
-        
-        # Obtener columnas finales
-        cols = df.columns.tolist()
-        
-        # Convertir a diccionarios y generar filas
-        rows_processed = 0
-        for _, row in df.iterrows():
-            row_dict = {}
-            for col in df.columns:
-                value = row[col]
-                # Manejar valores NaN o None
-                if pd.isna(value) or value is None:
-                    row_dict[col] = ""
-                else:
-                    row_dict[col] = str(value).strip()
-            
-            yield ("t1" if is_t1 else "t2", es_ajustada, row_dict, cols, os_name)
-            rows_processed += 1
-        
-        if rows_processed > 0:
-            logger.info(f"   ✅ Pandas procesó {rows_processed:,} filas de {marker[:30]}")
-    
-    except Exception as e:
-        logger.warning(f"⚠️ Error en Pandas para sección {marker[:20]}: {e}")
-        # No re-lanzar el error, simplemente continuar
-        return
+    delim, cols = section_columns(sec)
+    need = len(cols) - 1  # sin 'Cliente'
+    ci = cols.index("Cliente")
+    width = max(_raw_width(sec, delim), 1)
+    df = pd.read_csv(
+        io.BytesIO(data),
+        delimiter=delim,
+        header=None,
+        names=list(range(width)),
+        dtype=str,  # Todo como string para evitar problemas de tipos
+        na_filter=False,  # No convertir strings a NaN
+        encoding='utf-8',
+        encoding_errors='ignore',
+        on_bad_lines='skip',  # Saltar líneas problemáticas (se cuentan abajo)
+        skip_blank_lines=False,  # línea vacía = fila vacía, como el parser estándar
+        index_col=False,  # una fila con campos de más no convierte la 1ª columna en índice
+        usecols=list(range(min(need, width))),  # campos de más se recortan, de menos se rellenan
+        low_memory=False
+    )
+    dropped = max(_count_records(data) - len(df), 0)
+    n = len(df)
+    if not n:
+        return None, dropped
+
+    # Columnas Arrow: recorte vectorizado (mismo _norm() que el parser estándar)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    arrays = [_trim(pc.fill_null(col.combine_chunks().cast(pa.string()), "")) for col in table.columns]
+    arrays += [pa.repeat(pa.scalar("", pa.string()), n)] * (need - len(arrays))
+    # mismas reglas que with_cliente(): se agrega al final o se sobrescribe
+    const = pa.repeat(pa.scalar(cliente, pa.string()), n)
+    if ci < need:
+        arrays[ci] = const
+        arrays.append(pa.repeat(pa.scalar("", pa.string()), n))
+    else:
+        arrays.append(const)
+
+    return (sec.kind, es_ajustada, cols, os_name, arrays), dropped
@@ -0,0 +1,213 @@
+"""
+Parser por bytes: clasifica y divide las líneas de Control Statistics /
+RESULTS sin decodificarlas, y decodifica solo los campos que llegan a la
+salida (opcionalmente limitados por OUTPUT_COLUMNS).
+
+Las secciones ignoradas (Host Statistics, ASSET TAGS, SUMMARY) ni siquiera se
+leen: el índice de secciones da los rangos de bytes de las que interesan.
+Dentro de cada rango las líneas se clasifican en bloque (métodos de bytes
+aplicados con map, sin bucle Python por línea):
+  - simples: "a","b",... con exactamente los campos del header y sin más
+    comillas que las de los bordes. Las corridas de líneas simples se dividen
+    de una vez (replace + split) y se transponen a columnas.
+  - el resto (comillas escapadas, campos sin comillas, multilínea, filas con
+    más o menos campos): csv.reader sobre esos registros.
+El resultado es idéntico al de parser_stream.stream_tables.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+from itertools import repeat
+from operator import and_, eq, itemgetter
+import csv
+import mmap
+import re
+import time
+from .section_index import Section, build_section_index, log_section_timing, log_skipped_sections, split_range
+from .parser_stream import _detect_head_lines, _norm, section_columns
+from .rows import Header, Row, intern_header
+from .settings import settings
+
+_RANGE_BYTES = 16 * 1024 * 1024  # rango leído de una vez del memory map
+_MAX_BATCH_ROWS = 50_000         # filas por lote entregado
+_RUN_RE = re.compile(rb"\x01+")  # corridas de líneas simples en el vector de flags
+
+# (table, es_ajustada, header, os_name, rows)
+RowBatch = Tuple[str, bool, Header, Optional[str], List[Row]]
+
+
+def projected_columns(cols: Header, projection: Sequence[str]) -> Header:
+    """Columnas de salida: las del header presentes en `projection` (orden del header) + 'Cliente'."""
+    if not projection:
+        return cols
+    keep = set(projection)
+    return intern_header([c for c in cols if c in keep or c == "Cliente"])
+
+
+class _SectionPlan:
+    """Cómo convertir los campos crudos de una sección en filas de salida."""
+    __slots__ = ("delim", "width", "need", "sources", "out_cols", "order", "assemble", "cliente")
+
+    def __init__(self, sec: Section, cliente: str, projection: Sequence[str]):
+        delim, cols = section_columns(sec)
+        need = len(cols) - 1  # sin 'Cliente'
+        out_cols = projected_columns(cols, projection)
+        pos = {c: j for j, c in enumerate(cols)}
+        ci = cols.index("Cliente")
+        # Misma alineación que with_cliente(): 'Cliente' en ci, y si venía en
+        # el header la última columna queda vacía
+        sources: List[int] = []   # campos crudos que hay que decodificar
+        order: List[int] = []     # posición de cada columna de salida en vals + [cliente, ""]
+        for c in out_cols:
+            j = pos[c]
+            if j == ci:
+                order.append(-2)
+            elif j >= need:
+                order.append(-1)
+            else:
+                order.append(len(sources))
+                sources.append(j)
+        n = len(sources)
+        self.order = [n if o == -2 else n + 1 if o == -1 else o for o in order]
+        self.delim = delim
+        self.width = len(next(csv.reader([sec.header], delimiter=delim), []))  # campos por línea
+        self.need = need
+        self.sources = sources
+        self.out_cols = out_cols
+        self.cliente = cliente
+        get = itemgetter(*self.order)
+        tail = (cliente, "")
+        if len(self.order) == 1:
+            self.assemble = lambda vals: (get((*vals, *tail)),)
+        else:
+            self.assemble = lambda vals: get((*vals, *tail))
+
+    def rows_from_columns(self, columns: List[List[str]], n: int) -> List[Row]:
+        """Columnas decodificadas (una por source) → filas de salida."""
+        k = len(columns)
+        extra = (self.cliente, "")
+        return list(zip(*[columns[o] if o < k else repeat(extra[o - k], n) for o in self.order]))
+
+
+def stream_batches_bytes(
+    path: Path,
+    empresas: List[str],
+    nombre_defecto: str,
+    projection: Optional[Sequence[str]] = None
+) -> Iterator[RowBatch]:
+    """
+    Lotes de filas (tuplas alineadas al header de salida) de Control
+    Statistics y RESULTS. `projection` (por defecto settings.OUTPUT_COLUMNS)
+    limita las columnas de salida y, con ellas, los campos que se decodifican.
+    """
+    if projection is None:
+        projection = settings.OUTPUT_COLUMNS
+    index = build_section_index(path)
+    es_ajustada, cliente, os_name = _detect_head_lines(index.head_lines, empresas, nombre_defecto)
+    log_skipped_sections(index)
+    sections = index.of_kind("t1", "t2")
+    if not sections:
+        return
+
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for sec in sections:
+            t0 = time.perf_counter()
+            n = 0
+            plan = _SectionPlan(sec, cliente, projection)
+            for start, end in split_range(path, sec.body_start, sec.body_end, _RANGE_BYTES):
+                for rows in _range_batches(mm[start:end], plan):
+                    n += len(rows)
+                    yield (sec.kind, es_ajustada, plan.out_cols, os_name, rows)
+            log_section_timing(sec, n, time.perf_counter() - t0)
+
+
+def stream_tables_bytes(
+    path: Path,
+    empresas: List[str],
+    nombre_defecto: str,
+    projection: Optional[Sequence[str]] = None
+) -> Iterator[Tuple[str, bool, Row, Header, Optional[str]]]:
+    """Mismo protocolo por filas que parser_stream.stream_tables."""
+    for table, es_ajustada, cols, os_name, rows in stream_batches_bytes(path, empresas, nombre_defecto, projection):
+        for row in rows:
+            yield (table, es_ajustada, row, cols, os_name)
+
+
+def _range_batches(data: bytes, plan: _SectionPlan) -> Iterator[List[Row]]:
+    """Filas de un rango de registros completos, en lotes de hasta _MAX_BATCH_ROWS."""
+    lines = data.split(b"\n")
+    if lines and not lines[-1]:
+        lines.pop()  # el rango termina en salto de línea
+    if not lines:
+        return
+    sep = b'"' + plan.delim.encode() + b'"'
+    crlf = lines[0].endswith(b"\r")
+    closing = b'"\r' if crlf else b'"'
+
+    # Clasificación en bloque: 1 = línea simple, 0 = registro para csv.reader
+    quotes = list(map(bytes.count, lines, repeat(b'"')))
+    simple = map(eq, quotes, repeat(2 * plan.width))
+    simple = map(and_, simple, map(eq, map(bytes.count, lines, repeat(sep)), repeat(plan.width - 1)))
+    simple = map(and_, simple, map(bytes.startswith, lines, repeat(b'"')))
+    simple = map(and_, simple, map(bytes.endswith, lines, repeat(closing)))
+    flags = bytes(simple)
+
+    out: List[Row] = []
+    pos = 0
+    n = len(lines)
+    for m in _RUN_RE.finditer(flags):
+        a, b = m.span()
+        if b <= pos:
+            continue
+        a = max(a, pos)
+        if a > pos:
+            # un campo multilínea abierto se come las líneas siguientes hasta cerrar
+            odd = sum(quotes[pos:a]) & 1
+            while odd and a < n:
+                odd ^= quotes[a] & 1
+                a += 1
+            out.extend(_complex_rows(lines[pos:a], plan))
+            pos = a
+            if a >= b:
+                continue
+        for s in range(a, b, _MAX_BATCH_ROWS):
+            out.extend(_simple_rows(lines[s:min(b, s + _MAX_BATCH_ROWS)], plan, sep, crlf))
+            if len(out) >= _MAX_BATCH_ROWS:
+                yield out
+                out = []
+        pos = b
+    if pos < n:
+        out.extend(_complex_rows(lines[pos:], plan))
+    if out:
+        yield out
+
+
+def _simple_rows(run: List[bytes], plan: _SectionPlan, sep: bytes, crlf: bool) -> List[Row]:
+    """
+    Corrida de líneas "a","b",...: se une, se quitan las comillas de los
+    bordes y se divide de una vez; columna j = fields[j::width].
+    Solo se decodifican las columnas proyectadas.
+    """
+    blob = b"\n".join(run)
+    joint = b'"\r\n"' if crlf else b'"\n"'
+    fields = blob[1:-2 if crlf else -1].replace(joint, sep).split(sep)
+    width = plan.width
+    columns = []
+    for j in plan.sources:
+        col = map(bytes.decode, fields[j::width], repeat("utf-8"), repeat("ignore"))
+        # _norm() en C: strip(), strip('"'), strip("'")
+        col = map(str.strip, map(str.strip, map(str.strip, col), repeat('"')), repeat("'"))
+        columns.append(list(col))
+    return plan.rows_from_columns(columns, len(run))
+
+
+def _complex_rows(lines: List[bytes], plan: _SectionPlan) -> Iterator[Row]:
+    """Registros no simples: csv.reader línea a línea, igual que parser_stream."""
+    text = [ln.decode("utf-8", errors="ignore") + "\n" for ln in lines]
+    need = plan.need
+    sources = plan.sources
+    assemble = plan.assemble
+    for row in csv.reader(text, delimiter=plan.delim):
+        if len(row) < need:
+            row += [""] * (need - len(row))
+        yield assemble([_norm(row[j]) for j in sources])
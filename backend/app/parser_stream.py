@@ -1,7 +1,11 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Iterator, Tuple, List, Dict, Optional
-import csv, re, sys
+from typing import BinaryIO, Iterator, Tuple, List, Dict, Optional
+from itertools import chain, islice
+import csv, re, sys, time
+from .section_index import (HEAD_LINES, _MARKER_RE, _kind_of, Section, build_section_index,
+                            iter_range_lines, log_section_timing, log_skipped_sections)
+from .rows import Header, Row, intern_header
 
 AJUSTADA_TOKENS = ("AJUSTA","AJUSTADA","AJU")
 
@@ -43,101 +47,139 @@ def _extract_os(head_text: str) -> Optional[str]:
             return re.sub(r"\s+"," ",m.group(1).strip())
     return None
 
-def _detect_head(path: Path, empresas: List[str], nombre_defecto: str) -> tuple[bool,str,Optional[str]]:
-    es_ajustada = False
+def _detect_head_lines(head: List[str], empresas: List[str], nombre_defecto: str) -> tuple[bool,str,Optional[str]]:
     cliente = nombre_defecto
-    os_name: Optional[str] = None
-    with path.open("r", encoding="utf-8", errors="ignore", newline="") as f:
-        head = []
-        for _ in range(10):
-            ln = f.readline()
-            if not ln: break
-            head.append(ln)
-        head_text = " ".join(head)
-        es_ajustada = any(tok in head_text.upper() for tok in AJUSTADA_TOKENS)
-        low = head_text.lower()
-        for e in empresas:
-            if e.lower() in low:
-                cliente = e
-                break
-        os_name = _extract_os(head_text)
+    head_text = " ".join(head)
+    es_ajustada = any(tok in head_text.upper() for tok in AJUSTADA_TOKENS)
+    low = head_text.lower()
+    for e in empresas:
+        if e.lower() in low:
+            cliente = e
+            break
+    os_name = _extract_os(head_text)
     return es_ajustada, cliente, os_name
 
-def stream_tables(path: Path, empresas: List[str], nombre_defecto: str) -> Iterator[Tuple[str,bool,Dict[str,str],List[str],Optional[str]]]:
+def stream_tables(path: Path, empresas: List[str], nombre_defecto: str) -> Iterator[Tuple[str,bool,Row,Header,Optional[str]]]:
+    """
+    Yields: (table ['t1'|'t2'], es_ajustada, row, header, os_name)
+    - row es una tupla alineada a header; header es un único objeto por sección
+    - Usa el índice de secciones (un solo escaneo mmap) para saltar directo a
+      Control Statistics / RESULTS; Host Statistics y demás no se decodifican
+    - Soporta campos multilínea (csv.reader sobre el rango de bytes)
+    - Sección termina SOLO cuando aparece otro marcador fuera de comillas
+    - El tiempo por sección registrado incluye el del consumidor de las filas
+    """
+    index = build_section_index(path)
+    es_ajustada, cliente, os_name = _detect_head_lines(index.head_lines, empresas, nombre_defecto)
+    log_skipped_sections(index)
+
+    for sec in index.of_kind("t1", "t2"):
+        t0 = time.perf_counter()
+        delim, cols = section_columns(sec)
+        table = sec.kind
+        need = len(cols) - 1  # sin 'Cliente'
+        ci = cols.index("Cliente")
+        n = 0
+        for row in iter_range_rows(path, sec.body_start, sec.body_end, delim, need):
+            n += 1
+            yield (table, es_ajustada, with_cliente(row, cliente, ci), cols, os_name)
+        log_section_timing(sec, n, time.perf_counter() - t0)
+
+def stream_tables_from_stream(f: BinaryIO, empresas: List[str], nombre_defecto: str) -> Iterator[Tuple[str,bool,Row,Header,Optional[str]]]:
+    """
+    Mismas filas que stream_tables, leyendo un stream binario secuencial
+    (p. ej. un miembro de ZIP) sin índice ni acceso aleatorio.
+    - Los marcadores se reconocen con la misma regex del índice y solo al
+      inicio de un registro (paridad de comillas par)
+    - Las secciones ignoradas solo se recorren contando comillas, sin decodificar
+    """
+    head = list(islice(f, HEAD_LINES))
+    es_ajustada, cliente, os_name = _detect_head_lines(
+        [ln.decode("utf-8", errors="ignore") for ln in head], empresas, nombre_defecto)
+    lines = chain(head, f)
+    state = {"parity": 0, "marker": None}
+
+    _scan_lines(lines, state)  # hasta el primer marcador
+    while state["marker"] is not None:
+        kind = _kind_of(state["marker"])
+        header = None
+        for ln in lines:
+            state["parity"] ^= ln.count(b'"') & 1
+            if ln.strip():
+                header = ln.decode("utf-8", errors="ignore")
+                break
+        if header is None:
+            break  # marcador sin header al final del stream
+        state["marker"] = None
+        if kind not in ("t1", "t2"):
+            _scan_lines(lines, state)
+            continue
+        delim, cols = header_columns(header)
+        need = len(cols) - 1  # sin 'Cliente'
+        ci = cols.index("Cliente")
+        for row in csv.reader(_scan_lines(lines, state, decode=True), delimiter=delim):
+            if len(row) < need: row += [""] * (need - len(row))
+            elif len(row) > need: row = row[:need]
+            yield (kind, es_ajustada, with_cliente([_norm(v) for v in row], cliente, ci), cols, os_name)
+
+def _scan_lines(lines: Iterator[bytes], state: Dict, decode: bool = False) -> Optional[Iterator[str]]:
+    """
+    Avanza hasta el próximo marcador fuera de comillas y lo deja en
+    state["marker"]. Con decode=True es un generador de las líneas (str)
+    recorridas, listas para csv.reader.
+    """
+    def walk():
+        parity = state["parity"]
+        for ln in lines:
+            if not parity:
+                m = _MARKER_RE.match(ln)
+                if m is not None:
+                    state["parity"] = ln.count(b'"') & 1
+                    state["marker"] = _norm(ln[:m.end()].decode("utf-8", errors="ignore"))
+                    return
+            parity ^= ln.count(b'"') & 1
+            if decode:
+                yield ln.decode("utf-8", errors="ignore")
+        state["parity"] = parity
+    if decode:
+        return walk()
+    for _ in walk():
+        pass
+    return None
+
+def header_columns(header: str) -> tuple[str, Header]:
+    """Delimitador y header (con 'Cliente', al final si no venía) a partir de la línea de encabezado."""
+    delim = _detect_delimiter(header)
+    cols = next(csv.reader([header], delimiter=delim), [])
+    cols = [_norm(c) for c in cols]
+    if "Cliente" not in cols:
+        cols.append("Cliente")
+    return delim, intern_header(cols)
+
+def section_columns(sec: Section) -> tuple[str, Header]:
+    """Delimitador y header (con 'Cliente', al final si no venía) de una sección indexada."""
+    return header_columns(sec.header)
+
+def with_cliente(row: List[str], cliente: str, ci: int) -> Row:
+    """Fila de `need` valores → tupla completa con el cliente en la posición ci."""
+    if ci == len(row):
+        return (*row, cliente)
+    # 'Cliente' venía en el header: se sobrescribe y la última columna queda vacía
+    r = row + [""]
+    r[ci] = cliente
+    return tuple(r)
+
+def iter_range_rows(path: Path, start: int, end: int, delim: str, need: int) -> Iterator[List[str]]:
     """
-    Yields: (table ['t1'|'t2'], es_ajustada, row_dict, header_cols, os_name)
-    - Ignora 'Host Statistics'
-    - Soporta campos multilínea (csv.reader con newline="")
-    - Sección termina SOLO cuando aparece otro marcador
+    Filas normalizadas (exactamente `need` valores) del rango de bytes
+    [start, end). El rango debe empezar y terminar en límites de registro.
     """
-    es_ajustada, cliente, os_name = _detect_head(path, empresas, nombre_defecto)
-
-    with path.open("r", encoding="utf-8", errors="ignore", newline="") as f:
-        pending: Optional[str] = None
-
-        def next_line() -> str:
-            nonlocal pending
-            if pending is not None:
-                ln = pending; pending = None; return ln
-            return f.readline()
-
-        while True:
-            # Busca un marcador
-            marker = ""
-            while True:
-                ln = next_line()
-                if not ln: break
-                s = _norm(ln)
-                if not s: continue
-                if _is_any_marker(s):
-                    marker = s
-                    break
-            if not marker:
-                break  # EOF
-
-            # Header de la sección
-            header_line = ""
-            while True:
-                ln = next_line()
-                if not ln: break
-                if ln.strip():
-                    header_line = ln
-                    break
-            if not header_line:
-                continue
-
-            delim = _detect_delimiter(header_line)
-            cols = next(csv.reader([header_line], delimiter=delim), [])
-            cols = [_norm(c) for c in cols]
-            if "Cliente" not in cols:
-                cols.append("Cliente")
-
-            class SectionIter:
-                def __iter__(self): return self
-                def __next__(self):
-                    nonlocal pending
-                    ln = f.readline()
-                    if ln == "": raise StopIteration
-                    s = _norm(ln)
-                    if _is_any_marker(s):
-                        pending = ln
-                        raise StopIteration
-                    return ln
-
-            is_t1 = _is_t1_marker(marker)
-            is_t2 = _is_t2_marker(marker)
-            if not (is_t1 or is_t2):
-                # Host Statistics u otros → saltar sección completa
-                for _ in csv.reader(SectionIter(), delimiter=delim):
-                    pass
-                continue
-
-            rdr = csv.reader(SectionIter(), delimiter=delim)
-            need = len(cols) - 1  # sin 'Cliente'
-            for row in rdr:
-                row = list(row)
-                if len(row) < need: row += [""] * (need - len(row))
-                elif len(row) > need: row = row[:need]
-                obj = {cols[i]: _norm(row[i]) for i in range(need)}
-                obj["Cliente"] = cliente
-                yield ("t1" if is_t1 else "t2", es_ajustada, obj, cols, os_name)
+    for row in csv.reader(iter_range_lines(path, start, end), delimiter=delim):
+        if len(row) < need: row += [""] * (need - len(row))
+        elif len(row) > need: row = row[:need]
+        yield [_norm(v) for v in row]
+
+def parse_range_rows(args: tuple) -> List[List[str]]:
+    """Worker de multiprocessing: parsea un rango completo y devuelve sus filas."""
+    path, start, end, delim, need = args
+    return list(iter_range_rows(Path(path), start, end, delim, need))
@@ -0,0 +1,108 @@
+"""
+Representación compacta de filas compartida por todos los parsers.
+
+Cada fila es una tupla de valores alineada a un `Header`; el header de una
+sección es un único objeto internado que todas sus filas referencian, en
+lugar de repetir las claves en un dict por fila.
+"""
+from __future__ import annotations
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Row = Tuple[str, ...]
+
+
+class Header(tuple):
+    """Columnas de una sección (tupla inmutable de nombres)."""
+    __slots__ = ()
+
+    def as_dict(self, row: Sequence[str]) -> Dict[str, str]:
+        """Fila → dict (solo para preview / consumidores que lo necesiten)."""
+        return dict(zip(self, row))
+
+
+_HEADERS: Dict[Tuple[str, ...], Header] = {}
+
+
+def column_values(arr) -> List[str]:
+    """Columna Arrow → lista de str (vía numpy; mucho más rápido que to_pylist)."""
+    return arr.to_numpy(zero_copy_only=False).tolist()
+
+
+def intern_header(cols: Iterable[str]) -> Header:
+    """Devuelve el Header compartido para este layout de columnas."""
+    key = tuple(cols)
+    h = _HEADERS.get(key)
+    if h is None:
+        h = _HEADERS[key] = Header(key)
+    return h
+
+
+class ProjectionPlan:
+    """
+    Plan precompilado para llevar filas de un layout entrante al layout
+    maestro: `index[j]` es la posición, dentro de `fila + fill`, del valor
+    de la columna maestra j. `gather` aplica el plan con un único itemgetter.
+    """
+    __slots__ = ("index", "fill", "identity", "missing", "dropped", "reordered", "gather")
+
+    def __init__(self, index: Tuple[int, ...], fill: Tuple[str, ...], identity: bool,
+                 missing: Tuple[str, ...], dropped: Tuple[str, ...], reordered: bool):
+        self.index = index
+        self.fill = fill            # valores de relleno (uno por columna maestra ausente)
+        self.identity = identity    # el layout entrante ya es el maestro
+        self.missing = missing      # columnas maestras que no trae la entrada
+        self.dropped = dropped      # columnas de la entrada que no existen en el maestro
+        self.reordered = reordered
+        self.gather = self._compile_gather()
+
+    def _compile_gather(self) -> Callable[[Sequence[str]], Row]:
+        if self.identity:
+            return tuple
+        get = itemgetter(*self.index)
+        fill = self.fill
+        if len(self.index) == 1:
+            return lambda r: (get((*r, *fill)),)
+        if not fill:
+            return get
+        return lambda r: get((*r, *fill))
+
+    def describe(self) -> str:
+        """Resumen legible de las diferencias respecto al header maestro."""
+        parts = []
+        if self.missing:
+            parts.append(f"columnas faltantes rellenadas: {', '.join(self.missing)}")
+        if self.dropped:
+            parts.append(f"columnas fuera del header maestro descartadas: {', '.join(self.dropped)}")
+        if self.reordered and not parts:
+            parts.append("orden de columnas distinto (reasignado)")
+        return "; ".join(parts)
+
+
+def compile_plan(master: Sequence[str], incoming: Sequence[str],
+                 fill_values: Optional[Dict[str, str]] = None) -> ProjectionPlan:
+    """Compila el plan de proyección incoming → master (relleno por defecto "")."""
+    fill_values = fill_values or {}
+    pos: Dict[str, int] = {}
+    for i, c in enumerate(incoming):
+        pos.setdefault(c, i)  # columnas duplicadas: gana la primera
+    index: List[int] = []
+    fill: List[str] = []
+    missing: List[str] = []
+    for c in master:
+        if c in pos:
+            index.append(pos[c])
+        else:
+            index.append(len(incoming) + len(fill))
+            fill.append(fill_values.get(c, ""))
+            missing.append(c)
+    master_set = set(master)
+    present = [i for i in index if i < len(incoming)]
+    return ProjectionPlan(
+        index=tuple(index),
+        fill=tuple(fill),
+        identity=tuple(master) == tuple(incoming),
+        missing=tuple(missing),
+        dropped=tuple(c for c in incoming if c not in master_set),
+        reordered=present != sorted(present),
+    )
@@ -0,0 +1,248 @@
+"""
+Índice de secciones por offsets de bytes para reportes Qualys.
+
+Mapea el CSV en memoria (mmap) una sola vez y registra, para cada sección
+("Control Statistics", "RESULTS", "Host Statistics", "ASSET TAGS", "SUMMARY"),
+el rango de bytes del encabezado y del cuerpo. Los parsers pueden entonces
+saltar directamente a las secciones que necesitan sin decodificar el resto.
+
+Los marcadores solo se reconocen al inicio de un registro: una línea que cae
+dentro de un campo entre comillas multilínea (paridad de comillas impar) no
+abre sección, aunque su texto sea "RESULTS".
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple
+import logging
+import mmap
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+HEAD_LINES = 10
+_COUNT_CHUNK = 16 * 1024 * 1024  # contar comillas por bloques (evita copiar GBs)
+_READ_BUFFER = 1024 * 1024
+
+# Equivalente en bytes de _norm(línea) + _is_any_marker(): espacios, comillas
+# dobles y simples alrededor del texto del marcador.
+_MARKER_RE = re.compile(
+    rb"^[ \t\x0b\x0c]*\"*'*"
+    rb"(CONTROL STATISTICS[^\r\n]*|HOST STATISTICS[^\r\n]*|RESULTS|ASSET TAGS|SUMMARY)"
+    rb"'*\"*[ \t\x0b\x0c]*\r?$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Prefiltro barato: inicio de línea seguido de la inicial de algún marcador.
+# Solo estos candidatos se validan con _MARKER_RE.
+_CANDIDATE_RE = re.compile(rb"\n[ \t\x0b\x0c\"']*[CHRAScras]")
+
+
+def _norm(s: str) -> str:
+    return s.strip().strip('"').strip("'")
+
+
+def _kind_of(marker: str) -> str:
+    up = marker.upper()
+    if up.startswith("CONTROL STATISTICS"):
+        return "t1"
+    if up == "RESULTS":
+        return "t2"
+    if up.startswith("HOST STATISTICS"):
+        return "host"
+    if up == "ASSET TAGS":
+        return "asset_tags"
+    return "summary"
+
+
+class Section(NamedTuple):
+    kind: str           # 't1' | 't2' | 'host' | 'asset_tags' | 'summary'
+    marker: str         # texto normalizado del marcador
+    marker_start: int   # offset de la línea del marcador
+    header_start: int   # offset de la línea de encabezado
+    header_end: int     # fin del encabezado (incluye salto de línea) = inicio del cuerpo
+    body_end: int       # inicio del siguiente marcador o EOF
+    header: str         # línea de encabezado decodificada (sin tokenizar)
+
+    @property
+    def body_start(self) -> int:
+        return self.header_end
+
+    @property
+    def body_size(self) -> int:
+        return self.body_end - self.header_end
+
+
+class SectionIndex(NamedTuple):
+    path: Path
+    size: int
+    head_lines: List[str]   # primeras HEAD_LINES líneas (detección ajustada/cliente/os)
+    sections: List[Section]
+
+    def of_kind(self, *kinds: str) -> List[Section]:
+        return [s for s in self.sections if s.kind in kinds]
+
+
+def _count_quotes(mm, start: int, end: int) -> int:
+    n = 0
+    while start < end:
+        stop = min(end, start + _COUNT_CHUNK)
+        n += mm[start:stop].count(b'"')
+        start = stop
+    return n
+
+
+def _line_end(mm, pos: int, size: int) -> int:
+    """Offset justo después del salto de línea que sigue a `pos` (o EOF)."""
+    nl = mm.find(b"\n", pos)
+    return size if nl < 0 else nl + 1
+
+
+def _read_head(mm, size: int) -> List[str]:
+    lines: List[str] = []
+    pos = 0
+    while pos < size and len(lines) < HEAD_LINES:
+        end = _line_end(mm, pos, size)
+        lines.append(mm[pos:end].decode("utf-8", errors="ignore"))
+        pos = end
+    return lines
+
+
+def read_head_lines(path: Path) -> List[str]:
+    """Primeras HEAD_LINES líneas del archivo (las mismas que SectionIndex.head_lines)."""
+    if path.stat().st_size == 0:
+        return []
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return _read_head(mm, len(mm))
+
+
+def _next_nonblank_line(mm, pos: int, size: int) -> Tuple[Optional[int], int]:
+    while pos < size:
+        end = _line_end(mm, pos, size)
+        if mm[pos:end].strip():
+            return pos, end
+        pos = end
+    return None, size
+
+
+def _candidate_starts(mm) -> Iterator[int]:
+    yield 0
+    for m in _CANDIDATE_RE.finditer(mm):
+        yield m.start() + 1
+
+
+def build_section_index(path: Path) -> SectionIndex:
+    """
+    Recorre el archivo una vez (mmap + regex en C) y devuelve el índice de
+    secciones. El encabezado de cada sección es la siguiente línea no vacía
+    tras el marcador; el cuerpo llega hasta el siguiente marcador o EOF.
+    """
+    size = path.stat().st_size
+    if size == 0:
+        return SectionIndex(path, 0, [], [])
+    t0 = time.perf_counter()
+
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        head_lines = _read_head(mm, size)
+
+        # Candidatos a marcador fuera de comillas: (inicio, fin de línea, texto)
+        markers: List[Tuple[int, int, str]] = []
+        pos = 0
+        parity = 0
+        for start in _candidate_starts(mm):
+            m = _MARKER_RE.match(mm, start)
+            if m is None:
+                continue
+            parity = (parity + _count_quotes(mm, pos, start)) & 1
+            pos = start
+            if parity:
+                continue  # línea dentro de un campo multilínea
+            text = _norm(mm[start:m.end()].decode("utf-8", errors="ignore"))
+            markers.append((start, _line_end(mm, m.end(), size), text))
+
+        sections: List[Section] = []
+        i = 0
+        while i < len(markers):
+            start, after, text = markers[i]
+            hdr_start, hdr_end = _next_nonblank_line(mm, after, size)
+            if hdr_start is None:
+                break  # marcador sin header al final del archivo
+            # Un marcador usado como header queda consumido (igual que el parser por líneas)
+            j = i + 1
+            while j < len(markers) and markers[j][0] < hdr_end:
+                j += 1
+            body_end = markers[j][0] if j < len(markers) else size
+            header = mm[hdr_start:hdr_end].decode("utf-8", errors="ignore")
+            sections.append(Section(_kind_of(text), text, start, hdr_start, hdr_end, body_end, header))
+            i = j
+
+    logger.info(f"📑 Índice de {path.name}: {len(sections)} secciones "
+                f"({size / 1024 / 1024:.1f} MB en {time.perf_counter() - t0:.2f}s)")
+    return SectionIndex(path, size, head_lines, sections)
+
+
+def log_skipped_sections(index: SectionIndex, kinds: Sequence[str] = ("t1", "t2")) -> None:
+    """Registra las secciones que el parser salta sin tokenizar (todas menos `kinds`)."""
+    for sec in index.sections:
+        if sec.kind not in kinds:
+            logger.info(f"   ⏭️ {sec.marker[:30]} omitida "
+                        f"({(sec.body_end - sec.marker_start) / 1024 / 1024:.1f} MB sin tokenizar)")
+
+
+def log_section_timing(sec: Section, rows: int, elapsed: float) -> None:
+    """Tiempo de parseo de una sección procesada."""
+    logger.info(f"   ⏱️ {sec.marker[:30]}: {rows:,} filas "
+                f"({sec.body_size / 1024 / 1024:.1f} MB en {elapsed:.2f}s)")
+
+
+def iter_range_lines(path: Path, start: int, end: int) -> Iterator[str]:
+    """
+    Devuelve las líneas (decodificadas, con su salto de línea) del rango
+    [start, end) del archivo, listas para csv.reader.
+    """
+    with path.open("rb", buffering=_READ_BUFFER) as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            ln = f.readline()
+            if not ln:
+                break
+            pos += len(ln)
+            if pos > end:
+                ln = ln[:len(ln) - (pos - end)]
+            yield ln.decode("utf-8", errors="ignore")
+
+
+def split_range(path: Path, start: int, end: int, target_bytes: int) -> Iterator[Tuple[int, int]]:
+    """
+    Divide [start, end) en rangos de ~target_bytes que terminan justo después
+    de un salto de línea fuera de comillas, de modo que cada rango contiene
+    registros completos y puede parsearse de forma independiente.
+    `start` debe ser un inicio de registro (p. ej. Section.body_start).
+    Es un generador: los primeros rangos están disponibles antes de terminar
+    de recorrer la sección.
+    """
+    if target_bytes <= 0 or end - start <= target_bytes:
+        yield (start, end)
+        return
+
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        cur = start
+        while end - cur > target_bytes:
+            pos = cur + target_bytes
+            parity = _count_quotes(mm, cur, pos) & 1
+            cut = None
+            while pos < end:
+                nl = mm.find(b"\n", pos, end)
+                if nl < 0:
+                    break
+                parity = (parity + _count_quotes(mm, pos, nl + 1)) & 1
+                pos = nl + 1
+                if not parity:
+                    cut = pos
+                    break
+            if cut is None:
+                break  # el resto es un único registro (o no hay más saltos de línea)
+            yield (cur, cut)
+            cur = cut
+        if cur < end:
+            yield (cur, end)
@@ -14,15 +14,48 @@ class Settings(BaseSettings):
     ALLOWED_ORIGINS: list[str] = []
     CSV_PART_MAX_ROWS: int = 1000000
     CSV_GZIP: bool = False
+    CSV_COMPRESSION: str = "gzip"  # Códec con CSV_GZIP=true: "gzip" (.csv.gz) o "zstd" (.csv.zst)
+    OUTPUT_FORMAT: str = "csv"  # "csv" o "parquet" (requiere pyarrow); mismas 4 tablas, mismos nombres y partes
+    PARQUET_ROW_GROUP_ROWS: int = 250000  # Filas por row group (conviene que divida a CSV_PART_MAX_ROWS)
+    PARQUET_COMPRESSION: str = "zstd"  # Códec de las partes Parquet (zstd, snappy, gzip, none)
+    PARQUET_DICTIONARY_COLUMNS: list[str] = ["Cliente", "Status", "Technology", "Control ID", "Criticality Label",
+                                             "Tracking Method", "Operating System"]  # Con diccionario (scan_name, periodo y os siempre)
+    XLSX_SHARED_STRING_COLUMNS: list[str] = ["Cliente", "Status", "Technology", "Control ID", "Criticality Label",
+                                             "Tracking Method", "Operating System"]  # Columnas XLSX en shared strings (scan_name, periodo y os siempre)
     BATCH_SIZE: int = 1000
     
     # Configuración de rendimiento
     WORKER_PROCESSES: int = 4  # Número de workers para procesamiento paralelo
+    JOB_WORKERS: int = 2  # Jobs de /api/process-async ejecutándose a la vez (procesos fuera del event loop)
+    JOB_QUEUE_MAX: int = 16  # Jobs en espera (entre todas las instancias); con la cola llena se responde 429
+    JOB_QUEUE_MAX_PER_CLIENT: int = 8  # Jobs en espera de un mismo cliente; más allá se responde 429
+    JOB_MAX_RUNNING: int = 0  # Presupuesto de CPU: jobs corriendo a la vez entre todas las instancias (0 = sin límite)
+    JOB_MAX_RUNNING_MB: int = 0  # Presupuesto de disco: MB de entrada en proceso a la vez (0 = sin límite)
+    JOB_ESTIMATE_MB_PER_SEC: float = 5.0  # Throughput por job para estimar esperas hasta medir jobs reales
+    JOB_LEASE_SECONDS: int = 60  # Sin heartbeat por este tiempo, otra instancia retoma el job
+    JOB_HEARTBEAT_SECONDS: int = 10  # Cada cuánto renueva una instancia los leases de sus jobs
+    JOB_POLL_SECONDS: float = 2.0  # Cada cuánto busca jobs nuevos en la cola compartida
+    JOB_MAX_ATTEMPTS: int = 3  # Veces que se retoma un job interrumpido antes de darlo por fallido
+    JOB_EVENTS_INTERVAL: float = 0.5  # Cada cuánto revisa /api/jobs/{id}/events si hay cambios para enviar
     CHUNK_SIZE_BYTES: int = 50 * 1024 * 1024  # 50MB chunks para lectura
     WRITE_BUFFER_SIZE: int = 256 * 1024  # 256KB buffer de escritura
-    ENABLE_PARALLEL_COMPRESSION: bool = True  # Usar pigz si está disponible
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024  # Bloque de copia de uploads a disco (memoria acotada)
+    ENABLE_PARALLEL_COMPRESSION: bool = True  # Comprimir la salida por bloques en WORKER_PROCESSES hilos
+    COMPRESS_BLOCK_BYTES: int = 1024 * 1024  # Bloque comprimido por separado (miembro gzip / frame zstd)
+    WRITER_THREADS: bool = False  # Un hilo de escritura por tabla de salida: el parseo sigue mientras se escribe/comprime
+    WRITER_QUEUE_BATCHES: int = 8  # Lotes en cola por hilo de escritura (con la cola llena el parser espera)
+    CSV_ARROW_WRITER: bool = False  # Escribir lotes columnares con pyarrow.csv (entrecomilla todos los textos)
     USE_PYARROW: bool = True  # Usar PyArrow para parsing ultra-rápido
     PYARROW_BATCH_SIZE: int = 50000  # Filas por batch en PyArrow
+    PARSER_ENGINE: str = "auto"  # "auto" (arrow si está disponible; si no python, o bytes con OUTPUT_COLUMNS), "arrow", "bytes" o "python"
+    OUTPUT_COLUMNS: list[str] = []  # Proyección de columnas de salida del motor bytes (vacío = todas); "Cliente" siempre se incluye; con proyección "auto" usa bytes en vez de python
+    ARROW_ENGINE: str = "native"  # "native" (pyarrow.csv sobre rangos de bytes) o "pandas"
+    PYARROW_RANGE_BYTES: int = 16 * 1024 * 1024  # Rango de bytes de sección leído en cada paso (pyarrow.csv / pandas)
+    INTRA_FILE_PARALLEL_MIN_MB: int = 200  # Archivos mayores se parsean por rangos en el pool
+    INTRA_FILE_CHUNK_BYTES: int = 16 * 1024 * 1024  # Tamaño de cada rango de RESULTS/Control Statistics
+    COMPRESSED_INPUT_MODE: str = "stream"  # ZIP / .csv.gz / .csv.zst: "stream" (lectura secuencial, sin temporales) o "extract" (temporal + motor configurado)
+    PARSE_CACHE_ENABLED: bool = True  # Reutilizar el parseo de reportes ya vistos (hash de contenido, requiere pyarrow)
+    PARSE_CACHE_MAX_MB: int = 2048  # Tamaño máximo de OUTPUT_BASE_DIR/cache (desalojo LRU)
 
     # Configuración de Elasticsearch
     ES_BASE_URL: str | None = None      # URL del cluster de Elasticsearch
@@ -0,0 +1,357 @@
+"""
+Fuentes CSV: archivos en disco, miembros de un ZIP o CSV comprimidos
+(.csv.gz / .csv.zst).
+
+Los miembros de un ZIP se leen como stream directamente del archivo (cada
+worker abre su propio handle), sin copiarlos a la carpeta de uploads. Los
+CSV comprimidos se descomprimen al vuelo en otro proceso (pigz/gzip/zstd si
+están instalados) o en un hilo aparte, de modo que la descompresión se
+solapa con el parseo. Solo se extraen a un temporal cuando el motor necesita
+acceso aleatorio (mmap o rangos de bytes), y el temporal tiene nombre único:
+miembros con el mismo nombre en carpetas distintas no se pisan.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, List, NamedTuple, Optional, Union
+from uuid import uuid4
+import gzip
+import hashlib
+import io
+import logging
+import queue
+import shutil
+import struct
+import subprocess
+import threading
+import zipfile
+
+from .section_index import HEAD_LINES, read_head_lines
+from .parser_stream import stream_tables, stream_tables_from_stream
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# sufijo del upload → compresión
+_COMPRESSED_SUFFIXES = {".csv.gz": "gzip", ".csv.zst": "zstd"}
+# herramientas externas de descompresión, por preferencia
+_EXTERNAL_TOOLS = {"gzip": (("pigz", "-dc"), ("gzip", "-dc")), "zstd": (("zstd", "-dcq"),)}
+_QUEUE_CHUNKS = 8  # bloques descomprimidos en vuelo por fuente (hilo)
+_ZSTD_READ_BYTES = 128 * 1024  # entrada comprimida por paso (la salida crece según el ratio)
+_DEFLATE_MAX_RATIO = 1032  # deflate no comprime más que ~1032:1
+
+
+class CsvSource(NamedTuple):
+    path: Path                        # CSV en disco, o el ZIP / archivo comprimido que lo contiene
+    member: Optional[str] = None      # ruta del miembro dentro del ZIP
+    digest: Optional[str] = None      # SHA-256 ya conocido (p. ej. calculado al subir)
+    size: Optional[int] = 0           # bytes sin comprimir (None si el .gz / .zst no lo dice con certeza)
+    compression: Optional[str] = None  # "gzip" | "zstd" para .csv.gz / .csv.zst
+
+    @property
+    def name(self) -> str:
+        """Nombre para logs y advertencias (ruta completa del miembro si es de un ZIP)."""
+        return self.member if self.member is not None else self.path.name
+
+    @property
+    def stem(self) -> str:
+        name = Path(self.name).name
+        for suffix in (*_COMPRESSED_SUFFIXES, ".csv"):
+            if name.lower().endswith(suffix):
+                return name[:-len(suffix)]
+        return Path(name).stem
+
+    @property
+    def progress_bytes(self) -> int:
+        """Tamaño para el progreso: sin comprimir si se conoce, si no el del archivo comprimido."""
+        return self.size if self.size is not None else self.path.stat().st_size
+
+    @property
+    def size_mb(self) -> float:
+        return self.progress_bytes / 1024 / 1024
+
+    @property
+    def is_member(self) -> bool:
+        return self.member is not None
+
+    @property
+    def sequential(self) -> bool:
+        """Solo se puede leer en secuencia (miembro de ZIP o CSV comprimido)."""
+        return self.member is not None or self.compression is not None
+
+    @contextmanager
+    def open(self) -> Iterator[BinaryIO]:
+        """Stream binario secuencial del contenido (descomprimido)."""
+        if self.member is not None:
+            with zipfile.ZipFile(self.path, "r") as z, z.open(self.member) as member:
+                # ZipExtFile.readline es Python puro: un buffer en C delante acelera la lectura por líneas
+                yield io.BufferedReader(member, settings.UPLOAD_CHUNK_BYTES)
+        elif self.compression is not None:
+            with _decompress(self.path, self.compression) as f:
+                yield f
+        else:
+            with self.path.open("rb", buffering=settings.WRITE_BUFFER_SIZE) as f:
+                yield f
+
+    def head_lines(self) -> List[str]:
+        """Primeras HEAD_LINES líneas (las mismas que SectionIndex.head_lines)."""
+        if not self.sequential:
+            return read_head_lines(self.path)
+        lines: List[str] = []
+        with self.open() as f:
+            for ln in f:
+                lines.append(ln.decode("utf-8", errors="ignore"))
+                if len(lines) >= HEAD_LINES:
+                    break
+        return lines
+
+    def extract(self, dst_dir: Path) -> Path:
+        """Copia el contenido a un archivo temporal único en dst_dir (para acceso aleatorio)."""
+        dst_dir.mkdir(parents=True, exist_ok=True)
+        out = dst_dir / f"{self.stem}-{uuid4().hex[:8]}.csv"
+        with self.open() as src, out.open("wb", buffering=settings.WRITE_BUFFER_SIZE) as f:
+            for chunk in iter(lambda: src.read(settings.UPLOAD_CHUNK_BYTES), b""):
+                f.write(chunk)
+        return out
+
+
+def as_source(item: Union[Path, CsvSource]) -> CsvSource:
+    """Path → CsvSource (las CsvSource pasan tal cual)."""
+    if isinstance(item, CsvSource):
+        return item
+    compression = _compression_of(item.name)
+    size = _uncompressed_size(item, compression) if compression else item.stat().st_size
+    return CsvSource(path=item, size=size, compression=compression)
+
+
+def upload_sources(filename: str, dest: Path, digest: Optional[str] = None) -> Optional[List[CsvSource]]:
+    """
+    Fuentes CSV de un archivo subido según su extensión (.csv, .zip,
+    .csv.gz, .csv.zst), o None si el tipo no se soporta.
+    Lanza zipfile.BadZipFile si el ZIP es inválido.
+    """
+    low = filename.lower()
+    if low.endswith(".zip"):
+        return zip_sources(dest, digest)
+    if low.endswith(".csv"):
+        return [CsvSource(dest, None, digest, dest.stat().st_size)]
+    compression = _compression_of(low)
+    if compression is None:
+        return None
+    if compression == "zstd" and not (ZSTD_AVAILABLE or _external_tool(compression)):
+        raise ValueError("soporte zstd no instalado (paquete zstandard o binario zstd)")
+    return [CsvSource(dest, None, digest, _uncompressed_size(dest, compression), compression)]
+
+
+def zip_sources(zip_path: Path, digest: Optional[str] = None) -> List[CsvSource]:
+    """
+    Miembros .csv del ZIP, sin extraerlos. Si se conoce el hash del ZIP, el
+    de cada miembro se deriva de él y de su ruta (mismo ZIP → mismas claves
+    de caché, sin descomprimir para hashear).
+    """
+    sources: List[CsvSource] = []
+    with zipfile.ZipFile(zip_path, "r") as z:
+        for info in z.infolist():
+            name = info.filename
+            if info.is_dir() or not name.lower().endswith(".csv"):
+                continue
+            member_digest = hashlib.sha256(f"{digest}:{name}".encode()).hexdigest() if digest else None
+            sources.append(CsvSource(zip_path, name, member_digest, info.file_size))
+    return sources
+
+
+@contextmanager
+def local_path(source: CsvSource, tmp_dir: Path) -> Iterator[Path]:
+    """Ruta con acceso aleatorio: el CSV mismo, o un temporal extraído que se borra al salir."""
+    if not source.sequential:
+        yield source.path
+        return
+    path = source.extract(tmp_dir)
+    try:
+        yield path
+    finally:
+        path.unlink(missing_ok=True)
+
+
+def stream_source_tables(source: CsvSource, empresas: List[str], nombre_defecto: str):
+    """Protocolo por filas de stream_tables para cualquier fuente (ZIP / comprimidos se leen como stream)."""
+    if not source.sequential:
+        yield from stream_tables(source.path, empresas, nombre_defecto)
+        return
+    with source.open() as f:
+        yield from stream_tables_from_stream(f, empresas, nombre_defecto)
+
+
+def source_digest(source: CsvSource) -> str:
+    """SHA-256 del archivo (del contenido descomprimido, si es un miembro de ZIP)."""
+    if source.digest:
+        return source.digest
+    h = hashlib.sha256()
+    opener = source.open() if source.is_member else source.path.open("rb")
+    with opener as f:
+        for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _compression_of(filename: str) -> Optional[str]:
+    low = filename.lower()
+    for suffix, compression in _COMPRESSED_SUFFIXES.items():
+        if low.endswith(suffix):
+            return compression
+    return None
+
+
+def _uncompressed_size(path: Path, compression: str) -> Optional[int]:
+    """
+    Tamaño descomprimido según la cabecera/cola del formato, o None si no
+    se puede saber. El ISIZE de gzip es módulo 2^32 (RFC 1952): solo se usa
+    si el archivo es tan chico que ni al ratio máximo de deflate llega a 4GB.
+    """
+    size = path.stat().st_size
+    try:
+        if compression == "gzip":
+            if size < 18 or size * _DEFLATE_MAX_RATIO >= 2 ** 32:
+                return None
+            with path.open("rb") as f:
+                f.seek(-4, io.SEEK_END)
+                isize = struct.unpack("<I", f.read(4))[0]
+            return isize if size <= isize <= size * _DEFLATE_MAX_RATIO else None  # si no, cola truncada o basura
+        if compression == "zstd" and ZSTD_AVAILABLE:
+            with path.open("rb") as f:
+                content = zstandard.frame_content_size(f.read(18))
+            if content > 0:
+                return content
+    except (OSError, struct.error, zstandard.ZstdError if ZSTD_AVAILABLE else OSError):
+        pass
+    return None
+
+
+def _external_tool(compression: str) -> Optional[tuple]:
+    if not settings.ENABLE_PARALLEL_COMPRESSION:
+        return None
+    for tool in _EXTERNAL_TOOLS[compression]:
+        if shutil.which(tool[0]):
+            return tool
+    return None
+
+
+@contextmanager
+def _decompress(path: Path, compression: str) -> Iterator[BinaryIO]:
+    """
+    Stream descomprimido. Con pigz/gzip/zstd instalados la descompresión
+    corre en un proceso aparte (igual que pigz en la escritura); si no, en
+    un hilo (zlib y zstd liberan el GIL). En ambos casos se solapa con el parseo.
+    """
+    tool = _external_tool(compression)
+    if tool is None:
+        if compression == "zstd" and not ZSTD_AVAILABLE:
+            raise ValueError(f"{path.name}: soporte zstd no instalado (paquete zstandard o binario zstd)")
+        chunks = _gzip_chunks if compression == "gzip" else _zstd_chunks
+        raw = _ThreadedReader(lambda: chunks(path))
+        with io.BufferedReader(raw, settings.UPLOAD_CHUNK_BYTES) as f:
+            yield f
+        return
+
+    proc = subprocess.Popen([*tool, str(path)], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            bufsize=settings.UPLOAD_CHUNK_BYTES)
+    at_eof = False
+    try:
+        yield proc.stdout
+        at_eof = proc.stdout.read(1) == b""
+    finally:
+        if not at_eof:
+            proc.kill()  # lector cortado antes del final (error o parseo abandonado)
+        proc.stdout.close()
+        stderr = proc.stderr.read().decode("utf-8", errors="ignore").strip()
+        proc.stderr.close()
+        proc.wait()
+    # solo un stream leído hasta el final puede reportar archivo corrupto/truncado
+    if at_eof and proc.returncode != 0:
+        raise ValueError(f"{path.name}: error al descomprimir ({tool[0]}): {stderr or proc.returncode}")
+
+
+def _gzip_chunks(path: Path) -> Iterator[bytes]:
+    with gzip.open(path, "rb") as f:
+        yield from iter(lambda: f.read(settings.UPLOAD_CHUNK_BYTES), b"")
+
+
+def _zstd_chunks(path: Path) -> Iterator[bytes]:
+    """Bloques descomprimidos de todos los frames; un frame sin terminar es un archivo truncado."""
+    dctx = zstandard.ZstdDecompressor()
+    dobj = None
+    with path.open("rb") as f:
+        for data in iter(lambda: f.read(_ZSTD_READ_BYTES), b""):
+            while data:
+                if dobj is None:
+                    dobj = dctx.decompressobj()
+                out = dobj.decompress(data)
+                if out:
+                    yield out
+                data = b""
+                if dobj.eof:
+                    data, dobj = dobj.unused_data, None
+    if dobj is not None:
+        raise ValueError(f"{path.name}: archivo zstd truncado")
+
+
+class _ThreadedReader(io.RawIOBase):
+    """Descomprime en un hilo y entrega los bloques por una cola acotada."""
+
+    def __init__(self, produce: Callable[[], Iterator[bytes]]):
+        self._queue: "queue.Queue" = queue.Queue(maxsize=_QUEUE_CHUNKS)
+        self._stop = threading.Event()
+        self._buf = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._run, args=(produce,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, produce: Callable[[], Iterator[bytes]]):
+        try:
+            for data in produce():
+                if not self._put(data):
+                    return
+        except BaseException as e:  # se relanza en el hilo lector
+            self._put(e)
+            return
+        self._put(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._buf:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._buf = memoryview(item)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        super().close()
@@ -2,7 +2,7 @@ import React from "react"
 import UploadArea from "./components/UploadArea"
 import PreviewTable from "./components/PreviewTable"
 import ArtifactsIngestPanel from "./components/ArtifactsPanel"
-import { processFiles, processFilesAsync, waitForJobCompletion, ingest } from "./lib/api"
+import { processFiles, processFilesAsync, waitForJobCompletion, ingest, convertRun } from "./lib/api"
 import type { Artifact, ProcessResponse } from "./types"
 import { CLIENTS } from "./data/clients"
 
@@ -34,6 +34,9 @@ export default function App() {
     files_processed: number
     total_files: number
     current_file: string
+    rows_per_sec?: number
+    bytes_read?: number
+    total_bytes?: number
   } | null>(null)
 
   // Notificaciones
@@ -45,6 +48,9 @@ export default function App() {
   const [confirmed, setConfirmed] = React.useState(false)
   const [ingestResult, setIngestResult] = React.useState<any>(null)
 
+  // Conversión de partes (XLSX / Parquet)
+  const [converting, setConverting] = React.useState<string | null>(null)
+
   // Cargar/guardar overrides por cliente en localStorage
   const LS_KEY = (id: string) => `empresas_overrides_${id}`
 
@@ -116,10 +122,13 @@ export default function App() {
       console.log("✅ Job iniciado:", jobResponse)
       
       setJobId(jobResponse.job_id)
-      setNotice(`Procesamiento iniciado (Job: ${jobResponse.job_id})`)
+      const queue = jobResponse.queue
+      setNotice(queue && queue.jobs_ahead > 0
+        ? `En cola (Job: ${jobResponse.job_id}) · ${queue.jobs_ahead} job(s) antes · inicio estimado ${new Date(queue.estimated_start).toLocaleTimeString()}`
+        : `Procesamiento iniciado (Job: ${jobResponse.job_id})`)
       
-      // Esperar completación con polling más frecuente
-      console.log("🔄 Iniciando polling del job...")
+      // Esperar completación (eventos del servidor; polling si no están disponibles)
+      console.log("🔄 Siguiendo el progreso del job...")
       const r = await waitForJobCompletion(
         jobResponse.job_id,
         (status) => {
@@ -129,7 +138,10 @@ export default function App() {
           setProgressDetails({
             files_processed: status.files_processed,
             total_files: status.total_files,
-            current_file: status.current_file
+            current_file: status.current_file,
+            rows_per_sec: status.rows_per_sec,
+            bytes_read: status.bytes_read,
+            total_bytes: status.total_bytes
           })
         },
         1000, // Polling cada 1 segundo (más responsivo)
@@ -152,6 +164,24 @@ export default function App() {
     }
   }
 
+  async function onConvert(format: "xlsx" | "parquet") {
+    if (!resp) return
+    try {
+      setError(null); setNotice(null)
+      setConverting(`Convirtiendo a ${format.toUpperCase()}…`)
+      const { job_id } = await convertRun(resp.run.run_id, format)
+      const r = await waitForJobCompletion(job_id, (s: any) => s.progress && setConverting(s.progress))
+      const nuevos = new Set(r.artifacts.map(a => a.name))
+      setResp({ ...resp, artifacts: [...resp.artifacts.filter(a => !nuevos.has(a.name)), ...r.artifacts] })
+      setNotice(`Conversión completada · ${r.artifacts.length} archivo(s) ${format.toUpperCase()}` +
+        (r.warnings?.length ? ` · ${r.warnings.length} advertencia(s)` : ""))
+    } catch (e: any) {
+      setError(e?.message || String(e))
+    } finally {
+      setConverting(null)
+    }
+  }
+
   async function onIngest() {
     if (!resp) return
     try {
@@ -351,6 +381,14 @@ export default function App() {
                       📄 {progressDetails.current_file}
                     </div>
                   )}
+                  {!!progressDetails.rows_per_sec && (
+                    <div className="text-xs text-slate-500">
+                      ⚡ {Math.round(progressDetails.rows_per_sec).toLocaleString()} filas/s
+                      {!!progressDetails.total_bytes && (
+                        <> · {(progressDetails.bytes_read! / 1048576).toFixed(0)}/{(progressDetails.total_bytes / 1048576).toFixed(0)} MB leídos</>
+                      )}
+                    </div>
+                  )}
                 </div>
               )}
               {jobId && (
@@ -409,6 +447,8 @@ export default function App() {
                   ingesting={ingesting}
                   onIngest={onIngest}
                   ingestResult={ingestResult}
+                  converting={converting}
+                  onConvert={onConvert}
                 />
           </section>
         </>
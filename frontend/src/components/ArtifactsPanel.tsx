@@ -11,6 +11,8 @@ type Props = {
   ingesting: boolean
   onIngest: () => void
   ingestResult?: any
+  converting?: string | null
+  onConvert?: (format: "xlsx" | "parquet") => void
 }
 
 function labelFromName(name: string) {
@@ -20,7 +22,7 @@ function labelFromName(name: string) {
 }
 
 export default function ArtifactsIngestPanel({
-  artifacts, counts, confirmed, setConfirmed, ingesting, onIngest, ingestResult
+  artifacts, counts, confirmed, setConfirmed, ingesting, onIngest, ingestResult, converting, onConvert
 }: Props) {
   const [esStatus, setEsStatus] = useState<{
     loading: boolean
@@ -75,6 +77,27 @@ export default function ArtifactsIngestPanel({
         ))}
       </ul>
 
+      {onConvert && (
+        <div className="flex items-center gap-2 flex-wrap text-sm">
+          <span className="text-slate-600">Convertir partes:</span>
+          {(["xlsx", "parquet"] as const).map(f => (
+            <button
+              key={f}
+              className="px-3 py-1 rounded-lg border border-slate-300 text-slate-700 hover:bg-slate-50 disabled:opacity-50"
+              onClick={() => onConvert(f)}
+              disabled={!!converting || artifacts.length === 0}
+            >
+              {f.toUpperCase()}
+            </button>
+          ))}
+          {converting && (
+            <span className="flex items-center gap-1 text-xs text-slate-500">
+              <Loader2 size={14} className="animate-spin" /> {converting}
+            </span>
+          )}
+        </div>
+      )}
+
       <div className="border-t border-slate-200 pt-3 space-y-3">
         <div className="font-semibold text-slate-700">Validación e Ingesta</div>
         
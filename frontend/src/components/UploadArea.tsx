@@ -12,7 +12,7 @@ export default function UploadArea({ onAddFiles }: Props) {
   function handleDrop(e: React.DragEvent) {
     e.preventDefault()
     setIsOver(false)
-    const files = Array.from(e.dataTransfer.files).filter(f => /\.(csv|zip)$/i.test(f.name))
+    const files = Array.from(e.dataTransfer.files).filter(f => /\.(csv|zip|csv\.gz|csv\.zst)$/i.test(f.name))
     if (files.length) onAddFiles(files)
   }
 
@@ -24,7 +24,7 @@ export default function UploadArea({ onAddFiles }: Props) {
       className={`border-2 border-dashed rounded-2xl p-8 text-center bg-white shadow-sm ${isOver ? "border-blue-400 bg-blue-50" : "border-slate-300"}`}
     >
       <Upload className="mx-auto mb-4" />
-      <p className="text-slate-700 font-medium">Arrastra CSV o ZIP</p>
+      <p className="text-slate-700 font-medium">Arrastra CSV, ZIP o CSV comprimido (.gz / .zst)</p>
       <p className="text-slate-500 text-sm mb-4">Puedes añadir en varias tandas</p>
       <button
         className="px-4 py-2 rounded-xl bg-slate-900 text-white hover:bg-slate-700"
@@ -34,7 +34,7 @@ export default function UploadArea({ onAddFiles }: Props) {
         ref={inputRef}
         type="file"
         multiple
-        accept=".csv,.zip"
+        accept=".csv,.zip,.gz,.zst"
         className="hidden"
         onChange={e => {
           const list = e.target.files ? Array.from(e.target.files) : []
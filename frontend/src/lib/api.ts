@@ -40,30 +40,77 @@ export async function processFilesAsync(
   client: string,
   empresas: string[],
   nombreDefecto?: string
-): Promise<{ job_id: string; status: string; message: string }> {
+): Promise<{
+  job_id: string
+  status: string
+  message: string
+  queue: { jobs_ahead: number; bytes_ahead: number; estimated_start: string }
+}> {
   const form = new FormData()
   files.forEach(f => form.append("files", f))
   form.append("client", client || "DEFAULT")
   form.append("empresas", empresas.join(","))
   form.append("nombre_defecto", nombreDefecto || client || "DEFAULT")
 
-  const res = await fetch("/api/process-async", { 
-    method: "POST", 
+  // el cliente también va en la URL: la cola se revisa antes de subir los archivos
+  const params = new URLSearchParams({ client: client || "DEFAULT" })
+  const res = await fetch(`/api/process-async?${params}`, {
+    method: "POST",
     body: form
   })
-  
+
+  // Cola llena: el backend sugiere cuándo reintentar
+  if (res.status === 429) {
+    const { detail } = await res.json()
+    const retry = Number(res.headers.get("Retry-After") || detail.retry_after || 0)
+    throw new Error(`${detail.message}. Reintenta en ${Math.ceil(retry / 60)} min aprox.`)
+  }
   if (!res.ok) throw new Error(await res.text())
   return res.json()
 }
 
-// Función para consultar estado del job
-export async function getJobStatus(jobId: string): Promise<{
+// Convierte partes de un run terminado a XLSX o Parquet (job en segundo plano; sin `parts`, todas las pendientes)
+export async function convertRun(
+  runId: string,
+  format: "xlsx" | "parquet",
+  parts?: string[]
+): Promise<{
   job_id: string
+  status: string
+  message: string
+  queue: { jobs_ahead: number; bytes_ahead: number; estimated_start: string }
+}> {
+  const params = new URLSearchParams({ format })
+  ;(parts || []).forEach(p => params.append("parts", p))
+  const res = await fetch(`/api/runs/${runId}/convert?${params}`, { method: "POST" })
+
+  if (res.status === 429) {
+    const { detail } = await res.json()
+    const retry = Number(res.headers.get("Retry-After") || detail.retry_after || 0)
+    throw new Error(`${detail.message}. Reintenta en ${Math.ceil(retry / 60)} min aprox.`)
+  }
+  if (!res.ok) throw new Error(await res.text())
+  return res.json()
+}
+
+// Estado compacto de un job (el que envía /api/jobs/{id}/events)
+export type JobProgress = {
   status: string
   progress: string
   files_processed: number
   total_files: number
   current_file: string
+  rows: Record<string, number>   // filas escritas por tabla
+  rows_per_sec: number
+  bytes_read: number
+  total_bytes: number
+  bytes_written: number
+  cache: { hits: number; misses: number }
+}
+
+// Función para consultar estado del job
+export async function getJobStatus(jobId: string): Promise<JobProgress & {
+  job_id: string
   created_at: string
   start_time?: string
   end_time?: string
@@ -82,12 +129,91 @@ export async function getJobStatus(jobId: string): Promise<{
   return res.json()
 }
 
-// Función de polling que espera hasta que el job termine
+// Resultado de un job completado (se pide una sola vez, al terminar)
+export async function getJobResult(jobId: string): Promise<ProcessResponse> {
+  const res = await fetch(`/api/jobs/${jobId}/result`)
+  if (!res.ok) throw new Error(await res.text())
+  return res.json()
+}
+
+// Sigue el job por Server-Sent Events: el servidor empuja solo los campos que cambian.
+// Rechaza con SSE_UNAVAILABLE si el stream no se pudo abrir (para caer a polling)
+const SSE_UNAVAILABLE = "SSE_UNAVAILABLE"
+
+export function watchJob(
+  jobId: string,
+  onProgress?: (status: JobProgress) => void
+): Promise<ProcessResponse> {
+  return new Promise((resolve, reject) => {
+    const state = {} as JobProgress
+    let received = false
+    let consecutiveErrors = 0
+    const source = new EventSource(`/api/jobs/${jobId}/events`)
+
+    source.addEventListener("progress", (e) => {
+      received = true
+      consecutiveErrors = 0
+      Object.assign(state, JSON.parse((e as MessageEvent).data))
+      if (onProgress) onProgress({ ...state })
+    })
+
+    source.addEventListener("done", (e) => {
+      source.close()
+      const done = JSON.parse((e as MessageEvent).data)
+      if (done.status === "completed") {
+        console.log(`[Job ${jobId}] ✅ Completado exitosamente`)
+        getJobResult(jobId).then(resolve, reject)
+      } else if (done.status === "cancelled") {
+        console.log(`[Job ${jobId}] 🛑 Cancelado`)
+        reject(new Error("Job cancelado"))
+      } else {
+        console.log(`[Job ${jobId}] ❌ Falló:`, done.error)
+        reject(new Error(done.error || "Job falló"))
+      }
+    })
+
+    source.onerror = () => {
+      consecutiveErrors++
+      // CLOSED: el servidor respondió con error (p. ej. 404); CONNECTING: el navegador reintenta solo
+      if (source.readyState === EventSource.CLOSED || !received || consecutiveErrors >= 5) {
+        source.close()
+        reject(new Error(SSE_UNAVAILABLE))
+      }
+    }
+  })
+}
+
+// Cancela un job en espera o en curso
+export async function cancelJob(jobId: string): Promise<{ job_id: string; status: string }> {
+  const res = await fetch(`/api/jobs/${jobId}`, { method: "DELETE" })
+  if (!res.ok) throw new Error(await res.text())
+  return res.json()
+}
+
+// Espera hasta que el job termine: por eventos (SSE) y, si no están disponibles, con polling
 export async function waitForJobCompletion(
   jobId: string,
   onProgress?: (status: any) => void,
   pollInterval: number = 1000,  // 1 segundo por defecto (más responsivo)
   maxAttempts: number = 3600     // 1 hora máximo para archivos muy grandes
+): Promise<ProcessResponse> {
+  if (typeof EventSource !== "undefined") {
+    try {
+      return await watchJob(jobId, onProgress)
+    } catch (error) {
+      if (error.message !== SSE_UNAVAILABLE) throw error
+      console.log(`[Job ${jobId}] 🔄 Eventos no disponibles, usando polling`)
+    }
+  }
+  return pollJobCompletion(jobId, onProgress, pollInterval, maxAttempts)
+}
+
+// Función de polling que espera hasta que el job termine
+function pollJobCompletion(
+  jobId: string,
+  onProgress: ((status: any) => void) | undefined,
+  pollInterval: number,
+  maxAttempts: number
 ): Promise<ProcessResponse> {
   return new Promise((resolve, reject) => {
     let attempts = 0
@@ -122,6 +248,9 @@ export async function waitForJobCompletion(
         } else if (status.status === 'failed') {
           console.log(`[Job ${jobId}] ❌ Falló:`, status.error)
           reject(new Error(status.error || 'Job falló'))
+        } else if (status.status === 'cancelled') {
+          console.log(`[Job ${jobId}] 🛑 Cancelado`)
+          reject(new Error('Job cancelado'))
         } else if (attempts >= maxAttempts) {
           console.log(`[Job ${jobId}] ⏰ Timeout después de ${attempts} intentos`)
           reject(new Error(`Timeout: Job no completó en ${Math.round(maxAttempts * pollInterval / 60000)} minutos`))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la compresión por bloques en paralelo:
+la salida gzip / zstd (varios miembros / frames, escritos en orden desde
+el pool de hilos) se descomprime al contenido original completo.
+"""
+
+import gzip
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+from app.block_compress import ZSTD_AVAILABLE, BlockCompressedFile  # noqa: E402
+from app.settings import settings  # noqa: E402
+
+
+def _contenido() -> bytes:
+    filas = [f'"10.0.{i // 256}.{i % 256}","Passed","evidencia {i * 7919 % 100003}"\r\n' for i in range(60000)]
+    return "".join(filas).encode("utf-8")
+
+
+def test_block_compress():
+    previos = (settings.WORKER_PROCESSES, settings.ENABLE_PARALLEL_COMPRESSION, settings.COMPRESS_BLOCK_BYTES)
+    settings.WORKER_PROCESSES = 3
+    settings.ENABLE_PARALLEL_COMPRESSION = True
+    settings.COMPRESS_BLOCK_BYTES = 64 * 1024
+    datos = _contenido()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for codec in ["gzip"] + (["zstd"] if ZSTD_AVAILABLE else []):
+                path = Path(tmp) / f"salida.{codec}"
+                f = BlockCompressedFile(path, codec)
+                mitad = len(datos) // 2
+                for i in range(0, mitad, 10000):  # escrituras chicas, como las de TextIOWrapper
+                    f.write(datos[i:min(i + 10000, mitad)])
+                f.sync()  # checkpoint: el bloque parcial se cierra antes de tiempo
+                f.close()
+                with BlockCompressedFile(path, codec, append=True) as f:  # reanudar agregando bloques
+                    f.write(datos[mitad:])
+
+                if codec == "gzip":
+                    obtenido = gzip.decompress(path.read_bytes())
+                else:
+                    from app.sources import _zstd_chunks
+                    obtenido = b"".join(_zstd_chunks(path))
+                print(f"🗜️ {codec}: {len(datos):,} → {path.stat().st_size:,} bytes")
+                assert obtenido == datos
+    finally:
+        settings.WORKER_PROCESSES, settings.ENABLE_PARALLEL_COMPRESSION, settings.COMPRESS_BLOCK_BYTES = previos
+
+    print("✅ Compresión por bloques correcta")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_block_compress()
+    exit(0 if success else 1)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar que un procesamiento interrumpido y
+reanudado desde su último checkpoint (a mitad de archivo, en el parseo por
+rangos) genera exactamente los mismos archivos que uno sin interrupciones,
+en CSV, en Parquet y con hilos de escritura por tabla.
+"""
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+from app.csv_stream import PARQUET_AVAILABLE  # noqa: E402
+from app.parallel_processor import ParallelCsvProcessor  # noqa: E402
+from app.settings import settings  # noqa: E402
+
+
+def _reporte(filas: int) -> str:
+    lineas = [
+        '"Compliance Report"',
+        '"ACME Corp"',
+        '"CIS Benchmark for Red Hat Enterprise Linux 8 v2.0.0"',
+        '',
+        '"Control Statistics"',
+        '"Control ID","Passed"',
+        '"1","3"',
+        '"RESULTS"',
+        '"Host IP","Status","Evidence"',
+    ]
+    for i in range(filas):
+        evidencia = f'"multi\r\nlínea {i}"' if i % 7 == 0 else f'"ok {i}"'
+        lineas.append(f'"10.0.{i // 256}.{i % 256}","Passed",{evidencia}')
+    return "\r\n".join(lineas) + "\r\n"
+
+
+class _Corte(BaseException):
+    pass
+
+
+def _procesar(csv_path: Path, out_dir: Path, **kwargs):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    proc = ParallelCsvProcessor("ACME", out_dir, num_workers=2)
+    nombres, warnings, counts = proc.process_csvs_parallel([csv_path], ["ACME"], "DEF", **kwargs)
+    return {n: (out_dir / n).read_bytes() for n in nombres}, counts
+
+
+def test_checkpoint_resume():
+    """Interrumpe en el tercer checkpoint y reanuda desde el segundo (descarta lo escrito después)"""
+    previos = (settings.CSV_PART_MAX_ROWS, settings.INTRA_FILE_PARALLEL_MIN_MB,
+               settings.INTRA_FILE_CHUNK_BYTES, settings.PARSE_CACHE_ENABLED,
+               settings.OUTPUT_FORMAT, settings.PARQUET_ROW_GROUP_ROWS, settings.WRITER_THREADS)
+    settings.CSV_PART_MAX_ROWS = 150
+    settings.INTRA_FILE_PARALLEL_MIN_MB = 0
+    settings.INTRA_FILE_CHUNK_BYTES = 2048
+    settings.PARSE_CACHE_ENABLED = False
+    settings.PARQUET_ROW_GROUP_ROWS = 50
+    try:
+        variantes = [("csv", False), ("csv", True)] + ([("parquet", True)] if PARQUET_AVAILABLE else [])
+        for formato, hilos in variantes:
+            settings.OUTPUT_FORMAT, settings.WRITER_THREADS = formato, hilos
+            _interrumpir_y_reanudar()
+    finally:
+        (settings.CSV_PART_MAX_ROWS, settings.INTRA_FILE_PARALLEL_MIN_MB,
+         settings.INTRA_FILE_CHUNK_BYTES, settings.PARSE_CACHE_ENABLED,
+         settings.OUTPUT_FORMAT, settings.PARQUET_ROW_GROUP_ROWS, settings.WRITER_THREADS) = previos
+
+    print("✅ Reanudación desde checkpoint equivalente")
+    return True
+
+
+def _interrumpir_y_reanudar():
+    """Una pasada con el OUTPUT_FORMAT actual"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "reporte.csv"
+        csv_path.write_bytes(_reporte(1000).encode("utf-8"))
+        esperado, counts = _procesar(csv_path, Path(tmp) / "completo")
+
+        estados = []
+
+        def checkpoint(state):
+            estados.append(json.loads(json.dumps(state)))  # debe ser serializable
+            if len(estados) == 3:
+                raise _Corte()
+
+        try:
+            _procesar(csv_path, Path(tmp) / "cortado", checkpoint_callback=checkpoint)
+        except _Corte:
+            pass
+        estado = estados[1]
+        assert estado["file_pos"] is not None, "se esperaba un checkpoint a mitad de archivo"
+        print(f"📍 Checkpoint en byte {estado['file_pos']['offset']:,}")
+
+        obtenido, counts2 = _procesar(csv_path, Path(tmp) / "cortado", resume=estado)
+        print(f"📄 Partes: {len(obtenido)}, filas: {counts2}")
+        assert counts2 == counts
+        assert obtenido == esperado
+
+
+if __name__ == "__main__":
+    success = test_checkpoint_resume()
+    exit(0 if success else 1)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la conversión posterior de partes: las
+partes CSV (también .csv.gz) de un run se convierten a Parquet y XLSX en un
+pool de procesos con los mismos valores, y las salidas se registran en el
+manifest.json del run.
+"""
+
+import csv
+import gzip
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+import pyarrow.parquet as pq  # noqa: E402
+from openpyxl import load_workbook  # noqa: E402
+
+from app.convert import convert_parts, register_artifacts  # noqa: E402
+
+
+def test_convert_parts():
+    header = ["Host IP", "Status", "Evidence", "Cliente", "scan_name", "periodo", "os"]
+    filas = [[f"10.0.0.{i}", "Passed" if i % 2 else "Failed", f"línea {i}\r\n<x> & \"y\"" if i % 3 == 0 else "",
+              "ACME", "ACME-hardening", "10/31/2026", "Linux"] for i in range(300)]
+    with tempfile.TemporaryDirectory() as tmp:
+        run_dir = Path(tmp) / "run1"
+        out = run_dir / "output"
+        out.mkdir(parents=True)
+        partes = {"base.csv": filas[:200], "base-part-02.csv.gz": filas[200:]}
+        for nombre, contenido in partes.items():
+            with (gzip.open if nombre.endswith(".gz") else open)(out / nombre, "wt", encoding="utf-8", newline="") as f:
+                csv.writer(f).writerows([header] + contenido)
+        (run_dir / "manifest.json").write_text(json.dumps({
+            "run": {"run_id": "run1", "client": "ACME"},
+            "artifacts": [{"name": n, "size": 0, "download_url": ""} for n in partes],
+            "warnings": []}), encoding="utf-8")
+
+        for fmt in ("parquet", "xlsx"):
+            resultados = []
+            convert_parts(out, list(partes), fmt, resultados.append)
+            print(f"🔁 {fmt}: {resultados}")
+            for parte, salida, n, error in resultados:
+                assert error is None and n == len(partes[parte])
+                if fmt == "parquet":
+                    tabla = pq.read_table(out / salida)
+                    leidas = [list(r.values()) for r in tabla.to_pylist()]
+                    assert tabla.column_names == header
+                else:
+                    wb = load_workbook(out / salida, read_only=True)
+                    leidas = [["" if v is None else v for v in r] for r in wb.active.iter_rows(values_only=True)]
+                    wb.close()
+                    assert leidas.pop(0) == header
+                assert leidas == partes[parte]
+            register_artifacts(run_dir, [salida for _, salida, _, _ in resultados])
+
+        manifest = json.loads((run_dir / "manifest.json").read_text(encoding="utf-8"))
+        nombres = sorted(a["name"] for a in manifest["artifacts"])
+        assert nombres == sorted(["base.csv", "base.parquet", "base.xlsx", "base-part-02.csv.gz",
+                                  "base-part-02.parquet", "base-part-02.xlsx"])
+        assert not [p for p in out.iterdir() if p.name.endswith(".tmp")]
+
+    print("✅ Conversión de partes correcta")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_convert_parts()
+    exit(0 if success else 1)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la cola compartida de jobs (JobStore):
+dos instancias no toman el mismo job, un lease vencido lo retoma otra
+instancia, el dueño anterior ya no puede escribir, la cancelación y el
+límite de intentos funcionan, y el reparto entre clientes es justo.
+"""
+
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+from app.job_store import JobStore  # noqa: E402
+from app.models import JobStatus, ProcessJob  # noqa: E402
+
+
+def _encolar(store: JobStore, job_id: str, tmp: Path, client: str = "ACME"):
+    job = ProcessJob(job_id=job_id, status=JobStatus.PENDING, client=client, created_at=datetime.now())
+    store.add_job(job, tmp / job_id, [("a.csv", tmp / job_id / "uploads" / "a.csv", "0" * 64)], ["ACME"], None)
+
+
+def test_job_queue():
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        a = JobStore(tmp / "jobs.sqlite3")
+        b = JobStore(tmp / "jobs.sqlite3")  # otra instancia, otra conexión
+        _encolar(a, "j1", tmp)
+        _encolar(b, "j2", tmp)
+        assert a.queue_stats().waiting == 2
+
+        # Cada instancia toma un job distinto, en orden de llegada
+        job1, _, req = a.claim("A", 60, 3)
+        job2, _, _ = b.claim("B", 60, 3)
+        assert (job1.job_id, job2.job_id) == ("j1", "j2")
+        assert req["uploads"][0][0] == "a.csv"
+        assert b.claim("B", 60, 3) is None and a.queue_stats().waiting == 0
+
+        # El estado es visible desde cualquier instancia
+        assert a.update_job("j1", {"status": JobStatus.PROCESSING, "progress": "x"}, "A")
+        assert b.get_job("j1").progress == "x"
+
+        # Lease vencido: B retoma j1 y A ya no puede escribir estado ni checkpoints
+        assert a.renew("A", ["j1"], -1) == []
+        job, _, _ = b.claim("B", 60, 3)
+        assert job.job_id == "j1" and job.status == JobStatus.PROCESSING
+        assert not a.update_job("j1", {"progress": "viejo"}, "A")
+        assert not a.save_checkpoint("j1", {"v": 1}, "A")
+        assert b.save_checkpoint("j1", {"v": 2}, "B")
+        assert a.renew("A", ["j1"], 60) == ["j1"]
+
+        # Cancelación: en curso se marca; sin dueño se cancela en el acto
+        status, _ = a.request_cancel("j1")
+        assert status == JobStatus.PROCESSING and b.lease("j1") == ("B", True)
+        b.release("B", ["j2"])
+        status, _ = a.request_cancel("j2")
+        assert status == JobStatus.CANCELLED and b.get_job("j2").status == JobStatus.CANCELLED
+
+        # Terminar libera el lease y borra el checkpoint
+        assert b.update_job("j1", {"status": JobStatus.CANCELLED}, "B")
+        assert b.lease("j1") == (None, True) and b.load_checkpoint("j1") is None
+
+        # Un job que se interrumpe una y otra vez termina FAILED
+        _encolar(a, "j3", tmp)
+        for _ in range(2):
+            assert a.claim("A", 60, 2) is not None
+            a.expire_leases("A")
+        assert a.claim("A", 60, 2) is None
+        assert b.get_job("j3").status == JobStatus.FAILED
+        print(f"💀 {b.get_job('j3').error}")
+
+        # Reparto justo: con un job de GRANDE corriendo, el de CHICO pasa antes que el resto de GRANDE
+        for i in range(3):
+            _encolar(a, f"g{i}", tmp, "GRANDE")
+        _encolar(a, "c0", tmp, "CHICO")
+        assert a.queue_stats("GRANDE").waiting_client == 3
+        assert a.claim("A", 60, 3)[0].job_id == "g0"
+        assert a.claim("A", 60, 3, max_running=1) is None  # presupuesto global: ya corre uno
+        orden = [b.claim("B", 60, 3)[0].job_id for _ in range(2)]
+        assert orden == ["c0", "g1"], orden
+
+        # Sin nada corriendo, el turno es del cliente que hace más que no recibe uno
+        for job_id in ("g0", "c0", "g1"):
+            b.update_job(job_id, {"status": JobStatus.COMPLETED})
+        _encolar(a, "c1", tmp, "CHICO")
+        assert a.claim("A", 60, 3)[0].job_id == "c1"  # g2 es más antiguo, pero GRANDE tuvo el último turno
+
+        a.close()
+        b.close()
+
+    print("✅ Cola compartida de jobs correcta")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_job_queue()
+    exit(0 if success else 1)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar que el parser por bytes produce exactamente
+las mismas filas que parser_stream.stream_tables, y que la proyección de
+columnas conserva 'Cliente'.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+from app.parser_bytes import stream_batches_bytes, stream_tables_bytes  # noqa: E402
+from app.parser_stream import stream_tables  # noqa: E402
+
+REPORTE = (
+    '"Compliance Report"\r\n'
+    '"ACME Corp"\r\n'
+    '"CIS Benchmark for Red Hat Enterprise Linux 8 v2.0.0"\r\n'
+    '\r\n'
+    '"Control Statistics"\r\n'
+    '"Control ID","Passed"\r\n'
+    '"1","3"\r\n'
+    '"Host Statistics"\r\n'
+    '"IP","DNS"\r\n'
+    '"10.0.0.1","host"\r\n'
+    '"RESULTS"\r\n'
+    '"Host IP","Status","Evidence"\r\n'
+    '"10.0.0.1","Passed","simple"\r\n'
+    '"10.0.0.2","Failed","multi\r\nlínea ""citada"""\r\n'
+    '10.0.0.3,Passed,sin comillas\r\n'
+    '"10.0.0.4","Passed"\r\n'
+    '"10.0.0.5","Passed","x","extra"\r\n'
+    '"10.0.0.6"," \'espacios\' ","ok"\r\n'
+    '\r\n'
+    '"SUMMARY"\r\n'
+    '"k","v"\r\n'
+)
+
+
+def test_parser_bytes():
+    """Compara el parser por bytes con el parser por líneas"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "reporte.csv"
+        path.write_bytes(REPORTE.encode("utf-8"))
+
+        esperado = list(stream_tables(path, ["ACME"], "DEF"))
+        obtenido = list(stream_tables_bytes(path, ["ACME"], "DEF", projection=[]))
+        print(f"📄 Filas: {len(obtenido)}")
+        assert obtenido == esperado
+
+        lotes = list(stream_batches_bytes(path, ["ACME"], "DEF", projection=["Host IP", "Status"]))
+        t2 = [lote for lote in lotes if lote[0] == "t2"]
+        assert tuple(t2[0][2]) == ("Host IP", "Status", "Cliente")
+        assert t2[0][4][1] == ("10.0.0.2", "Failed", "ACME")
+
+    print("✅ Parser por bytes equivalente")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_parser_bytes()
+    exit(0 if success else 1)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el índice de secciones por offsets de bytes:
+marcadores dentro de campos multilínea entre comillas NO deben abrir sección.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+from app.section_index import build_section_index  # noqa: E402
+
+REPORTE = (
+    '"Compliance Report AJUSTADA"\r\n'
+    '"CIS Benchmark for Microsoft Windows server 2019 v1.2.0"\r\n'
+    '\r\n'
+    '"Control Statistics"\r\n'
+    '"Control ID","Passed"\r\n'
+    '"1","3"\r\n'
+    '"Host Statistics"\r\n'
+    '"IP","DNS"\r\n'
+    '"10.0.0.1","multi\r\nRESULTS\r\nline"\r\n'
+    '"RESULTS"\r\n'
+    '"Host IP","Evidence"\r\n'
+    '"10.0.0.1","uno\r\nSUMMARY\r\ndos ""x"""\r\n'
+    '"10.0.0.2","ok"\r\n'
+    '\r\n'
+    '"ASSET TAGS"\r\n'
+    '"Tag"\r\n'
+    'SUMMARY\r\n'
+    '"k","v"\r\n'
+)
+
+
+def test_section_index():
+    """Prueba límites de sección, encabezados y campos multilínea"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "reporte.csv"
+        path.write_bytes(REPORTE.encode("utf-8"))
+        data = path.read_bytes()
+
+        index = build_section_index(path)
+        kinds = [s.kind for s in index.sections]
+        print(f"📑 Secciones: {kinds}")
+        assert kinds == ["t1", "host", "t2", "asset_tags", "summary"]
+        assert "AJUSTADA" in index.head_lines[0]
+
+        t2 = index.of_kind("t2")[0]
+        assert t2.header.strip() == '"Host IP","Evidence"'
+        body = data[t2.body_start:t2.body_end].decode("utf-8")
+        assert body.startswith('"10.0.0.1","uno')
+        assert body.endswith('"10.0.0.2","ok"\r\n\r\n')
+
+        host = index.of_kind("host")[0]
+        assert data[host.body_end:].startswith(b'"RESULTS"')
+
+    print("✅ Índice de secciones correcto")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_section_index()
+    exit(0 if success else 1)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el writer XLSX en streaming: el libro se
+lee con openpyxl con los mismos valores (escapes, saltos de línea, shared
+strings) en el mismo orden, escrito en varios lotes.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+from openpyxl import load_workbook  # noqa: E402
+
+from app import excel_stream  # noqa: E402
+
+
+def test_xlsx_writer():
+    cols = ["Host IP", "Status", "Evidence", "Cliente", "scan_name"]
+    filas = [(f"10.0.{i // 256}.{i % 256}", "Passed" if i % 2 else "Failed",
+              f"  <línea {i}> & \"x\"\r\notra " if i % 3 == 0 else f"ok {i}", "ACME", "scan") for i in range(250)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "parte.xlsx"
+        w = excel_stream._XlsxSheetWriter(path, cols)
+        w.write_rows(filas[:150])
+        w.write_rows(filas[150:])
+        w.close()
+        assert w.count == len(filas)
+
+        wb = load_workbook(path, read_only=True)
+        filas_hoja = wb.active.iter_rows(values_only=True)
+        assert list(next(filas_hoja)) == cols
+        leidas = [tuple(f) for f in filas_hoja]
+        wb.close()
+        print(f"📄 {len(leidas)} filas leídas de {path.name}")
+        assert leidas == filas
+
+    print("✅ XLSX en streaming correcto")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_xlsx_writer()
+    exit(0 if success else 1)